@@ -1,188 +1,200 @@
-from flask import Flask, render_template, request, redirect, url_for
-import sqlite3
+from flask import Flask, Response, render_template, request, redirect, url_for, jsonify, stream_with_context
 from datetime import datetime
+import sqlite3
+
+import billing
+import cache
+import db
+import export
+import groups
+import jobs
+import metrics
+import migrations
+import readings
+import reports
+from billing import calculate
+from db import get_db
+from records import CONTRACT_COLUMNS, CUSTOMER_COLUMNS, Contract, Customer, select_list
 
 app = Flask(__name__)
-DB_FILE = "billing.db"
+db.init_app(app)
+metrics.init_app(app)  # BILLING_METRICS=1 時才有作用
+
+if metrics.ENABLED:
+    calculate = metrics.timed_calculate(calculate)
 
 
 # --- 初始化資料庫 ---
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-
-    # 契約資料表（含稅別欄位與 contra）
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS contracts (
-            device_id TEXT PRIMARY KEY,
-            monthly_rent REAL,
-            color_unit_price REAL,
-            bw_unit_price REAL,
-            color_giveaway INTEGER,
-            bw_giveaway INTEGER,
-            color_error_rate REAL,
-            bw_error_rate REAL,
-            color_basic INTEGER,
-            bw_basic INTEGER,
-            tax_type TEXT DEFAULT '含稅',
-            contra TEXT DEFAULT ''
-        )
-    """)
-
-    # 抄表記錄表
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS usage (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            device_id TEXT,
-            month TEXT,
-            color_count INTEGER,
-            bw_count INTEGER,
-            timestamp TEXT
-        )
-    """)
-
-    # 客戶資料表
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS customers (
-            device_id TEXT PRIMARY KEY,
-            customer_name TEXT,
-            device_number TEXT,
-            machine_model TEXT,
-            tax_id TEXT,
-            install_address TEXT,
-            service_person TEXT,
-            contract_number TEXT,
-            contract_start TEXT,
-            contract_end TEXT
-        )
-    """)
-
-    conn.commit()
-    conn.close()
+    """結構由 migrations 依 user_version 升級；已是最新版本時只讀一次 user_version"""
+    migrations.migrate(get_db())
+
+
+_schema_file = None  # 已確認結構是最新的資料庫檔案
+
+
+@app.before_request
+def _ensure_schema():
+    """gunicorn（app:app）等不經 __main__ 的入口：每個資料庫檔案第一個 request 前先升級一次"""
+    global _schema_file
+    if _schema_file != db.DB_FILE:
+        init_db()
+        _schema_file = db.DB_FILE
+
+
+CONTRACT_SQL = f"SELECT {select_list(Contract)} FROM contracts WHERE device_id=?"
+CUSTOMER_SQL = f"SELECT {select_list(Customer)} FROM customers WHERE device_id=?"
 
 
 # --- 查詢契約 ---
 def get_contract(device_id):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT * FROM contracts WHERE device_id=?", (device_id,))
-    contract_row = c.fetchone()
-    contra_text = ""
+    """回傳 (Contract, contra 文字)；與快取共用同一份 record，呼叫端不可修改"""
+    conn = get_db()
+    cache.sync(conn)
+    contract = cache.contracts.get(device_id)
+    if contract is cache.MISSING:
+        row = conn.execute(CONTRACT_SQL, (device_id,)).fetchone()
+        contract = Contract(*row) if row else None
+        if row:
+            cache.contracts.put(device_id, contract)
 
-    if contract_row:
-        col_names = [desc[0] for desc in c.description]
-        contract_dict = dict(zip(col_names, contract_row))
-        contra_text = contract_dict.get("contra", "")
-    else:
-        contract_dict = None
-
-    conn.close()
-    return contract_dict, contra_text
+    if contract:
+        return contract, contract.contra or ""
+    return None, ""
 
 
 # --- 查詢客戶資料 ---
 def get_customer(device_id):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT * FROM customers WHERE device_id=?", (device_id,))
-    row = c.fetchone()
-    conn.close()
-    if row:
-        return {
-            "device_id": row[0],
-            "customer_name": row[1],
-            "device_number": row[2],
-            "machine_model": row[3],
-            "tax_id": row[4],
-            "install_address": row[5],
-            "service_person": row[6],
-            "contract_number": row[7],
-            "contract_start": row[8],
-            "contract_end": row[9]
-        }
-    return None
-
-
-# --- 模糊搜尋客戶名稱 ---
-def search_customers_by_name(keyword):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("""
-        SELECT device_id, customer_name
-        FROM customers
-        WHERE customer_name LIKE ?
-    """, (f"%{keyword}%",))
+    conn = get_db()
+    cache.sync(conn)
+    customer = cache.customers.get(device_id)
+    if customer is cache.MISSING:
+        row = conn.execute(CUSTOMER_SQL, (device_id,)).fetchone()
+        if not row:
+            return None
+        customer = Customer(*row)
+        cache.customers.put(device_id, customer)
+    return customer
+
+
+# --- 模糊搜尋客戶（名稱 / 統編 / 地址 / 機號）---
+SEARCH_LIMIT = 50
+
+
+def search_customers_by_name(keyword, limit=SEARCH_LIMIT):
+    c = get_db().cursor()
+    if len(keyword) >= 3:
+        # trigram 索引查詢：先依相關度（FTS5 的 rank 即 bm25）取前 limit 筆，再接回 customers
+        c.execute("""
+            SELECT cu.device_id, cu.customer_name
+            FROM (
+                SELECT rowid, rank
+                FROM customers_fts
+                WHERE customers_fts MATCH ?
+                ORDER BY rank
+                LIMIT ?
+            ) f
+            JOIN customers cu ON cu.rowid = f.rowid
+            ORDER BY f.rank
+        """, ('"' + keyword.replace('"', '""') + '"', limit))
+    else:
+        # trigram 至少要 3 個字，1~2 字的關鍵字仍以 LIKE 比對客戶名稱
+        c.execute("""
+            SELECT device_id, customer_name
+            FROM customers
+            WHERE customer_name LIKE ?
+            LIMIT ?
+        """, (f"%{keyword}%", limit))
     rows = c.fetchall()
-    conn.close()
     return [{"device_id": r[0], "customer_name": r[1]} for r in rows]
 
 
 # --- 查詢最後抄表 ---
 def get_last_counts(device_id):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
+    c = get_db().cursor()
     c.execute("SELECT color_count, bw_count, timestamp FROM usage WHERE device_id=? ORDER BY id DESC LIMIT 1", (device_id,))
     row = c.fetchone()
-    conn.close()
     if row:
         return row[0] or 0, row[1] or 0, row[2] or ""
     return 0, 0, ""
 
 
+# --- 一次查出契約 + 客戶 + 最後抄表（單一 JOIN 查詢） ---
+SNAPSHOT_SQL = f"""
+    SELECT {select_list(Contract, "ct")},
+           {select_list(Customer, "cu")},
+           u.color_count, u.bw_count, u.timestamp
+    FROM contracts ct
+    LEFT JOIN customers cu ON cu.device_id = ct.device_id
+    LEFT JOIN usage u ON u.id = (
+        SELECT id FROM usage WHERE device_id = ct.device_id ORDER BY id DESC LIMIT 1
+    )
+    WHERE ct.device_id = ?
+"""
+N_CONTRACT = len(CONTRACT_COLUMNS)
+N_CUSTOMER = len(CUSTOMER_COLUMNS)
+
+
+def get_device_snapshot(device_id):
+    """回傳 (Contract, Customer, contra_text, (last_color, last_bw, last_time))
+
+    契約與客戶都在快取裡時只查最後抄表；否則走單一 JOIN 並順便回填快取。
+    """
+    conn = get_db()
+    cache.sync(conn)
+    contract = cache.contracts.get(device_id)
+    customer = cache.customers.get(device_id) if contract is not cache.MISSING else cache.MISSING
+    if customer is not cache.MISSING:
+        return contract, customer, contract.contra or "", get_last_counts(device_id)
+
+    row = conn.execute(SNAPSHOT_SQL, (device_id,)).fetchone()
+    if not row:
+        return None, None, "", (0, 0, "")
+
+    contract = Contract(*row[:N_CONTRACT])
+    customer = Customer(*row[N_CONTRACT:N_CONTRACT + N_CUSTOMER]) if row[N_CONTRACT] is not None else None
+    cache.contracts.put(device_id, contract)
+    cache.customers.put(device_id, customer)
+    color, bw, timestamp = row[N_CONTRACT + N_CUSTOMER:]
+    return contract, customer, contract.contra or "", (color or 0, bw or 0, timestamp or "")
+
+
 # --- 紀錄使用量 ---
-def insert_usage(device_id, color_count, bw_count):
+def insert_usage(device_id, color_count, bw_count, commit=True):
+    """寫入一筆抄表，回傳月份（YYYYMM）"""
     month = datetime.now().strftime("%Y%m")
     timestamp = datetime.now().strftime("%Y/%m/%d-%H:%M")
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("INSERT INTO usage (device_id, month, color_count, bw_count, timestamp) VALUES (?, ?, ?, ?, ?)",
-              (device_id, month, color_count, bw_count, timestamp))
-    conn.commit()
-    conn.close()
-
-
-# --- 計算邏輯 ---
-def calculate(contract, curr_color, curr_bw, last_color, last_bw):
-    used_color = max(0, curr_color - last_color)
-    used_bw = max(0, curr_bw - last_bw)
-
-    bill_color = max(0, used_color - contract["color_giveaway"])
-    bill_bw = max(0, used_bw - contract["bw_giveaway"])
-
-    bill_color = int(round(bill_color * (1 - contract["color_error_rate"])))
-    bill_bw = int(round(bill_bw * (1 - contract["bw_error_rate"])))
-
-    if contract["color_basic"] > 0:
-        bill_color = max(contract["color_basic"], bill_color)
-    if contract["bw_basic"] > 0:
-        bill_bw = max(contract["bw_basic"], bill_bw)
-
-    color_amount = bill_color * contract["color_unit_price"]
-    bw_amount = bill_bw * contract["bw_unit_price"]
-    subtotal = contract["monthly_rent"] + color_amount + bw_amount
-
-    tax_rate = 0.05
-    if contract.get("tax_type") == "未稅":
-        tax = subtotal * tax_rate
-        total = subtotal + tax
-        untaxed = subtotal
-    else:
-        total = subtotal
-        untaxed = subtotal / (1 + tax_rate)
-        tax = total - untaxed
-
-    return {
-        "彩色使用張數": used_color,
-        "黑白使用張數": used_bw,
-        "彩色計費張數": bill_color,
-        "黑白計費張數": bill_bw,
-        "彩色金額": round(color_amount, 2),
-        "黑白金額": round(bw_amount, 2),
-        "月租金": round(contract["monthly_rent"], 2),
-        "未稅小計": int(round(untaxed)),
-        "稅額": int(round(tax)),
-        "含稅總額": int(round(total))
-    }
+    conn = get_db()
+    conn.execute("INSERT INTO usage (device_id, month, color_count, bw_count, timestamp) VALUES (?, ?, ?, ?, ?)",
+                 (device_id, month, color_count, bw_count, timestamp))
+    if commit:
+        conn.commit()
+    return month
+
+
+# --- 更新契約條件 ---
+# 可更新的欄位與型別
+CONTRACT_FIELDS = {
+    "monthly_rent": float, "color_unit_price": float, "bw_unit_price": float,
+    "color_giveaway": int, "bw_giveaway": int,
+    "color_error_rate": float, "bw_error_rate": float,
+    "color_basic": int, "bw_basic": int,
+    "tax_type": str, "contra": str,
+}
+
+
+def update_contract(device_id, fields, commit=True):
+    """只更新 fields 裡有的欄位，回傳是否有這台設備"""
+    unknown = set(fields) - CONTRACT_FIELDS.keys()
+    if unknown or not fields:
+        raise ValueError(f"無法更新的欄位：{', '.join(sorted(unknown)) or '（未提供）'}")
+    conn = get_db()
+    cur = conn.execute(f"UPDATE contracts SET {', '.join(f'{k}=?' for k in fields)} WHERE device_id=?",
+                       (*fields.values(), device_id))
+    if commit:
+        conn.commit()
+    cache.invalidate(device_id)
+    return cur.rowcount > 0
 
 
 @app.route("/", methods=["GET", "POST"])
@@ -199,27 +211,28 @@ def index():
 
         # 模糊查詢客戶名稱
         if mode == "query":
-            contract, contra_text = get_contract(keyword)
-            customer = get_customer(keyword)
+            contract, customer, contra_text, (last_color, last_bw, last_time) = get_device_snapshot(keyword)
             if not contract:
                 matches = search_customers_by_name(keyword)
                 if matches:
                     message = f"🔍 找到 {len(matches)} 筆相符客戶"
                 else:
                     message = f"❌ 找不到設備或客戶：{keyword}"
-            else:
-                last_color, last_bw, last_time = get_last_counts(keyword)
 
         elif mode == "calculate":
             device_id = keyword
-            contract, contra_text = get_contract(device_id)
-            customer = get_customer(device_id)
+            contract, customer, contra_text, (last_color, last_bw, last_time) = get_device_snapshot(device_id)
             if contract:
-                last_color, last_bw, last_time = get_last_counts(device_id)
                 curr_color = int(request.form.get("curr_color", "0"))
                 curr_bw = int(request.form.get("curr_bw", "0"))
                 result = calculate(contract, curr_color, curr_bw, last_color, last_bw)
-                insert_usage(device_id, curr_color, curr_bw)
+                # 抄表與帳單同一個交易寫入
+                month = insert_usage(device_id, curr_color, curr_bw, commit=False)
+                billing.record_bill(get_db(), device_id, month, result)
+                get_db().commit()
+                group_id = groups.group_of(get_db(), device_id)
+                if group_id:
+                    message = f"ℹ️ 此設備屬於群組 {group_id}，帳單併入群組月結，不另開個別帳單"
             else:
                 message = f"❌ 找不到設備 {device_id}"
 
@@ -237,26 +250,13 @@ def index():
                 "bw_basic": int(request.form.get("bw_basic", "0") or 0),
                 "tax_type": request.form.get("tax_type", "含稅"),
             }
-            conn = sqlite3.connect(DB_FILE)
-            c = conn.cursor()
-            c.execute("""
-                UPDATE contracts SET
-                    monthly_rent=?, color_unit_price=?, bw_unit_price=?,
-                    color_giveaway=?, bw_giveaway=?, color_error_rate=?, bw_error_rate=?,
-                    color_basic=?, bw_basic=?, tax_type=?
-                WHERE device_id=?""",
-                (*fields.values(), device_id))
-            conn.commit()
-            conn.close()
+            update_contract(device_id, fields)
             return redirect(url_for("index", device_id=device_id, message="✅ 契約條件已更新"))
 
     elif request.args.get("device_id"):
         q_device = request.args.get("device_id")
-        contract, contra_text = get_contract(q_device)
-        customer = get_customer(q_device)
-        if contract:
-            last_color, last_bw, last_time = get_last_counts(q_device)
-        else:
+        contract, customer, contra_text, (last_color, last_bw, last_time) = get_device_snapshot(q_device)
+        if not contract:
             message = f"❌ 找不到設備 {q_device}"
 
     return render_template("index.html",
@@ -268,9 +268,294 @@ def index():
                            last_time=last_time,
                            result=result,
                            matches=matches,
+                           jobs=jobs.recent(5),
                            message=message)
 
 
+# --- 快取命中統計 ---
+@app.route("/cache/stats")
+def cache_stats():
+    return jsonify(cache.stats())
+
+
+# --- SQLite 寫入鎖逾時（busy_timeout 用完）：回 503 讓前端 / 負載測試分得出來 ---
+@app.errorhandler(sqlite3.OperationalError)
+def database_busy(e):
+    message = str(e)
+    if "locked" not in message and "busy" not in message:
+        raise e
+    return Response(f"資料庫忙碌中，請稍後再試（{message}）", status=503,
+                    headers={"Retry-After": "1", "X-DB-Error": "locked"}, mimetype="text/plain")
+
+
+# --- 月底批次計費（交給背景工作佇列）---
+@app.route("/billing/run", methods=["POST"])
+def billing_run():
+    month = request.form.get("month", "").strip() or None
+    job_id = jobs.submit("billing_run", {"month": month})
+    return redirect(url_for("index", message=f"✅ 批次計費已排入背景工作 #{job_id}"))
+
+
+# --- JSON API（v1）---
+API_BATCH_LIMIT = 500
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@app.errorhandler(ApiError)
+def api_error(e):
+    return jsonify({"error": e.message}), e.status
+
+
+def _json_body():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ApiError("請以 JSON 物件傳送資料")
+    return data
+
+
+def _batch_items(data, key, limit=API_BATCH_LIMIT):
+    items = data.get(key)
+    if not isinstance(items, list) or not items:
+        raise ApiError(f"{key} 必須是非空陣列")
+    if len(items) > limit:
+        raise ApiError(f"{key} 一次最多 {limit} 筆", 413)
+    return items
+
+
+# 數值欄位的合理範圍：超出範圍的值會讓 Decimal 運算失敗（InvalidOperation），一律先以 400 擋下
+MAX_COUNT = 10 ** 12   # 張數、讀數
+MAX_AMOUNT = 10 ** 9   # 月租、單價
+RATE_FIELDS = ("color_error_rate", "bw_error_rate")  # 0 ~ 1
+TAX_TYPES = ("含稅", "未稅")
+
+
+def _as_number(data, name, kind):
+    """int 欄位只收整數值（1.7 不會被截成 1），float 欄位只收有限數值；皆不可為負數或超出上限"""
+    value = data.get(name)
+    try:
+        if isinstance(value, bool) or value is None:
+            raise ValueError
+        number = float(value) if kind is float else int(value)
+        if kind is int and not isinstance(value, (int, str)) and number != value:
+            raise ValueError
+    except (TypeError, ValueError, OverflowError):
+        raise ApiError(f"{name} 必須是{'整數' if kind is int else '數字'}") from None
+    high = 1 if name in RATE_FIELDS else MAX_COUNT if kind is int else MAX_AMOUNT
+    if not 0 <= number <= high:  # NaN 也不會通過
+        raise ApiError(f"{name} 必須介於 0 到 {high:,}")
+    return number
+
+
+def _device_json(device_id):
+    contract, customer, _, (last_color, last_bw, last_time) = get_device_snapshot(device_id)
+    if not contract:
+        return None
+    return {
+        "device_id": device_id,
+        "contract": contract,
+        "customer": customer,
+        "last_reading": {"color_count": last_color, "bw_count": last_bw, "timestamp": last_time},
+    }
+
+
+def _record_reading(device_id, data):
+    """計算並記錄一筆抄表與帳單（不 commit），回傳 calculate() 結果"""
+    curr_color = _as_number(data, "curr_color", int)
+    curr_bw = _as_number(data, "curr_bw", int)
+    contract, _, _, (last_color, last_bw, _) = get_device_snapshot(device_id)
+    if not contract:
+        raise ApiError(f"找不到設備 {device_id}", 404)
+    result = calculate(contract, curr_color, curr_bw, last_color, last_bw)
+    month = insert_usage(device_id, curr_color, curr_bw, commit=False)
+    billing.record_bill(get_db(), device_id, month, result)
+    return result
+
+
+def _contract_fields(data):
+    fields = {}
+    for name, value in data.items():
+        if name == "device_id":
+            continue
+        kind = CONTRACT_FIELDS.get(name)
+        if kind is None:
+            raise ApiError(f"無法更新的欄位：{name}")
+        if kind is not str:
+            fields[name] = _as_number(data, name, kind)
+        elif not isinstance(value, str):
+            raise ApiError(f"{name} 必須是字串")
+        elif name == "tax_type" and value not in TAX_TYPES:
+            raise ApiError(f"tax_type 只能是 {' / '.join(TAX_TYPES)}")
+        else:
+            fields[name] = value
+    if not fields:
+        raise ApiError("沒有要更新的欄位")
+    return fields
+
+
+@app.route("/api/v1/devices/<device_id>")
+def api_device(device_id):
+    device = _device_json(device_id)
+    if device is None:
+        raise ApiError(f"找不到設備 {device_id}", 404)
+    return jsonify(device)
+
+
+@app.route("/api/v1/devices/batch", methods=["POST"])
+def api_devices_batch():
+    device_ids = _batch_items(_json_body(), "device_ids")
+    if not all(isinstance(d, str) and d for d in device_ids):
+        raise ApiError("device_ids 必須是設備編號字串的陣列")
+    return jsonify({"devices": {d: _device_json(d) for d in device_ids}})
+
+
+@app.route("/api/v1/customers")
+def api_customers():
+    keyword = request.args.get("q", "").strip()
+    if not keyword:
+        raise ApiError("請提供查詢字串 q")
+    # 下限 1：負數傳到 SQLite 會變成 LIMIT -1（不限筆數）
+    limit = max(1, min(request.args.get("limit", SEARCH_LIMIT, type=int), SEARCH_LIMIT))
+    return jsonify({"customers": search_customers_by_name(keyword, limit)})
+
+
+@app.route("/api/v1/devices/<device_id>/readings", methods=["POST"])
+def api_record_reading(device_id):
+    result = _record_reading(device_id, _json_body())
+    get_db().commit()
+    return jsonify({"device_id": device_id, "result": result}), 201
+
+
+@app.route("/api/v1/readings/batch", methods=["POST"])
+def api_record_readings_batch():
+    """整條路線的抄表一次送出（JSON 或 text/csv）；合格的筆數在同一個交易內寫入，失敗的逐筆回報"""
+    if request.mimetype == "text/csv":
+        rows = readings.parse_csv(request.get_data(as_text=True))
+        if not rows:
+            raise ApiError("CSV 沒有資料")
+        if len(rows) > readings.BATCH_LIMIT:
+            raise ApiError(f"readings 一次最多 {readings.BATCH_LIMIT} 筆", 413)
+    else:
+        rows = _batch_items(_json_body(), "readings", readings.BATCH_LIMIT)
+    return jsonify(readings.submit_readings(get_db(), rows, dry_run=request.args.get("dry_run") == "1"))
+
+
+@app.route("/api/v1/contracts/<device_id>", methods=["PATCH"])
+def api_update_contract(device_id):
+    if not update_contract(device_id, _contract_fields(_json_body())):
+        raise ApiError(f"找不到設備 {device_id}", 404)
+    return jsonify(_device_json(device_id))
+
+
+@app.route("/api/v1/contracts/batch", methods=["PATCH"])
+def api_update_contracts_batch():
+    results = []
+    for item in _batch_items(_json_body(), "contracts"):
+        device_id = str(item.get("device_id", "")) if isinstance(item, dict) else ""
+        try:
+            if not device_id:
+                raise ApiError("缺少 device_id")
+            if not update_contract(device_id, _contract_fields(item), commit=False):
+                raise ApiError(f"找不到設備 {device_id}", 404)
+            results.append({"device_id": device_id, "updated": True})
+        except ApiError as e:
+            results.append({"device_id": device_id, "error": e.message})
+    get_db().commit()
+    return jsonify({"results": results})
+
+
+@app.route("/api/v1/bills")
+def api_bills():
+    """帳單查詢：?month=YYYYMM、?device_id=、?tax_id=（客戶統編），可組合"""
+    month, device_id, tax_id = (request.args.get(k, "").strip() for k in ("month", "device_id", "tax_id"))
+    if not (month or device_id or tax_id):
+        raise ApiError("請提供 month、device_id 或 tax_id")
+    limit = max(1, min(request.args.get("limit", 1000, type=int), 10000))  # 下限 1，同 api_customers
+    return jsonify({"bills": billing.get_bills(get_db(), month, device_id, tax_id, limit)})
+
+
+@app.route("/api/v1/groups/<group_id>")
+def api_group(group_id):
+    """合併計算群組的試算：?month=YYYYMM（預設本月），回傳成員與合併帳單"""
+    month = request.args.get("month", "").strip() or datetime.now().strftime("%Y%m")
+    conn = get_db()
+    result = groups.calculate_groups(conn, month, group_id).get(group_id)
+    if result is None:
+        raise ApiError(f"找不到群組 {group_id}", 404)
+    return jsonify({"group_id": group_id, "month": month, "members": groups.members(conn, group_id),
+                    "result": result})
+
+
+@app.route("/api/v1/dashboard")
+def api_dashboard():
+    """本月 vs 上月：?month=YYYYMM（預設本月），總計與各服務人員、機型"""
+    month = request.args.get("month", "").strip() or None
+    if month and not reports.is_month(month):
+        raise ApiError("month 格式為 YYYYMM")
+    return jsonify(reports.dashboard(month, get_db()))
+
+
+@app.route("/api/v1/export/<name>.<fmt>")
+def api_export(name, fmt):
+    """串流下載：/api/v1/export/usage.csv、/api/v1/export/history.xlsx?tables=usage,bills
+
+    ?from=YYYY-MM-DD&to=YYYY-MM-DD（usage 依抄表時間，bills 依月份）、?device_id=（可重複）
+    """
+    tables = [t.strip() for t in request.args.get("tables", name).split(",") if t.strip()]
+    device_ids = request.args.getlist("device_id") or None
+    try:
+        start, end = export.parse_date(request.args.get("from")), export.parse_date(request.args.get("to"))
+        for table in tables:
+            export.query(table, start, end, device_ids)  # 先檢查參數，開始串流後就無法回錯誤
+    except export.ExportError as e:
+        raise ApiError(str(e))
+    if fmt == "csv":
+        if len(tables) != 1:
+            raise ApiError("CSV 一次只能匯出一個資料表")
+        body = export.iter_csv(export.iter_rows(get_db(), tables[0], start, end, device_ids))
+        mimetype = "text/csv; charset=utf-8"
+    elif fmt == "xlsx":
+        body = export.iter_xlsx(get_db(), tables, start, end, device_ids)
+        mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        raise ApiError("格式只支援 csv 或 xlsx")
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename={name}.{fmt}"})
+
+
+@app.route("/api/v1/jobs", methods=["GET", "POST"])
+def api_jobs():
+    if request.method == "GET":
+        return jsonify({"jobs": jobs.recent(max(1, min(request.args.get("limit", 20, type=int), 100)))})
+    data = _json_body()
+    try:
+        job_id = jobs.submit(data.get("kind"), data.get("params") or {})
+    except jobs.JobParamError as e:
+        raise ApiError(str(e)) from None
+    return jsonify(jobs.get(job_id)), 202
+
+
+@app.route("/api/v1/jobs/<int:job_id>")
+def api_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        raise ApiError(f"找不到工作 #{job_id}", 404)
+    return jsonify(job)
+
+
+@app.route("/api/v1/jobs/<int:job_id>/cancel", methods=["POST"])
+def api_cancel_job(job_id):
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise ApiError(f"找不到工作 #{job_id}", 404)
+    return jsonify(job)
+
+
 if __name__ == "__main__":
     init_db()
     app.run(host="0.0.0.0", port=10000)
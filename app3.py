@@ -1,34 +1,49 @@
+import numpy as np
 import pandas as pd
 
+import xlsx_stream
+
 # === 檔案設定 ===
 input_file = "原始資料2.xlsx"
 output_file = "資料整理.xlsx"
 
-# 讀取整份 Excel，不設定欄名
-df = pd.read_excel(input_file, header=None, dtype=str)
-df = df.fillna("")
 
-keep_rows = set()  # 要保留的列索引
+def filter_frame(df, carry=(False, False)):
+    """整欄向量化篩選；df 為 dtype=str、空值為 "" 的 DataFrame
+
+    carry 為上一批最後兩列是否含「合約期限」，回傳 (保留遮罩, 本批的 carry)。
+    """
+    cols = [df[c] for c in df.columns]
+    row_text = cols[0].str.cat(cols[1:], sep=" ").str.strip()
+
+    # 開頭有 T2 或含有關鍵字
+    keep = row_text.str.startswith("T2").to_numpy() | row_text.str.contains("設備號碼", regex=False).to_numpy()
+
+    # 「合約期限」本身與下兩行都保留：把命中遮罩往下平移 1、2 列
+    hit = np.concatenate([np.asarray(carry, dtype=bool),
+                          row_text.str.contains("合約期限", regex=False).to_numpy()])
+    keep |= hit[2:] | hit[1:-1] | hit[:-2]
+    return keep, (bool(hit[-2]), bool(hit[-1]))
 
-for i in range(len(df)):
-    row_text = " ".join(df.iloc[i].astype(str)).strip()
 
-    # 如果這列開頭有 T2 或含有關鍵字
-    if row_text.startswith("T2") or "設備號碼" in row_text:
-        keep_rows.add(i)
+def filter_rows(batches):
+    """逐批篩選要保留的列（順序不變）；batches 為 xlsx_stream.iter_row_batches 的輸出"""
+    carry = (False, False)
+    for batch in batches:
+        df = pd.DataFrame(batch, dtype=str)
+        if df.columns.empty:  # 整批都是空白列
+            df[0] = ""
+        df = df.fillna("")
+        keep, carry = filter_frame(df, carry)
+        for i in np.flatnonzero(keep):
+            yield batch[i]
 
-    # 如果有「合約期限」，也把它和下兩行都保留
-    if "合約期限" in row_text:
-        keep_rows.add(i)
-        if i + 1 < len(df):
-            keep_rows.add(i + 1)
-        if i + 2 < len(df):
-            keep_rows.add(i + 2)
 
-# 根據保留行建立新資料集（順序不變）
-df_out = df.loc[sorted(list(keep_rows))]
+if __name__ == "__main__":
+    # 以 read_only 模式逐批讀取，不設定欄名，全部當字串；空白列照舊保留（「合約期限」的下兩行可能是空白列）
+    batches = xlsx_stream.iter_row_batches(input_file, as_str=True, skip_blank=False)
 
-# 輸出成新 Excel
-df_out.to_excel(output_file, index=False, header=False)
+    # 篩選結果直接以 write_only 模式寫出
+    count = xlsx_stream.write_rows(output_file, filter_rows(batches))
 
-print(f"✅ 已完成篩選，輸出檔案：{output_file}")
+    print(f"✅ 已完成篩選（保留 {count} 列），輸出檔案：{output_file}")
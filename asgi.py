@@ -0,0 +1,179 @@
+# asgi.py — 非同步（asyncio）服務模式：同樣的 Flask 路由，資料庫工作丟到 thread pool 執行
+#
+#   python asgi.py --port 10000                  # 以 aiohttp 啟動
+#   uvicorn asgi:application --port 10000        # 或交給任何 ASGI server
+#
+# 事件迴圈只負責收送 HTTP；每個 request 的 Flask 處理（含 SQLite 查詢、批次計費）
+# 都在 executor 裡跑，長時間的批次工作不會卡住其他查詢。
+import argparse
+import asyncio
+import contextvars
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app, init_db
+
+THREADS = int(os.environ.get("BILLING_ASYNC_THREADS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix="billing")
+_END = object()
+
+
+def _environ(method, path, query_string, headers, body, server, client, scheme):
+    """組出 WSGI environ（path 為已解碼的字串，headers 為 (name, value) 字串）"""
+    environ = {
+        "REQUEST_METHOD": method,
+        "SCRIPT_NAME": "",
+        "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": query_string,
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "REMOTE_ADDR": client[0] if client else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scheme,
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in headers:
+        key = name.upper().replace("-", "_")
+        if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            key = "HTTP_" + key
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    environ.setdefault("CONTENT_LENGTH", str(len(body)))
+    return environ
+
+
+async def run_wsgi(environ):
+    """在 executor 執行 Flask，回傳 (status, headers, 非同步 body 迭代器)
+
+    body 逐塊在 executor 取出，串流下載不會整份先放進記憶體。
+    每一塊可能在不同的執行緒取出，所以 call / next / close 都在同一個 contextvars.Context 裡執行，
+    stream_with_context 推入的 Flask context 才能在最後一塊正確 pop。
+    """
+    loop = asyncio.get_running_loop()
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"], started["headers"] = status, headers
+        return lambda data: None
+
+    def call():
+        result = app.wsgi_app(environ, start_response)
+        it = iter(result)
+        return result, it, next(it, _END)  # 先取第一塊，確保 start_response 已被呼叫
+
+    ctx = contextvars.copy_context()
+    result, it, first = await loop.run_in_executor(_executor, ctx.run, call)
+
+    async def body():
+        try:
+            chunk = first
+            while chunk is not _END:
+                if chunk:
+                    yield chunk
+                chunk = await loop.run_in_executor(_executor, ctx.run, next, it, _END)
+        finally:
+            if hasattr(result, "close"):
+                await loop.run_in_executor(_executor, ctx.run, result.close)
+
+    return started["status"], started["headers"], body()
+
+
+async def _startup():
+    def init():
+        with app.app_context():
+            init_db()
+
+    await asyncio.get_running_loop().run_in_executor(_executor, init)
+
+
+# --- ASGI 介面 ---
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await _startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                _executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    body = bytearray()
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+
+    environ = _environ(
+        scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1"),
+        [(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]],
+        bytes(body), scope.get("server") or ("localhost", 80), scope.get("client"), scope.get("scheme", "http"))
+    status, headers, chunks = await run_wsgi(environ)
+    await send({
+        "type": "http.response.start",
+        "status": int(status.split(" ", 1)[0]),
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+    })
+    async for chunk in chunks:
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+# --- 以 aiohttp 直接啟動 ---
+async def _aiohttp_handler(request):
+    from aiohttp import web
+
+    body = await request.read()
+    host, port = request.transport.get_extra_info("sockname")[:2]
+    peer = request.transport.get_extra_info("peername")
+    # query_string 已被 aiohttp 解碼，要用原始（仍為 %XX）的字串，同 ASGI 的 scope["query_string"]
+    environ = _environ(request.method, request.path, request.rel_url.raw_query_string, request.headers.items(),
+                       body, (host, port), peer, request.scheme)
+    status, headers, chunks = await run_wsgi(environ)
+    code, _, reason = status.partition(" ")
+    response = web.StreamResponse(status=int(code), reason=reason or None)
+    for name, value in headers:
+        if name.lower() == "content-length":
+            response.content_length = int(value)
+        else:
+            response.headers.add(name, value)
+    await response.prepare(request)
+    async for chunk in chunks:
+        await response.write(chunk)
+    await response.write_eof()
+    return response
+
+
+def aiohttp_app():
+    from aiohttp import web
+
+    server = web.Application(client_max_size=64 * 1024 * 1024)
+    server.router.add_route("*", "/{tail:.*}", _aiohttp_handler)
+    server.on_startup.append(lambda _: _startup())
+    return server
+
+
+def main(argv=None):
+    from aiohttp import web
+
+    parser = argparse.ArgumentParser(description="以 asyncio（aiohttp）啟動計費系統")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    web.run_app(aiohttp_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
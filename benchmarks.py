@@ -0,0 +1,593 @@
+# benchmarks.py — 效能量測（使用暫存資料庫，不會動到 billing.db）
+#
+#   python benchmarks.py                         # 核心項目，結果存到 bench_results/，並與上一次比較
+#   python benchmarks.py --devices 10000 --full  # 較大的機隊，加上吞吐量 / 非同步 / 記憶體
+import argparse
+import importlib
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import db
+
+
+def _timeit(fn, repeat=2000):
+    """執行 fn repeat 次，回傳每次耗時的中位數與 p99（微秒）"""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def make_bench_db(n_devices=1000, n_months=36, seed=1):
+    """建立暫存 billing.db（fleet.py 模擬機隊）：n_devices 台設備，每台 n_months 筆抄表"""
+    import fleet
+
+    return fleet.build_db(os.path.join(tempfile.mkdtemp(prefix="billing_bench_"), "billing.db"),
+                          n_devices, n_months, seed)
+
+
+def bench_snapshot(device_ids):
+    """index() 載入設備：三次查詢 vs. get_device_snapshot 單一 JOIN vs. 契約/客戶快取命中"""
+    import app
+    import cache
+
+    rnd = random.Random(2)
+    with app.app.test_request_context():
+        def three_calls():
+            d = rnd.choice(device_ids)
+            app.get_contract(d)
+            app.get_customer(d)
+            app.get_last_counts(d)
+
+        def snapshot():
+            app.get_device_snapshot(rnd.choice(device_ids))
+
+        sizes = cache.contracts.maxsize, cache.customers.maxsize
+        cache.contracts.maxsize = cache.customers.maxsize = 0  # 先量不開快取
+        results = {"three_calls": _timeit(three_calls), "snapshot": _timeit(snapshot)}
+        cache.contracts.maxsize, cache.customers.maxsize = sizes
+        for d in device_ids:
+            app.get_device_snapshot(d)
+        results["snapshot_cached"] = _timeit(snapshot)
+        return results
+
+
+def bench_search(n_customers=20000, limit=50):
+    """客戶搜尋：customer_name LIKE '%kw%' 全表掃描 vs. FTS5 trigram 索引"""
+    import app
+
+    make_bench_db(n_devices=n_customers, n_months=0)
+    keywords = ["客戶1234", "測試路999號", "有限公司", "CN01234", "00012345"]
+    results = {}
+    with app.app.test_request_context():
+        conn = db.get_db()
+        for kw in keywords:
+            def like():
+                conn.execute("""
+                    SELECT device_id, customer_name FROM customers
+                    WHERE customer_name LIKE ?1 OR tax_id LIKE ?1 OR install_address LIKE ?1
+                       OR device_number LIKE ?1
+                    LIMIT ?2
+                """, (f"%{kw}%", limit)).fetchall()
+
+            def fts():
+                app.search_customers_by_name(kw, limit)
+
+            results[f"like {kw}"] = _timeit(like, repeat=200)
+            results[f"fts  {kw}"] = _timeit(fts, repeat=200)
+    return results
+
+
+def bench_api(device_ids, seconds=3.0, batch_size=50):
+    """設備查詢吞吐量（requests/s 與 devices/s）：HTML 表單 vs. JSON API vs. JSON 批次查詢"""
+    import app
+
+    rnd = random.Random(3)
+    client = app.app.test_client()
+    cases = {
+        "html": lambda: client.get(f"/?device_id={rnd.choice(device_ids)}"),
+        "json": lambda: client.get(f"/api/v1/devices/{rnd.choice(device_ids)}"),
+        f"json_batch{batch_size}": lambda: client.post(
+            "/api/v1/devices/batch", json={"device_ids": rnd.sample(device_ids, batch_size)}),
+    }
+    results = {}
+    for label, call in cases.items():
+        assert call().status_code == 200
+        n = 0
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < seconds:
+            call()
+            n += 1
+        rps = n / (time.perf_counter() - t0)
+        per_request = batch_size if label.startswith("json_batch") else 1
+        results[label] = {"requests_per_s": rps, "devices_per_s": rps * per_request}
+    return results
+
+
+def bench_readings(device_ids, n_single=300):
+    """整批抄表：每台一個 POST（index() calculate）vs. readings.submit_readings 單一交易"""
+    import app
+    import readings
+
+    client = app.app.test_client()
+    with app.app.app_context():
+        last = readings.load_latest(db.get_db(), device_ids)
+
+    t0 = time.perf_counter()
+    for d in device_ids[:n_single]:
+        client.post("/", data={"mode": "calculate", "device_id": d,
+                               "curr_color": last[d][1] + 10, "curr_bw": last[d][2] + 10})
+    single = n_single / (time.perf_counter() - t0)
+
+    rows = [{"device_id": d, "color": last[d][1] + 20, "bw": last[d][2] + 20, "timestamp": "2099/01/01-09:00"}
+            for d in device_ids]
+    with app.app.app_context():
+        summary = readings.submit_readings(db.get_db(), rows)
+    assert summary["accepted"] == len(rows)
+    return {"per_post_rows_per_s": single, "batch_rows_per_s": summary["rows_per_sec"]}
+
+
+def _http(port, method, path, body=None, headers=None):
+    import http.client
+
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+def _start_server(kind, port, db_file):
+    """kind="sync"：werkzeug 單執行緒（等同一個 gunicorn sync worker）；kind="async"：asgi.py"""
+    if kind == "sync":
+        cmd = [sys.executable, "-c",
+               "import app; from werkzeug.serving import make_server\n"
+               "with app.app.app_context(): app.init_db()\n"
+               f"make_server('127.0.0.1', {port}, app.app, threaded=False).serve_forever()"]
+    else:
+        cmd = [sys.executable, "asgi.py", "--host", "127.0.0.1", "--port", str(port)]
+    proc = subprocess.Popen(cmd, cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=dict(os.environ, BILLING_DB=db_file),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(200):
+        try:
+            _http(port, "GET", "/cache/stats")
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"{kind} server 無法啟動")
+
+
+def bench_async(device_ids, clients=8, seconds=5.0, port=18080):
+    """整批抄表（5000 筆，dry run）處理中，設備查詢的 p50/p99 延遲：同步 Flask vs. asgi.py（thread pool）
+
+    另外檢查串流下載（stream_with_context 的匯出）在兩種模式下都能完整送出。
+    """
+    import threading
+
+    import readings
+
+    results = {}
+    for kind in ("sync", "async"):
+        proc = _start_server(kind, port, db.DB_FILE)
+        try:
+            stop = time.perf_counter() + seconds
+            latencies, jobs = [], []
+
+            def lookups(seed):
+                rnd = random.Random(seed)
+                while time.perf_counter() < stop:
+                    t0 = time.perf_counter()
+                    _http(port, "GET", f"/api/v1/devices/{rnd.choice(device_ids)}")
+                    latencies.append((time.perf_counter() - t0) * 1000)
+
+            batch = json.dumps({"readings": [{"device_id": d, "color": 10 ** 8, "bw": 10 ** 8}
+                                             for d in device_ids[:readings.BATCH_LIMIT]]})
+
+            def batch_job():
+                while time.perf_counter() < stop:
+                    t0 = time.perf_counter()
+                    _http(port, "POST", "/api/v1/readings/batch?dry_run=1", body=batch,
+                          headers={"Content-Type": "application/json"})
+                    jobs.append(time.perf_counter() - t0)
+
+            threads = [threading.Thread(target=batch_job)]
+            threads += [threading.Thread(target=lookups, args=(i,)) for i in range(clients)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            t0 = time.perf_counter()
+            for path in ("/api/v1/export/usage.csv", "/api/v1/export/usage.xlsx?tables=usage,bills"):
+                status = _http(port, "GET", path)
+                if status != 200:
+                    raise RuntimeError(f"{kind} 串流下載 {path} 失敗：HTTP {status}")
+            export_s = time.perf_counter() - t0
+        finally:
+            proc.terminate()
+            proc.wait()
+        latencies.sort()
+        results[kind] = {
+            "lookups_per_s": len(latencies) / seconds,
+            "p50_ms": statistics.median(latencies),
+            "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+            "batch_runs": len(jobs),
+            "batch_s": statistics.mean(jobs) if jobs else None,
+            "export_s": export_s,
+        }
+    return results
+
+
+def bench_billing(n=20000):
+    """月底計費：逐筆 billing.calculate（Decimal）vs. billing.calculate_batch（整數向量化）"""
+    import numpy as np
+    import pandas as pd
+
+    import billing
+    import fleet
+
+    cases = fleet.random_cases(n)
+    contracts = pd.DataFrame([c[0] for c in cases])
+    counts = [np.array([c[k] for c in cases]) for k in range(1, 5)]
+
+    t0 = time.perf_counter()
+    for contract, *args in cases:
+        billing.calculate(contract, *args)
+    t_exact = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    billing.calculate_batch(contracts, *counts)
+    t_batch = time.perf_counter() - t0
+    return {"devices": n, "exact_s": t_exact, "batch_s": t_batch, "batch_devices_per_s": n / t_batch}
+
+
+def make_bench_workbook(path, n_rows, seed=1):
+    """產生 customers + contracts 兩張工作表的匯入用 xlsx（write_only，不佔記憶體）"""
+    import fleet
+
+    fleet.write_import_workbook(path, n_rows, seed)
+
+
+def _peak_rss_mb(code):
+    """在子行程執行 code，回傳該行程的峰值 RSS（MB）"""
+    probe = code + "\nimport resource; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    out = subprocess.run([sys.executable, "-c", probe], check=True, capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    return int(out.stdout.strip().splitlines()[-1]) / 1024
+
+
+def bench_excel_memory(sizes=(5000, 20000, 50000)):
+    """Excel 匯入/篩選：pandas 整本載入 vs. openpyxl read_only 串流的峰值 RSS"""
+    results = {}
+    tmp = tempfile.mkdtemp(prefix="billing_bench_")
+    for n in sizes:
+        path = os.path.join(tmp, f"import_{n}.xlsx")
+        make_bench_workbook(path, n)
+        db_path = os.path.join(tmp, f"import_{n}.db")
+        for label, stream in (("pandas", False), ("stream", True)):
+            code = (f"import contextlib, io, importlib; imp = importlib.import_module('import'); "
+                    f"imp.DB_FILE = {db_path + label!r}\n"
+                    f"with contextlib.redirect_stdout(io.StringIO()): "
+                    f"imp.init_db(); imp.import_excel_to_db({path!r}, stream={stream})")
+            results[f"import {label} {n}"] = _peak_rss_mb(code)
+        results[f"filter pandas {n}"] = _peak_rss_mb(
+            f"import pandas as pd; df = pd.read_excel({path!r}, header=None, dtype=str).fillna('')")
+        results[f"filter stream {n}"] = _peak_rss_mb(
+            f"import app3, xlsx_stream; batches = xlsx_stream.iter_row_batches({path!r}, as_str=True, skip_blank=False); "
+            f"sum(1 for _ in app3.filter_rows(batches))")
+    return results
+
+
+def _filter_rows_loop(df):
+    """舊版 app3.py 的逐列篩選（僅供比對與計時）"""
+    keep_rows = set()
+    for i in range(len(df)):
+        row_text = " ".join(df.iloc[i].astype(str)).strip()
+        if row_text.startswith("T2") or "設備號碼" in row_text:
+            keep_rows.add(i)
+        if "合約期限" in row_text:
+            keep_rows.add(i)
+            if i + 1 < len(df):
+                keep_rows.add(i + 1)
+            if i + 2 < len(df):
+                keep_rows.add(i + 2)
+    return df.loc[sorted(keep_rows)]
+
+
+def bench_filter(path="原始資料2.xlsx", repeat=10):
+    """原始資料篩選：逐列 join vs. app3.filter_rows 向量化遮罩（不含讀檔時間）"""
+    import pandas as pd
+
+    import app3
+    import xlsx_stream
+
+    rows = [row for batch in xlsx_stream.iter_row_batches(path, as_str=True, skip_blank=False) for row in batch] * repeat
+    df = pd.DataFrame(rows, dtype=str).fillna("")
+    batches = [rows[i:i + 2000] for i in range(0, len(rows), 2000)]
+
+    t0 = time.perf_counter()
+    expected = _filter_rows_loop(df)
+    t_loop = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    kept = list(app3.filter_rows(batches))
+    t_vec = time.perf_counter() - t0
+
+    got = pd.DataFrame(kept, dtype=str).fillna("")
+    assert got.values.tolist() == expected.values.tolist(), "篩選結果不一致"
+    return {"rows": len(rows), "kept": len(kept), "loop_s": t_loop, "vectorized_s": t_vec}
+
+
+def bench_slips(path="設備資料.txt", repeat=20):
+    """設備資料.txt 憑單：整份解析（單次掃描）與批次寫入暫存資料庫"""
+    import import_slips
+
+    lines = list(import_slips.read_lines(path))
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        slips = list(import_slips.parse_slips(iter(lines)))
+    t_parse = (time.perf_counter() - t0) / repeat
+
+    make_bench_db(n_devices=0, n_months=0)
+    stats = import_slips.import_slips(path, db_file=db.DB_FILE)
+    return {
+        "lines": len(lines), "slips": len(slips), "readings": stats["readings"],
+        "parse_ms": t_parse * 1000, "lines_per_s": len(lines) / t_parse,
+        "import_ms": stats["total_s"] * 1000,
+    }
+
+
+def bench_last_counts(device_ids):
+    """get_last_counts：idx_usage_device_id 取每台最後一筆抄表"""
+    import app
+
+    rnd = random.Random(4)
+    with app.app.test_request_context():
+        return {"get_last_counts": _timeit(lambda: app.get_last_counts(rnd.choice(device_ids)))}
+
+
+def bench_calculate(n=2000):
+    """billing.calculate 單筆（Decimal 精確版）"""
+    import billing
+    import fleet
+
+    cases = itertools.cycle(fleet.random_cases(n, seed=5))
+    return {"calculate": _timeit(lambda: billing.calculate(*next(cases)))}
+
+
+def bench_index(device_ids, repeat=300):
+    """index() 整頁繪製：依設備編號載入（GET）與依客戶名稱模糊查詢（POST）"""
+    import app
+
+    rnd = random.Random(6)
+    client = app.app.test_client()
+    customers = max(len(device_ids) // 3, 1)
+    return {
+        "index device": _timeit(lambda: client.get(f"/?device_id={rnd.choice(device_ids)}"), repeat),
+        "index search": _timeit(lambda: client.post("/", data={
+            "mode": "query", "device_id": f"測試客戶{rnd.randrange(customers)}有限公司"}), repeat),
+    }
+
+
+def _kept_bytes(make, n=10000):
+    """make() 的結果留 n 個在記憶體時，平均每個佔用的位元組（tracemalloc；欄位值本身是共用的，不計入）"""
+    import tracemalloc
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [make() for _ in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before - sys.getsizeof(kept)) / n
+
+
+def _call_peak_bytes(fn, repeat=300):
+    """每次呼叫 fn 的記憶體配置高峰（中位數，位元組）"""
+    import tracemalloc
+
+    tracemalloc.start()
+    samples = []
+    for _ in range(repeat):
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        fn()
+        samples.append(tracemalloc.get_traced_memory()[1] - start)
+    tracemalloc.stop()
+    return statistics.median(samples)
+
+
+def bench_records(device_ids):
+    """契約 / 客戶資料列：dict(zip(欄名, row)) vs. records 的 slots dataclass，以及 get_device_snapshot 每次的配置量"""
+    import app
+    import cache
+    from records import Contract, Customer
+
+    rnd = random.Random(7)
+    conn = db.get_db()
+    contract_row = conn.execute(app.CONTRACT_SQL, (device_ids[0],)).fetchone()
+    customer_row = conn.execute(app.CUSTOMER_SQL, (device_ids[0],)).fetchone()
+    results = {
+        "contract_dict_bytes": _kept_bytes(lambda: dict(zip(app.CONTRACT_COLUMNS, contract_row))),
+        "contract_record_bytes": _kept_bytes(lambda: Contract(*contract_row)),
+        "customer_dict_bytes": _kept_bytes(lambda: dict(zip(app.CUSTOMER_COLUMNS, customer_row))),
+        "customer_record_bytes": _kept_bytes(lambda: Customer(*customer_row)),
+        "build": _timings({"contract dict": _timeit(lambda: dict(zip(app.CONTRACT_COLUMNS, contract_row))),
+                           "contract record": _timeit(lambda: Contract(*contract_row))}),
+    }
+    with app.app.test_request_context():
+        sizes = cache.contracts.maxsize, cache.customers.maxsize
+        cache.contracts.maxsize = cache.customers.maxsize = 0
+        results["snapshot_peak_bytes"] = _call_peak_bytes(lambda: app.get_device_snapshot(rnd.choice(device_ids)))
+        cache.contracts.maxsize, cache.customers.maxsize = sizes
+        for d in device_ids:
+            app.get_device_snapshot(d)
+        results["snapshot_cached_peak_bytes"] = _call_peak_bytes(
+            lambda: app.get_device_snapshot(rnd.choice(device_ids)))
+    return results
+
+
+def bench_import(n_rows=20000):
+    """import_excel_to_db：fleet 產生的匯入檔（串流讀取）寫入空白資料庫"""
+    import contextlib
+    import io
+
+    importer = importlib.import_module("import")
+    path = os.path.join(tempfile.mkdtemp(prefix="billing_bench_"), "import_data.xlsx")
+    make_bench_workbook(path, n_rows)
+    make_bench_db(n_devices=0, n_months=0)
+    importer.DB_FILE = db.DB_FILE
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        importer.import_excel_to_db(path, stream=True)
+    elapsed = time.perf_counter() - t0
+    return {"rows": n_rows, "elapsed_s": elapsed, "rows_per_s": n_rows / elapsed}
+
+
+def _report(name, results):
+    print(f"== {name}")
+    for label, (p50, p99) in results.items():
+        print(f"  {label:<20} p50 {p50:8.1f} µs   p99 {p99:8.1f} µs")
+
+
+def _timings(results):
+    """_timeit 的 (p50, p99) 轉成 JSON 欄位"""
+    return {label: {"p50_us": p50, "p99_us": p99} for label, (p50, p99) in results.items()}
+
+
+def run_suite(n_devices=1000, n_months=36, full=False):
+    """核心項目（full=True 時再加上吞吐量、非同步、記憶體等）；回傳可存成 JSON 的結果"""
+    import fleet
+
+    results = {}
+    ids = make_bench_db(n_devices, n_months)
+    for name, timings in (("get_last_counts", bench_last_counts(ids)), ("calculate", bench_calculate()),
+                          ("index", bench_index(ids)), ("snapshot", bench_snapshot(ids))):
+        _report(name, timings)
+        results[name] = _timings(timings)
+    if full:
+        results["api"] = bench_api(ids)
+        results["readings"] = bench_readings(ids)
+        results["billing"] = bench_billing()
+        results["async"] = bench_async(make_bench_db(n_devices=5000, n_months=24))
+    results["records"] = bench_records(ids)
+    print("== records", results["records"])
+    timings = bench_search(n_customers=max(n_devices, 1000))
+    _report("customer search", timings)
+    results["search"] = _timings(timings)
+
+    results["import"] = bench_import(n_devices)
+    print("== import_excel_to_db", results["import"])
+    slips = os.path.join(tempfile.mkdtemp(prefix="billing_bench_"), "原始資料.xlsx")
+    fleet.write_slip_workbook(slips, n_devices)
+    results["filter"] = bench_filter(slips, repeat=1)
+    print("== 原始資料篩選", results["filter"])
+    if full:
+        results["slips"] = bench_slips()
+        results["excel_peak_rss_mb"] = bench_excel_memory()
+        print("== 憑單解析", results["slips"])
+        print("== Excel peak RSS", results["excel_peak_rss_mb"])
+    return results
+
+
+# --- 結果存檔與前後比較 ---
+RESULTS_DIR = "bench_results"
+
+
+def _leaves(results, prefix=""):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from _leaves(value, f"{prefix}{key} / ")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+
+def compare(baseline, current, threshold=0.2):
+    """找出比 baseline 差超過 threshold 的項目：[(項目, 舊值, 新值, 變差比例)]
+
+    只比較耗時（*_s / *_us / *_ms）、記憶體（*_bytes，越小越好）與吞吐量（*per_s，越大越好）；p99 雜訊太大，不列入。
+    """
+    old = dict(_leaves(baseline["results"]))
+    regressions = []
+    for key, new in _leaves(current["results"]):
+        prev = old.get(key)
+        if not prev or key.endswith("p99_us"):
+            continue
+        if key.endswith("per_s"):
+            change = (prev - new) / prev
+        elif key.endswith(("_s", "_us", "_ms", "_bytes")):
+            change = (new - prev) / prev
+        else:
+            continue
+        if change > threshold:
+            regressions.append((key, prev, new, change))
+    return regressions
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def latest_result(directory=RESULTS_DIR):
+    files = sorted(f for f in os.listdir(directory) if f.endswith(".json")) if os.path.isdir(directory) else []
+    return os.path.join(directory, files[-1]) if files else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="效能量測（暫存資料庫），結果存成 JSON 並與上一次比較")
+    parser.add_argument("--devices", type=int, default=1000, help="模擬機隊設備數")
+    parser.add_argument("--months", type=int, default=36, help="每台的抄表月數")
+    parser.add_argument("--full", action="store_true", help="另外量吞吐量、非同步服務、記憶體")
+    parser.add_argument("--json", help=f"結果檔（預設 {RESULTS_DIR}/<時間>.json）")
+    parser.add_argument("--baseline", help=f"比較用的舊結果（預設 {RESULTS_DIR} 裡最新的一份）")
+    parser.add_argument("--threshold", type=float, default=0.2, help="變差多少算退步（預設 0.2 = 20%%）")
+    args = parser.parse_args(argv)
+
+    baseline_path = args.baseline or latest_result()
+    current = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "devices": args.devices,
+        "months": args.months,
+        "results": run_suite(args.devices, args.months, args.full),
+    }
+    path = args.json or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(current, f, ensure_ascii=False, indent=2)
+    print(f"✅ 結果已存到 {path}")
+
+    if not baseline_path:
+        return 0
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if (baseline.get("devices"), baseline.get("months")) != (args.devices, args.months):
+        print(f"⚠️ {baseline_path} 的規模不同（{baseline.get('devices')} 台 × {baseline.get('months')} 月），不比較")
+        return 0
+    regressions = compare(baseline, current, args.threshold)
+    for key, prev, new, change in regressions:
+        print(f"❌ {key}：{prev:,.2f} → {new:,.2f}（差 {change:.0%}）")
+    print(f"與 {baseline_path}（{baseline.get('commit')}）比較：" + (f"{len(regressions)} 項退步" if regressions else "沒有退步"))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+# billing.py — 共用計費核心：Decimal 精確版 calculate() + 向量化 calculate_batch()，兩者到分都相同
+#
+# 計費規則（app.py / app2.py / count.py / 批次 / API 全部共用）：
+#   使用張數 = max(0, 本次 - 前次)
+#   計費張數 = max(0, 使用 - 贈送) × (1 - 誤印率)，四捨五入到整張；有基本張數時取 max(基本, 計費)
+#   金額     = 計費張數 × 單價，四捨五入到分；小計 = 月租金 + 彩色金額 + 黑白金額
+#   未稅契約：未稅 = round(小計)，稅額 = round(未稅 × 稅率)，總額 = 未稅 + 稅額
+#   含稅契約：總額 = round(小計)，未稅 = round(總額 ÷ (1 + 稅率))，稅額 = 總額 - 未稅
+# 單價、誤印率、稅率固定到小數 4 位，月租金到分；所有四捨五入都是 ROUND_HALF_UP（不用浮點）。
+import argparse
+import time
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+
+import db
+
+TAX_RATE = 0.05
+PRICE_PLACES = 4  # 單價 / 誤印率 / 稅率的小數位數
+RATE_SCALE = 10 ** PRICE_PLACES
+
+RESULT_KEYS = (
+    "彩色使用張數", "黑白使用張數", "彩色計費張數", "黑白計費張數",
+    "彩色金額", "黑白金額", "月租金", "未稅小計", "稅額", "含稅總額"
+)
+
+# 月結帳單（device_id + month 唯一）
+BILLS_SQL = """
+    CREATE TABLE IF NOT EXISTS bills (
+        device_id TEXT,
+        month TEXT,
+        used_color INTEGER,
+        used_bw INTEGER,
+        bill_color INTEGER,
+        bill_bw INTEGER,
+        color_amount REAL,
+        bw_amount REAL,
+        monthly_rent REAL,
+        untaxed INTEGER,
+        tax INTEGER,
+        total INTEGER,
+        created_at TEXT,
+        PRIMARY KEY (device_id, month)
+    );
+    CREATE INDEX IF NOT EXISTS idx_bills_month ON bills (month, device_id);
+"""
+
+BILL_COLUMNS = (
+    "device_id", "month", "used_color", "used_bw", "bill_color", "bill_bw",
+    "color_amount", "bw_amount", "monthly_rent", "untaxed", "tax", "total", "created_at"
+)
+
+# 同設備同月份重算時覆蓋（用 UPSERT，不用 REPLACE，bills 上的 trigger 才會收到 UPDATE）
+# 群組成員不另開個別帳單（用量併入 groups.py 的 group_bills），抄表照寫、這裡直接略過
+UPSERT_BILL_SQL = f"""
+    INSERT INTO bills ({", ".join(BILL_COLUMNS)})
+    SELECT {", ".join(f"?{i}" for i in range(1, len(BILL_COLUMNS) + 1))}
+    WHERE NOT EXISTS (SELECT 1 FROM contract_group_members WHERE device_id = ?1)
+    ON CONFLICT(device_id, month) DO UPDATE SET
+        {", ".join(f"{col}=excluded.{col}" for col in BILL_COLUMNS[2:])}
+"""
+
+# 每台設備在指定月份（含）以前的最後兩筆抄表
+READINGS_SQL = """
+    SELECT device_id, month, color_count, bw_count, rn FROM (
+        SELECT device_id, month, color_count, bw_count,
+               ROW_NUMBER() OVER (PARTITION BY device_id ORDER BY id DESC) AS rn
+        FROM usage
+        WHERE month <= ?
+    ) WHERE rn <= 2
+"""
+
+ONE = Decimal(1)
+CENT = Decimal("0.01")
+UNIT = Decimal(1).scaleb(-PRICE_PLACES)
+
+
+# --- 精確版（逐筆）---
+def _dec(value, quantum):
+    """資料庫的 REAL / int 轉成固定位數的 Decimal（以 str 轉換，0.3 就是 0.3）"""
+    if value is None or value != value:  # None / NaN
+        return Decimal(0)
+    return Decimal(str(value)).quantize(quantum, ROUND_HALF_UP)
+
+
+def _pages(used, giveaway, error_rate, basic):
+    bill = max(0, used - int(giveaway or 0))
+    bill = int((bill * (ONE - _dec(error_rate, UNIT))).quantize(ONE, ROUND_HALF_UP))
+    basic = int(basic or 0)
+    return max(basic, bill) if basic > 0 else bill
+
+
+def calculate(contract, curr_color, curr_bw, last_color, last_bw, tax_rate=TAX_RATE):
+    """單台設備計費（Decimal 精確運算），contract 為 records.Contract，回傳 RESULT_KEYS 各欄"""
+    used_color = max(0, int(curr_color) - int(last_color))
+    used_bw = max(0, int(curr_bw) - int(last_bw))
+
+    bill_color = _pages(used_color, contract.color_giveaway, contract.color_error_rate, contract.color_basic)
+    bill_bw = _pages(used_bw, contract.bw_giveaway, contract.bw_error_rate, contract.bw_basic)
+
+    rent = _dec(contract.monthly_rent, CENT)
+    color_amount = (bill_color * _dec(contract.color_unit_price, UNIT)).quantize(CENT, ROUND_HALF_UP)
+    bw_amount = (bill_bw * _dec(contract.bw_unit_price, UNIT)).quantize(CENT, ROUND_HALF_UP)
+    subtotal = rent + color_amount + bw_amount
+
+    rate = _dec(tax_rate, UNIT)
+    if contract.tax_type == "未稅":
+        untaxed = subtotal.quantize(ONE, ROUND_HALF_UP)
+        tax = (untaxed * rate).quantize(ONE, ROUND_HALF_UP)
+        total = untaxed + tax
+    else:
+        total = subtotal.quantize(ONE, ROUND_HALF_UP)
+        untaxed = (total / (ONE + rate)).quantize(ONE, ROUND_HALF_UP)
+        tax = total - untaxed
+
+    return {
+        "彩色使用張數": used_color,
+        "黑白使用張數": used_bw,
+        "彩色計費張數": bill_color,
+        "黑白計費張數": bill_bw,
+        "彩色金額": float(color_amount),
+        "黑白金額": float(bw_amount),
+        "月租金": float(rent),
+        "未稅小計": int(untaxed),
+        "稅額": int(tax),
+        "含稅總額": int(total)
+    }
+
+
+# --- 向量化版（批次）：全部換成整數單位運算 ---
+def _half_up(n, d):
+    """整數除法 n / d 四捨五入（遠離 0），與 Decimal ROUND_HALF_UP 相同"""
+    return np.sign(n) * ((2 * np.abs(n) + d) // (2 * d))
+
+
+def _units(contracts, name, quantum):
+    """欄位轉成整數單位（quantum 的倍數）；只對不重複的值走 Decimal，再展開回整欄"""
+    values = pd.Series(np.asarray(contracts[name], dtype=np.float64)).fillna(0).to_numpy()
+    uniq, inverse = np.unique(values, return_inverse=True)
+    table = np.array([int(_dec(v, quantum).scaleb(-quantum.as_tuple().exponent)) for v in uniq.tolist()],
+                     dtype=np.int64)
+    return table[inverse.reshape(-1)] if len(values) else np.zeros(0, dtype=np.int64)
+
+
+def _count(contracts, name):
+    return pd.Series(np.asarray(contracts[name], dtype=np.float64)).fillna(0).to_numpy().astype(np.int64)
+
+
+def _batch_pages(used, giveaway, error_units, basic):
+    bill = np.maximum(0, used - giveaway)
+    bill = _half_up(bill * (RATE_SCALE - error_units), RATE_SCALE)
+    return np.where(basic > 0, np.maximum(basic, bill), bill)
+
+
+def calculate_batch(contracts, curr_color, curr_bw, last_color, last_bw, tax_rate=TAX_RATE):
+    """向量化版 calculate()：contracts 為欄位陣列（DataFrame 或 dict），回傳每列一筆的 DataFrame"""
+    used_color = np.maximum(0, np.asarray(curr_color, dtype=np.int64) - np.asarray(last_color, dtype=np.int64))
+    used_bw = np.maximum(0, np.asarray(curr_bw, dtype=np.int64) - np.asarray(last_bw, dtype=np.int64))
+
+    bill_color = _batch_pages(used_color, _count(contracts, "color_giveaway"),
+                              _units(contracts, "color_error_rate", UNIT), _count(contracts, "color_basic"))
+    bill_bw = _batch_pages(used_bw, _count(contracts, "bw_giveaway"),
+                           _units(contracts, "bw_error_rate", UNIT), _count(contracts, "bw_basic"))
+
+    # 金額以「分」為單位：張數 × 單價（0.0001 元）÷ 100
+    rent = _units(contracts, "monthly_rent", CENT)
+    color_amount = _half_up(bill_color * _units(contracts, "color_unit_price", UNIT), 100)
+    bw_amount = _half_up(bill_bw * _units(contracts, "bw_unit_price", UNIT), 100)
+    subtotal = rent + color_amount + bw_amount
+
+    rate = int(_dec(tax_rate, UNIT).scaleb(PRICE_PLACES))
+    untaxed_mode = np.asarray(contracts["tax_type"], dtype=object) == "未稅"
+    rounded = _half_up(subtotal, 100)
+    untaxed = np.where(untaxed_mode, rounded, _half_up(rounded * RATE_SCALE, RATE_SCALE + rate))
+    tax = np.where(untaxed_mode, _half_up(rounded * rate, RATE_SCALE), rounded - untaxed)
+    total = untaxed + tax
+
+    return pd.DataFrame({
+        "彩色使用張數": used_color,
+        "黑白使用張數": used_bw,
+        "彩色計費張數": bill_color,
+        "黑白計費張數": bill_bw,
+        "彩色金額": color_amount / 100,
+        "黑白金額": bw_amount / 100,
+        "月租金": rent / 100,
+        "未稅小計": untaxed,
+        "稅額": tax,
+        "含稅總額": total,
+    }, index=pd.Index(np.asarray(contracts["device_id"], dtype=object), name="device_id"))
+
+
+def load_month_inputs(conn, month):
+    """讀取所有契約與本月/前次抄表，回傳對齊後的 DataFrame（只含本月有抄表、不屬於群組的設備）"""
+    contracts = pd.read_sql_query("""
+        SELECT device_id, monthly_rent, color_unit_price, bw_unit_price,
+               color_giveaway, bw_giveaway, color_error_rate, bw_error_rate,
+               color_basic, bw_basic, tax_type
+        FROM contracts
+        WHERE device_id NOT IN (SELECT device_id FROM contract_group_members)
+    """, conn)
+    num_cols = contracts.columns.drop(["device_id", "tax_type"])
+    contracts[num_cols] = contracts[num_cols].fillna(0)
+
+    readings = pd.read_sql_query(READINGS_SQL, conn, params=(month,))
+    curr = readings[(readings["rn"] == 1) & (readings["month"] == month)].set_index("device_id")
+    prev = readings[readings["rn"] == 2].set_index("device_id")
+
+    df = contracts.join(curr[["color_count", "bw_count"]], on="device_id", how="inner")
+    df = df.join(prev[["color_count", "bw_count"]], on="device_id", rsuffix="_last")
+    df[["color_count_last", "bw_count_last"]] = df[["color_count_last", "bw_count_last"]].fillna(0)
+    return df.reset_index(drop=True)
+
+
+def write_bills(conn, month, results, chunk_size=None, progress=None):
+    """把 calculate_batch 的結果寫入 bills（同月份重算時覆蓋）
+
+    chunk_size 為 None 時一次 commit；否則每 chunk_size 筆 commit 一次，progress(已寫筆數, 總筆數)。
+    bills 表由 migrations 建立，呼叫前要先 migrate。
+    """
+    # 加入群組前開出的個別帳單一併清掉，改由群組月結計費
+    conn.execute("DELETE FROM bills WHERE month = ? AND device_id IN (SELECT device_id FROM contract_group_members)",
+                 (month,))
+    created_at = datetime.now().strftime("%Y/%m/%d-%H:%M")
+    rows = list(zip(
+        results.index, [month] * len(results),
+        *(results[key].tolist() for key in RESULT_KEYS),
+        [created_at] * len(results),
+    ))
+    step = chunk_size or len(rows) or 1
+    for start in range(0, len(rows), step):
+        conn.executemany(UPSERT_BILL_SQL, rows[start:start + step])
+        conn.commit()
+        if progress:
+            progress(min(start + step, len(rows)), len(rows))
+    conn.commit()
+
+
+def bill_row(device_id, month, result, created_at=None):
+    """calculate() 的結果轉成 bills 的一列"""
+    return (device_id, month, *(result[key] for key in RESULT_KEYS),
+            created_at or datetime.now().strftime("%Y/%m/%d-%H:%M"))
+
+
+def record_bill(conn, device_id, month, result):
+    """把單筆 calculate() 結果寫入 bills（不 commit，與抄表寫入同一個交易）"""
+    conn.execute(UPSERT_BILL_SQL, bill_row(device_id, month, result))
+
+
+def get_bills(conn, month=None, device_id=None, tax_id=None, limit=1000):
+    """讀取帳單：可依月份、設備或客戶統編篩選（皆走索引）"""
+    where, params = [], []
+    if month:
+        where.append("b.month = ?")
+        params.append(month)
+    if device_id:
+        where.append("b.device_id = ?")
+        params.append(device_id)
+    if tax_id:
+        where.append("b.device_id IN (SELECT device_id FROM customers WHERE tax_id = ?)")
+        params.append(tax_id)
+    rows = conn.execute(f"""
+        SELECT {", ".join("b." + col for col in BILL_COLUMNS)}
+        FROM bills b
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY b.month DESC, b.device_id
+        LIMIT ?
+    """, (*params, limit)).fetchall()
+    return [dict(zip(BILL_COLUMNS, row)) for row in rows]
+
+
+def run_month(month=None, conn=None, chunk_size=None, progress=None):
+    """月底批次：計算 month（YYYYMM，預設本月）所有設備並寫入 bills，回傳筆數"""
+    month = month or datetime.now().strftime("%Y%m")
+    conn = conn or db.get_db()
+    df = load_month_inputs(conn, month)
+    results = calculate_batch(df, df["color_count"], df["bw_count"], df["color_count_last"], df["bw_count_last"])
+    write_bills(conn, month, results, chunk_size, progress)
+    return len(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="月底批次計費，結果寫入 bills 資料表")
+    parser.add_argument("--month", help="計費月份 YYYYMM（預設本月）")
+    parser.add_argument("--db", default=db.DB_FILE, help="資料庫檔案")
+    args = parser.parse_args()
+
+    import migrations  # 要有 contract_group_members 才能排除群組成員
+
+    db.DB_FILE = args.db
+    migrations.migrate(db.get_db())
+    t0 = time.perf_counter()
+    n = run_month(args.month)
+    print(f"✅ 批次計費完成：{n} 台設備，耗時 {time.perf_counter() - t0:.2f} 秒")
@@ -0,0 +1,117 @@
+# cache.py — 契約 / 客戶資料的行程內快取（LRU + TTL，寫入時失效）
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, has_app_context
+
+CACHE_SIZE = int(os.environ.get("BILLING_CACHE_SIZE", "2048"))  # 0 = 停用快取
+CACHE_TTL = float(os.environ.get("BILLING_CACHE_TTL", "300"))   # 秒
+
+# 資料版本：contracts / customers 有任何異動就 +1（包含其他 worker、import.py、import_slips.py）
+VERSION_SQL = "\n".join(
+    ["""
+    CREATE TABLE IF NOT EXISTS cache_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO cache_version (id, version) VALUES (1, 0);"""]
+    + [f"""
+    CREATE TRIGGER IF NOT EXISTS {table}_version_{op[0].lower()} AFTER {op} ON {table} BEGIN
+        UPDATE cache_version SET version = version + 1 WHERE id = 1;
+    END;"""
+       for table in ("contracts", "customers") for op in ("INSERT", "UPDATE", "DELETE")]
+)
+
+MISSING = object()
+
+
+class LRUCache:
+    """有上限的 LRU 快取，每筆資料另有 TTL；thread-safe"""
+
+    def __init__(self, name, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key):
+        """命中回傳資料，否則回傳 MISSING"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.stats["misses"] += 1
+                return MISSING
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def invalidate(self, key=None):
+        """移除單筆；key 為 None 時清空"""
+        with self._lock:
+            if key is None:
+                self.stats["invalidations"] += len(self._data)
+                self._data.clear()
+            elif self._data.pop(key, None) is not None:
+                self.stats["invalidations"] += 1
+
+    def __len__(self):
+        return len(self._data)
+
+
+contracts = LRUCache("contracts")
+customers = LRUCache("customers")
+
+_seen_version = None
+_version_lock = threading.Lock()
+
+
+def sync(conn):
+    """比對資料版本，別的行程改過資料就清空本行程快取
+
+    request 內只查一次版本；request 外（CLI、批次）每次呼叫都查。
+    """
+    global _seen_version
+    if has_app_context():
+        if g.get("cache_synced"):
+            return
+        g.cache_synced = True
+    try:
+        row = conn.execute("SELECT version FROM cache_version WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        row = None  # 尚未 init_db：無法確認版本，就不沿用快取
+    version = row[0] if row else None
+    with _version_lock:
+        if version is None or version != _seen_version:
+            invalidate()
+            _seen_version = version
+
+
+def invalidate(device_id=None):
+    """寫入後呼叫：清掉該設備（或全部）的契約與客戶快取"""
+    contracts.invalidate(device_id)
+    customers.invalidate(device_id)
+
+
+def stats():
+    return {c.name: dict(c.stats, size=len(c), maxsize=c.maxsize, ttl=c.ttl) for c in (contracts, customers)}
@@ -1,32 +1,23 @@
 import sqlite3
 
+import migrations
+
 conn = sqlite3.connect("billing.db")
 c = conn.cursor()
 
-# 建立表格（如果不存在）
-c.execute("""CREATE TABLE IF NOT EXISTS contracts (
-    device_id TEXT PRIMARY KEY,
-    monthly_rent REAL,
-    color_unit_price REAL,
-    bw_unit_price REAL,
-    color_giveaway INTEGER,
-    bw_giveaway INTEGER,
-    color_error_rate REAL,
-    bw_error_rate REAL,
-    color_basic INTEGER,
-    bw_basic INTEGER
-)""")
-
-c.execute("""CREATE TABLE IF NOT EXISTS meter_records (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    device_id TEXT,
-    month TEXT,
-    curr_color INTEGER,
-    curr_bw INTEGER
-)""")
+# 建立 / 升級表格
+migrations.migrate(conn)
 
 # 插入測試契約
-c.execute("INSERT OR REPLACE INTO contracts VALUES (?,?,?,?,?,?,?,?,?,?)", (
+# 已存在時只更新這些欄位（INSERT OR REPLACE 會先刪後插，contra 等其他欄位會被清掉）
+c.execute("""INSERT INTO contracts (device_id, monthly_rent, color_unit_price, bw_unit_price,
+    color_giveaway, bw_giveaway, color_error_rate, bw_error_rate, color_basic, bw_basic)
+    VALUES (?,?,?,?,?,?,?,?,?,?)
+    ON CONFLICT(device_id) DO UPDATE SET
+    monthly_rent = excluded.monthly_rent, color_unit_price = excluded.color_unit_price,
+    bw_unit_price = excluded.bw_unit_price, color_giveaway = excluded.color_giveaway,
+    bw_giveaway = excluded.bw_giveaway, color_error_rate = excluded.color_error_rate,
+    bw_error_rate = excluded.bw_error_rate, color_basic = excluded.color_basic, bw_basic = excluded.bw_basic""", (
     "DEV001", 1000, 3.0, 0.5, 50, 100, 0.02, 0.01, 200, 500
 ))
 
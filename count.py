@@ -1,6 +1,9 @@
 import tkinter as tk
 from tkinter import messagebox
 
+import billing
+from records import Contract
+
 
 class PrintBillingCalculatorApp:
     def __init__(self, root):
@@ -60,47 +63,27 @@ class PrintBillingCalculatorApp:
             curr_bw = int(self.entries["本月黑白"].get())
             prev_bw = int(self.entries["前次黑白"].get())
 
-            # 計算
-            color_pages = curr_color - prev_color
-            bw_pages = curr_bw - prev_bw
-
-            color_after_error = max(0, color_pages - int(color_pages * color_error_rate))
-            bw_after_error = max(0, bw_pages - int(bw_pages * bw_error_rate))
-
-            color_after_giveaway = max(0, color_after_error - color_giveaway)
-            bw_after_giveaway = max(0, bw_after_error - bw_giveaway)
-
-            color_charge_pages = max(0, color_after_giveaway - color_basic)
-            bw_charge_pages = max(0, bw_after_giveaway - bw_basic)
-
-            color_amount = color_charge_pages * color_unit_price
-            bw_amount = bw_charge_pages * bw_unit_price
-            subtotal = monthly_rent + color_amount + bw_amount
-
-            # 稅額與含稅計算
-            if self.tax_mode.get() == "untaxed":
-                tax = subtotal * tax_rate
-                total = subtotal + tax
-                calc_mode = "未稅 → 含稅"
-            else:  # 含稅條件計算
-                total = subtotal
-                subtotal = subtotal / (1 + tax_rate)
-                tax = total - subtotal
-                calc_mode = "含稅 → 未稅拆分"
+            # 計算（與網頁、批次計費共用 billing.calculate）
+            contract = Contract(
+                device_id="",
+                monthly_rent=monthly_rent,
+                color_unit_price=color_unit_price,
+                bw_unit_price=bw_unit_price,
+                color_giveaway=color_giveaway,
+                bw_giveaway=bw_giveaway,
+                color_error_rate=color_error_rate,
+                bw_error_rate=bw_error_rate,
+                color_basic=color_basic,
+                bw_basic=bw_basic,
+                tax_type="未稅" if self.tax_mode.get() == "untaxed" else "含稅",
+            )
+            values = billing.calculate(contract, curr_color, curr_bw, prev_color, prev_bw, tax_rate=tax_rate)
+            calc_mode = "未稅 → 含稅" if self.tax_mode.get() == "untaxed" else "含稅 → 未稅拆分"
 
             # 結果輸出
-            result = (
-                f"計算模式: {calc_mode}\n\n"
-                f"彩色列印量: {color_pages}\n"
-                f"黑白列印量: {bw_pages}\n"
-                f"彩色收費張數: {color_charge_pages}\n"
-                f"黑白收費張數: {bw_charge_pages}\n"
-                f"彩色金額: {color_amount:.2f}\n"
-                f"黑白金額: {bw_amount:.2f}\n"
-                f"月租金: {monthly_rent:.2f}\n"
-                f"未稅金額: {subtotal:.2f}\n"
-                f"稅額: {tax:.2f}\n"
-                f"含稅總額: {total:.2f}"
+            result = f"計算模式: {calc_mode}\n\n" + "\n".join(
+                f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}"
+                for key, value in values.items()
             )
 
             messagebox.showinfo("計算結果", result)
@@ -1,65 +1,62 @@
 import sqlite3
 
+import migrations
+
 conn = sqlite3.connect("billing.db")
 c = conn.cursor()
 
-# --- 建立 contracts 表（若尚未建立），新增 tax_type 欄位 ---
-c.execute("""
-CREATE TABLE IF NOT EXISTS contracts (
-    device_id TEXT PRIMARY KEY,
-    monthly_rent REAL,
-    color_unit_price REAL,
-    bw_unit_price REAL,
-    color_giveaway INTEGER,
-    bw_giveaway INTEGER,
-    color_error_rate REAL,
-    bw_error_rate REAL,
-    color_basic INTEGER,
-    bw_basic INTEGER,
-    tax_type TEXT DEFAULT '含稅'  -- 新增稅別欄位
-)
-""")
+# --- 建立 / 升級資料表（contracts 已含 tax_type 與 contra）---
+migrations.migrate(conn)
 
-# --- 建立 customers 表 ---
-c.execute("""
-CREATE TABLE IF NOT EXISTS customers (
-    device_id TEXT PRIMARY KEY,
-    customer_name TEXT,
-    device_number TEXT,
-    machine_model TEXT,
-    tax_id TEXT,
-    install_address TEXT,
-    service_person TEXT,
-    contract_number TEXT,
-    contract_start TEXT,
-    contract_end TEXT
-)
-""")
+# 重跑時用 UPSERT 更新，不用 INSERT OR REPLACE：REPLACE 先刪後插，contracts 的 contra 會被清掉，
+# customers 的舊列不經 delete trigger 就被刪除，customers_fts 會留下過時的索引
 
 # --- 契約資料 (加入 tax_type) ---
 c.execute("""
-INSERT OR REPLACE INTO contracts VALUES (
+INSERT INTO contracts (device_id, monthly_rent, color_unit_price, bw_unit_price,
+    color_giveaway, bw_giveaway, color_error_rate, bw_error_rate, color_basic, bw_basic, tax_type) VALUES (
     'DEV001', 1000, 3.0, 0.5, 50, 100, 0.02, 0.01, 200, 500, '含稅'
-)
+) ON CONFLICT(device_id) DO UPDATE SET
+    monthly_rent = excluded.monthly_rent, color_unit_price = excluded.color_unit_price,
+    bw_unit_price = excluded.bw_unit_price, color_giveaway = excluded.color_giveaway,
+    bw_giveaway = excluded.bw_giveaway, color_error_rate = excluded.color_error_rate,
+    bw_error_rate = excluded.bw_error_rate, color_basic = excluded.color_basic, bw_basic = excluded.bw_basic,
+    tax_type = excluded.tax_type
 """)
 c.execute("""
-INSERT OR REPLACE INTO contracts VALUES (
+INSERT INTO contracts (device_id, monthly_rent, color_unit_price, bw_unit_price,
+    color_giveaway, bw_giveaway, color_error_rate, bw_error_rate, color_basic, bw_basic, tax_type) VALUES (
     'DEV002', 1500, 2.8, 0.6, 80, 200, 0.015, 0.02, 300, 600, '未稅'
-)
+) ON CONFLICT(device_id) DO UPDATE SET
+    monthly_rent = excluded.monthly_rent, color_unit_price = excluded.color_unit_price,
+    bw_unit_price = excluded.bw_unit_price, color_giveaway = excluded.color_giveaway,
+    bw_giveaway = excluded.bw_giveaway, color_error_rate = excluded.color_error_rate,
+    bw_error_rate = excluded.bw_error_rate, color_basic = excluded.color_basic, bw_basic = excluded.bw_basic,
+    tax_type = excluded.tax_type
 """)
 
 # --- 客戶資料 ---
 c.execute("""
-INSERT OR REPLACE INTO customers VALUES (
+INSERT INTO customers (device_id, customer_name, device_number, machine_model, tax_id,
+    install_address, service_person, contract_number, contract_start, contract_end) VALUES (
     'DEV001', '張三有限公司', 'A12345', 'Canon iR-ADV', '12345678',
     '台北市信義區信義路1號', '王小明', 'C001', '2024/01/01', '2025/12/31'
-)
+) ON CONFLICT(device_id) DO UPDATE SET
+    customer_name = excluded.customer_name, device_number = excluded.device_number,
+    machine_model = excluded.machine_model, tax_id = excluded.tax_id, install_address = excluded.install_address,
+    service_person = excluded.service_person, contract_number = excluded.contract_number,
+    contract_start = excluded.contract_start, contract_end = excluded.contract_end
 """)
 c.execute("""
-INSERT OR REPLACE INTO customers VALUES (
+INSERT INTO customers (device_id, customer_name, device_number, machine_model, tax_id,
+    install_address, service_person, contract_number, contract_start, contract_end) VALUES (
     'DEV002', '李四企業', 'B67890', 'Ricoh MP C4504', '87654321',
     '台北市大安區復興南路2號', '陳小華', 'C002', '2024/03/01', '2026/02/28'
-)
+) ON CONFLICT(device_id) DO UPDATE SET
+    customer_name = excluded.customer_name, device_number = excluded.device_number,
+    machine_model = excluded.machine_model, tax_id = excluded.tax_id, install_address = excluded.install_address,
+    service_person = excluded.service_person, contract_number = excluded.contract_number,
+    contract_start = excluded.contract_start, contract_end = excluded.contract_end
 """)
 
 conn.commit()
@@ -0,0 +1,115 @@
+# db.py — 共用 SQLite 連線層（連線池 + 每個 request 共用一條連線）
+import os
+import queue
+import sqlite3
+import threading
+
+from flask import g, has_app_context
+
+import metrics
+
+DB_FILE = os.environ.get("BILLING_DB", "billing.db")
+POOL_SIZE = int(os.environ.get("BILLING_DB_POOL", "4"))
+
+# 每條新連線都會套用的 PRAGMA
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA temp_store=MEMORY",
+)
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+_pool_file = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+# 連線統計（每個 worker process 各自一份）
+stats = {"opened": 0, "reused": 0, "closed": 0}
+
+
+def _connect(db_file):
+    """建立一條新連線並套用 PRAGMA"""
+    factory = metrics.TimedConnection if metrics.ENABLED else sqlite3.Connection  # 未啟用時零成本
+    conn = sqlite3.connect(db_file, timeout=5, check_same_thread=False, factory=factory)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    with _pool_lock:
+        stats["opened"] += 1
+    return conn
+
+
+def _drain_pool():
+    while True:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            return
+        conn.close()
+        with _pool_lock:
+            stats["closed"] += 1
+
+
+def acquire():
+    """從連線池取出一條連線，池內沒有時才開新連線"""
+    global _pool_file
+    if _pool_file != DB_FILE:
+        # DB_FILE 被改掉（例如測試換成暫存檔），舊連線全部作廢
+        _drain_pool()
+        _pool_file = DB_FILE
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        return _connect(DB_FILE)
+    with _pool_lock:
+        stats["reused"] += 1
+    return conn
+
+
+def release(conn):
+    """把連線還回連線池；未完成的交易一律 rollback，池滿就關閉"""
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+        with _pool_lock:
+            stats["closed"] += 1
+
+
+def get_db():
+    """取得目前的連線：request 內共用同一條，request 外則每個 thread 一條"""
+    if has_app_context():
+        if "db_conn" not in g:
+            g.db_conn = acquire()
+            g.db_connections = g.get("db_connections", 0) + 1
+        return g.db_conn
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.db_file != DB_FILE:
+        conn = _local.conn = _connect(DB_FILE)
+        _local.db_file = DB_FILE
+    return conn
+
+
+def close_db(exc=None):
+    """teardown：把本次 request 的連線還回連線池"""
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        release(conn)
+
+
+def request_connection_count():
+    """本次 request 取用過幾次連線（正常情況應 <= 1）"""
+    return g.get("db_connections", 0)
+
+
+def _connection_header(response):
+    response.headers["X-DB-Connections"] = str(request_connection_count())
+    return response
+
+
+def init_app(app):
+    app.after_request(_connection_header)
+    app.teardown_appcontext(close_db)
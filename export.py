@@ -0,0 +1,161 @@
+# export.py — 匯出 usage / contracts / customers / bills 到 xlsx 或 CSV（逐批讀寫，記憶體用量與資料量無關）
+#
+#   python export.py usage bills --from 2025-01-01 --to 2025-06-30 -o history.xlsx
+#   python export.py usage --device T251000029 --format csv -o usage.csv
+#
+# 網頁：GET /api/v1/export/usage.csv?from=2025-01-01&to=2025-06-30&device_id=T251000029
+#       GET /api/v1/export/history.xlsx?tables=usage,bills&from=...
+# CSV 邊查邊送；xlsx 以 write_only 寫到暫存檔（openpyxl 無法直接寫進串流）後分塊送出。
+import argparse
+import csv
+import io
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import db
+import xlsx_stream
+from billing import BILL_COLUMNS
+
+FETCH_ROWS = 2000        # 每次從資料庫取出的列數
+CSV_CHUNK_BYTES = 64 * 1024
+FILE_CHUNK_BYTES = 256 * 1024
+
+# 資料表 -> (欄位, 日期篩選欄位, 日期篩選方式)
+#   timestamp：usage.timestamp（YYYY/MM/DD-HH:MM）；month：YYYYMM
+TABLES = {
+    "usage": (("id", "device_id", "month", "color_count", "bw_count", "timestamp"), "timestamp", "timestamp"),
+    "contracts": (("device_id", "monthly_rent", "color_unit_price", "bw_unit_price",
+                   "color_giveaway", "bw_giveaway", "color_error_rate", "bw_error_rate",
+                   "color_basic", "bw_basic", "tax_type", "contra"), None, None),
+    "customers": (("device_id", "customer_name", "device_number", "machine_model", "tax_id",
+                   "install_address", "service_person", "contract_number", "contract_start",
+                   "contract_end"), None, None),
+    "bills": (BILL_COLUMNS, "month", "month"),
+}
+
+ORDER_BY = {"usage": "id", "bills": "month, device_id"}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_date(value):
+    """YYYY-MM-DD / YYYY/MM/DD / YYYYMMDD 轉 date；空值回傳 None"""
+    if not value:
+        return None
+    for fmt in ("%Y-%m-%d", "%Y/%m/%d", "%Y%m%d"):
+        try:
+            return datetime.strptime(value.strip(), fmt).date()
+        except ValueError:
+            pass
+    raise ExportError(f"無法辨識的日期：{value!r}（格式 YYYY-MM-DD）")
+
+
+def query(table, start=None, end=None, device_ids=None):
+    """組出 (SQL, 參數)；start / end 為 date（含兩端）"""
+    if table not in TABLES:
+        raise ExportError(f"未知的資料表：{table}（可用：{', '.join(TABLES)}）")
+    columns, date_col, mode = TABLES[table]
+    where, params = [], []
+    if device_ids:
+        where.append(f"device_id IN ({', '.join('?' * len(device_ids))})")
+        params.extend(device_ids)
+    if date_col and start:
+        where.append(f"{date_col} >= ?")
+        params.append(start.strftime("%Y/%m/%d") if mode == "timestamp" else start.strftime("%Y%m"))
+    if date_col and end:
+        if mode == "timestamp":
+            where.append(f"{date_col} < ?")
+            params.append((end + timedelta(days=1)).strftime("%Y/%m/%d"))
+        else:
+            where.append(f"{date_col} <= ?")
+            params.append(end.strftime("%Y%m"))
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + f" ORDER BY {ORDER_BY.get(table, 'device_id')}", params
+
+
+def iter_rows(conn, table, start=None, end=None, device_ids=None):
+    """先產生欄名，再逐批產生資料列"""
+    sql, params = query(table, start, end, device_ids)
+    yield TABLES[table][0]
+    cursor = conn.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(FETCH_ROWS)
+        if not rows:
+            return
+        yield from rows
+
+
+def iter_csv(rows):
+    """rows 轉成 CSV bytes 分塊（UTF-8 BOM，Excel 直接開不會亂碼）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CSV_CHUNK_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def write_xlsx(path, conn, tables, start=None, end=None, device_ids=None):
+    """每個資料表一個工作表，回傳 {資料表: 列數（不含欄名）}"""
+    counts = xlsx_stream.write_sheets(path, [(t, iter_rows(conn, t, start, end, device_ids)) for t in tables])
+    return {t: n - 1 for t, n in counts.items()}
+
+
+def iter_xlsx(conn, tables, start=None, end=None, device_ids=None):
+    """xlsx 寫到暫存檔後分塊讀出（送完即刪除）"""
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        write_xlsx(path, conn, tables, start, end, device_ids)
+        with open(path, "rb") as f:
+            while chunk := f.read(FILE_CHUNK_BYTES):
+                yield chunk
+    finally:
+        os.unlink(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="匯出抄表 / 契約 / 客戶 / 帳單")
+    parser.add_argument("tables", nargs="+", choices=sorted(TABLES))
+    parser.add_argument("-o", "--output", required=True, help="輸出檔（.xlsx 或 .csv）")
+    parser.add_argument("--format", choices=("xlsx", "csv"), help="預設依副檔名")
+    parser.add_argument("--from", dest="start", help="起始日期 YYYY-MM-DD（usage 依抄表時間，bills 依月份）")
+    parser.add_argument("--to", dest="end", help="結束日期 YYYY-MM-DD（含）")
+    parser.add_argument("--device", action="append", help="設備編號，可重複")
+    parser.add_argument("--db", default=db.DB_FILE, help="資料庫檔案")
+    args = parser.parse_args(argv)
+
+    db.DB_FILE = args.db
+    conn = db.get_db()
+    fmt = args.format or ("csv" if args.output.lower().endswith(".csv") else "xlsx")
+    try:
+        start, end = parse_date(args.start), parse_date(args.end)
+        if fmt == "csv":
+            if len(args.tables) != 1:
+                raise ExportError("CSV 一次只能匯出一個資料表")
+            with open(args.output, "wb") as f:
+                for chunk in iter_csv(iter_rows(conn, args.tables[0], start, end, args.device)):
+                    f.write(chunk)
+        else:
+            for table, n in write_xlsx(args.output, conn, args.tables, start, end, args.device).items():
+                print(f"  {table}: {n:,} 列")
+    except ExportError as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ 已匯出 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+# fleet.py — 產生測試用的模擬機隊：N 台設備、M 個月的抄表，以及對應的 xlsx（匯入檔、原始資料憑單）
+#
+#   python fleet.py --devices 10000 --months 36 --out bench_data
+#
+# 產生 bench_data/billing.db、bench_data/import_data.xlsx、bench_data/原始資料.xlsx；
+# 同一個 seed 每次產生的資料都相同，效能數字才能前後比較。不會動到專案目錄的 billing.db。
+import argparse
+import importlib
+import os
+import random
+import sys
+from itertools import chain
+
+import db
+from records import Contract
+
+SERVICE_PEOPLE = ("湯家瑋", "吳宗鴻", "狄澤洋", "王小明", "陳美玲", "林志豪", "張雅婷", "李建宏")
+MODELS = ("eS-2510AC", "eS-3525AC", "eS-5525AC", "e-STUDIO2018A", "e-STUDIO3018A", "MX-3051")
+AREAS = ("台北市士林區", "台北市內湖區", "新北市板橋區", "新北市新莊區", "桃園市中壢區", "台中市西屯區")
+CONTRACT_TERMS = (  # (月租, 彩色單價, 黑白單價, 彩色贈送, 黑白贈送, 稅別)
+    (2000, 3.0, 0.3, 0, 1500, "含稅"),
+    (6800, 3.0, 0.3, 900, 15700, "未稅"),
+    (0, 2.4, 0.24, 0, 0, "含稅"),
+    (11600, 3.0, 0.3, 900, 15700, "未稅"),
+    (3500, 3.5, 0.35, 100, 3000, "含稅"),
+)
+
+
+def device_ids(n):
+    return [f"T2{i:08d}" for i in range(n)]
+
+
+def customer_rows(n, seed=1):
+    """customers 的列（欄位順序同 import.REQUIRED_CUSTOMERS）；約 3 台設備一個客戶"""
+    rnd = random.Random(seed)
+    for i, d in enumerate(device_ids(n)):
+        c = i // 3
+        yield (d, f"測試客戶{c}有限公司", f"CN{i:06d}", rnd.choice(MODELS) + "彩色複合機", f"{c:08d}",
+               f"{rnd.choice(AREAS)}測試路{c}號", rnd.choice(SERVICE_PEOPLE), f"02700{i:05d}",
+               "2024/01/01", "2026/12/31")
+
+
+def contract_rows(n, seed=1):
+    """contracts 的列（欄位順序同 import.REQUIRED_CONTRACTS）"""
+    rnd = random.Random(seed + 1)
+    for d in device_ids(n):
+        rent, color_price, bw_price, color_give, bw_give, tax_type = rnd.choice(CONTRACT_TERMS)
+        yield (d, rent, color_price, bw_price, color_give, bw_give,
+               rnd.choice((0, 0, 0.02)), rnd.choice((0, 0, 0.03)), rnd.choice((0, 0, 200)), 0, tax_type,
+               f"月租金${rent:,}元,含黑白{bw_give:,}張,超張{bw_price}元;彩色{color_price}元.")
+
+
+def usage_rows(ids, n_months, seed=1, start_year=2023):
+    """逐月產生 usage 的列 (device_id, month, color_count, bw_count, timestamp)，每月一批"""
+    rnd = random.Random(seed + 2)
+    color = dict.fromkeys(ids, 0)
+    bw = dict.fromkeys(ids, 0)
+    for m in range(n_months):
+        month = f"{start_year + m // 12}{m % 12 + 1:02d}"
+        batch = []
+        for d in ids:
+            color[d] += rnd.randint(0, 800)
+            bw[d] += rnd.randint(0, 5000)
+            batch.append((d, month, color[d], bw[d], f"{month[:4]}/{month[4:]}/{rnd.randint(1, 28):02d}-10:00"))
+        yield batch
+
+
+def random_cases(n, seed=0):
+    """計費用的隨機案例 n 筆 (contract, curr_color, curr_bw, last_color, last_bw)
+
+    刻意混入 .5 邊界（999.995 元月租、0.125 單價 / 誤印率…）與倒退的讀數（本次 < 前次），
+    test_billing.py 拿來比對 calculate() 與 calculate_batch()，benchmarks.py 拿來量計費速度。
+    """
+    rnd = random.Random(seed)
+    prices = [0, 0.3, 0.35, 0.5, 1, 2.5, 3, 3.5, 0.045, 0.125, 1 / 3, 0.00005, 12.34565]
+    rates = [0, 0.01, 0.02, 0.05, 0.1, 0.125, 0.5, 1 / 3, 0.00015, 1]
+    cases = []
+    for i in range(n):
+        def pick(choices, lo, hi, places):
+            return rnd.choice(choices) if rnd.random() < 0.6 else round(rnd.uniform(lo, hi), places)
+
+        contract = Contract(
+            device_id=f"D{i:07d}",
+            monthly_rent=pick([0, 1000, 2000, 6800, 1234.5, 999.995], 0, 20000, rnd.choice([0, 1, 2, 3])),
+            color_unit_price=pick(prices, 0, 10, rnd.choice([2, 4, 6])),
+            bw_unit_price=pick(prices, 0, 2, rnd.choice([2, 4, 6])),
+            color_giveaway=rnd.choice([0, 0, 50, 100, 500, rnd.randint(0, 3000)]),
+            bw_giveaway=rnd.choice([0, 0, 100, 1500, rnd.randint(0, 20000)]),
+            color_error_rate=pick(rates, 0, 0.2, rnd.choice([2, 4, 6])),
+            bw_error_rate=pick(rates, 0, 0.2, rnd.choice([2, 4, 6])),
+            color_basic=rnd.choice([0, 0, 0, 100, 200, rnd.randint(0, 3000)]),
+            bw_basic=rnd.choice([0, 0, 0, 500, 1000, rnd.randint(0, 20000)]),
+            tax_type=rnd.choice(["含稅", "未稅"]),
+        )
+        last_color, last_bw = rnd.randint(0, 10 ** 6), rnd.randint(0, 10 ** 7)
+        curr_color = last_color + rnd.choice([0, 1, 2, 10, rnd.randint(-50, 5000), rnd.randint(0, 10 ** 5)])
+        curr_bw = last_bw + rnd.choice([0, 1, 2, 10, rnd.randint(-50, 50000), rnd.randint(0, 10 ** 6)])
+        cases.append((contract, curr_color, curr_bw, last_color, last_bw))
+    return cases
+
+
+def build_db(path, n_devices=1000, n_months=36, seed=1):
+    """建立 billing.db（app.init_db 的完整結構）並寫入模擬機隊，回傳設備編號"""
+    import app
+    importer = importlib.import_module("import")
+
+    db.DB_FILE = path
+    app.init_db()
+    conn = db.get_db()
+    with conn:
+        conn.executemany(f"INSERT INTO customers ({', '.join(importer.REQUIRED_CUSTOMERS)}) "
+                         f"VALUES ({', '.join('?' * len(importer.REQUIRED_CUSTOMERS))})",
+                         customer_rows(n_devices, seed))
+        conn.executemany(f"INSERT INTO contracts ({', '.join(importer.REQUIRED_CONTRACTS)}) "
+                         f"VALUES ({', '.join('?' * len(importer.REQUIRED_CONTRACTS))})",
+                         contract_rows(n_devices, seed))
+        ids = device_ids(n_devices)
+        for batch in usage_rows(ids, n_months, seed):
+            conn.executemany(
+                "INSERT INTO usage (device_id, month, color_count, bw_count, timestamp) VALUES (?, ?, ?, ?, ?)",
+                batch)
+    return ids
+
+
+def write_import_workbook(path, n_devices, seed=1):
+    """import.py 用的 xlsx（customers + contracts 兩張工作表）"""
+    import xlsx_stream
+    importer = importlib.import_module("import")
+
+    return xlsx_stream.write_sheets(path, [
+        ("customers", chain([importer.REQUIRED_CUSTOMERS], customer_rows(n_devices, seed))),
+        ("contracts", chain([importer.REQUIRED_CONTRACTS], contract_rows(n_devices, seed))),
+    ])
+
+
+def slip_rows(n_devices, seed=1):
+    """仿「原始資料.xlsx」的營業收入憑單：每台設備一段，含 T2 列、設備號碼、合約期限與其後兩列"""
+    rnd = random.Random(seed + 3)
+    for i, (customer, contract) in enumerate(zip(customer_rows(n_devices, seed), contract_rows(n_devices, seed))):
+        d = customer[0]
+        yield ("TG營業収入憑單",)
+        yield ("部門編號 部門名稱 人員編號 人員名稱 建檔日期 契約編號 合約書編號 頁次",)
+        yield (f"T2-TJ{i % 50:02d} 新北勤務一部 {8000 + i % 900} {customer[6]} {customer[7]} 1",)
+        yield ("客戶",)
+        yield (f"名稱 {customer[1]} 統一編號 {customer[4]}",)
+        yield (f"裝機地址 {customer[5]} 機號 CSCP{rnd.randint(10000, 99999)}",)
+        yield (f"設備號碼 {d}",)
+        yield ("収費條件",)
+        yield (contract[-1],)
+        yield (f"合約期限 {customer[8]} ~ {customer[9]}",)
+        yield (f"機型 {customer[3]}",)
+        yield (f"聯絡人 測試{i}",)
+        for _ in range(rnd.randint(2, 8)):
+            yield (f"彩小:{rnd.randint(0, 3000)}",)
+            yield (f"黑白:{rnd.randint(0, 40000)}",)
+
+
+def write_slip_workbook(path, n_devices, seed=1):
+    """app3.py 篩選用的原始資料 xlsx（單一工作表、單欄）"""
+    import xlsx_stream
+
+    return xlsx_stream.write_rows(path, slip_rows(n_devices, seed))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="產生模擬機隊（資料庫 + xlsx）")
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--months", type=int, default=36)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="bench_data", help="輸出資料夾")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, "billing.db")
+    if os.path.abspath(path) == os.path.abspath(db.DB_FILE):
+        print("❌ 不可覆蓋正式的 billing.db，請指定其他 --out 資料夾")
+        return 1
+    if os.path.exists(path):
+        os.remove(path)
+    build_db(path, args.devices, args.months, args.seed)
+    write_import_workbook(os.path.join(args.out, "import_data.xlsx"), args.devices, args.seed)
+    rows = write_slip_workbook(os.path.join(args.out, "原始資料.xlsx"), args.devices, args.seed)
+    print(f"✅ {args.devices:,} 台設備 × {args.months} 個月 → {args.out}（原始資料 {rows:,} 列）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
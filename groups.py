@@ -0,0 +1,221 @@
+# groups.py — 合併計算的契約群組：多台設備的用量加總，共用一份贈送 / 基本張數與單價
+#
+#   python groups.py set 板橋台中 T251000029 T251000030 --color-price 3 --bw-price 0.3 \
+#          --color-giveaway 900 --bw-giveaway 600 --tax-type 未稅
+#   python groups.py bill --month 202510           # 全部群組計費，寫入 group_bills
+#   python groups.py show 板橋台中 --month 202510
+#
+# 例：設備資料.txt 的「板橋+台中張數合併計算」— :235+562+362-900-600=0
+# 成員設備的用量在同一個 GROUP BY 查詢裡加總，再以群組契約呼叫 billing.calculate()。
+# 群組的月租 / 單價記在群組上；成員不另開個別帳單（billing 的月結與即時計費都會略過群組成員）。
+import argparse
+import json
+import sys
+from datetime import datetime
+
+import db
+from billing import RESULT_KEYS, calculate
+from records import Contract
+
+CONTRACT_COLUMNS = (
+    "monthly_rent", "color_unit_price", "bw_unit_price",
+    "color_giveaway", "bw_giveaway", "color_error_rate", "bw_error_rate",
+    "color_basic", "bw_basic", "tax_type"
+)
+
+GROUPS_SQL = """
+    CREATE TABLE IF NOT EXISTS contract_groups (
+        group_id TEXT PRIMARY KEY,
+        name TEXT,
+        monthly_rent REAL DEFAULT 0,
+        color_unit_price REAL DEFAULT 0,
+        bw_unit_price REAL DEFAULT 0,
+        color_giveaway INTEGER DEFAULT 0,
+        bw_giveaway INTEGER DEFAULT 0,
+        color_error_rate REAL DEFAULT 0,
+        bw_error_rate REAL DEFAULT 0,
+        color_basic INTEGER DEFAULT 0,
+        bw_basic INTEGER DEFAULT 0,
+        tax_type TEXT DEFAULT '含稅'
+    );
+    CREATE TABLE IF NOT EXISTS contract_group_members (
+        group_id TEXT NOT NULL,
+        device_id TEXT NOT NULL,
+        PRIMARY KEY (group_id, device_id)
+    ) WITHOUT ROWID;
+    -- 一台設備只屬於一個群組；也用來由設備找群組
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_group_members_device ON contract_group_members (device_id);
+    CREATE TABLE IF NOT EXISTS group_bills (
+        group_id TEXT,
+        month TEXT,
+        devices INTEGER,
+        used_color INTEGER,
+        used_bw INTEGER,
+        bill_color INTEGER,
+        bill_bw INTEGER,
+        color_amount REAL,
+        bw_amount REAL,
+        monthly_rent REAL,
+        untaxed INTEGER,
+        tax INTEGER,
+        total INTEGER,
+        created_at TEXT,
+        PRIMARY KEY (group_id, month)
+    );
+"""
+
+# 各群組在 :month 的合併用量：成員各自 (本月最後一筆 - 前一筆)，本月沒抄表的成員算 0
+GROUP_USAGE_SQL = f"""
+    WITH r AS (
+        SELECT device_id, month, color_count, bw_count,
+               ROW_NUMBER() OVER (PARTITION BY device_id ORDER BY id DESC) AS rn
+        FROM usage
+        WHERE month <= :month
+          AND device_id IN (SELECT device_id FROM contract_group_members
+                            WHERE :group_id IS NULL OR group_id = :group_id)
+    ), d AS (
+        SELECT device_id,
+               MAX(0, MAX(CASE WHEN rn = 1 THEN color_count END)
+                      - COALESCE(MAX(CASE WHEN rn = 2 THEN color_count END), 0)) AS used_color,
+               MAX(0, MAX(CASE WHEN rn = 1 THEN bw_count END)
+                      - COALESCE(MAX(CASE WHEN rn = 2 THEN bw_count END), 0)) AS used_bw
+        FROM r
+        WHERE rn <= 2
+        GROUP BY device_id
+        HAVING MAX(CASE WHEN rn = 1 THEN month END) = :month
+    )
+    SELECT g.group_id, {", ".join("g." + col for col in CONTRACT_COLUMNS)},
+           COUNT(d.device_id), COALESCE(SUM(d.used_color), 0), COALESCE(SUM(d.used_bw), 0)
+    FROM contract_groups g
+    JOIN contract_group_members m ON m.group_id = g.group_id
+    LEFT JOIN d ON d.device_id = m.device_id
+    WHERE :group_id IS NULL OR g.group_id = :group_id
+    GROUP BY g.group_id
+"""
+
+GROUP_BILL_COLUMNS = (
+    "group_id", "month", "devices", "used_color", "used_bw", "bill_color", "bill_bw",
+    "color_amount", "bw_amount", "monthly_rent", "untaxed", "tax", "total", "created_at"
+)
+
+
+def init_db(conn=None):
+    """建表由 migrations 負責（已是最新版本時只檢查 user_version）"""
+    import migrations
+
+    migrations.migrate(conn or db.get_db())
+
+
+def set_group(conn, group_id, contract, device_ids, name=None):
+    """建立或更新群組契約並設定成員（成員原本屬於別的群組時移過來）"""
+    with conn:
+        conn.execute(f"""
+            INSERT INTO contract_groups (group_id, name, {", ".join(CONTRACT_COLUMNS)})
+            VALUES (?, ?, {", ".join("?" * len(CONTRACT_COLUMNS))})
+            ON CONFLICT(group_id) DO UPDATE SET name = excluded.name,
+                {", ".join(f"{col} = excluded.{col}" for col in CONTRACT_COLUMNS)}
+        """, (group_id, name or group_id, *(contract.get(col) for col in CONTRACT_COLUMNS)))
+        conn.execute("DELETE FROM contract_group_members WHERE group_id = ?", (group_id,))
+        conn.executemany("INSERT OR REPLACE INTO contract_group_members (group_id, device_id) VALUES (?, ?)",
+                         [(group_id, device_id) for device_id in device_ids])
+
+
+def group_of(conn, device_id):
+    row = conn.execute("SELECT group_id FROM contract_group_members WHERE device_id = ?", (device_id,)).fetchone()
+    return row[0] if row else None
+
+
+def members(conn, group_id):
+    return [row[0] for row in conn.execute(
+        "SELECT device_id FROM contract_group_members WHERE group_id = ? ORDER BY device_id", (group_id,))]
+
+
+def calculate_groups(conn, month, group_id=None, tax_rate=None):
+    """一次查詢算出各群組的合併帳單：{group_id: calculate() 結果 + 設備數}"""
+    n = len(CONTRACT_COLUMNS)
+    results = {}
+    for row in conn.execute(GROUP_USAGE_SQL, {"month": month, "group_id": group_id}):
+        contract = Contract(*row[:n + 1])  # group_id 放在 device_id 的位置
+        devices, used_color, used_bw = row[n + 1:]
+        kwargs = {} if tax_rate is None else {"tax_rate": tax_rate}
+        result = calculate(contract, used_color, used_bw, 0, 0, **kwargs)
+        result["設備數"] = devices
+        results[row[0]] = result
+    return results
+
+
+def write_group_bills(conn, month, results):
+    """同群組同月份重算時覆蓋（用 UPSERT，不用 REPLACE，report_monthly 的 trigger 才會扣掉舊值）"""
+    created_at = datetime.now().strftime("%Y/%m/%d-%H:%M")
+    with conn:
+        conn.executemany(f"""
+            INSERT INTO group_bills ({", ".join(GROUP_BILL_COLUMNS)})
+            VALUES ({", ".join("?" * len(GROUP_BILL_COLUMNS))})
+            ON CONFLICT(group_id, month) DO UPDATE SET
+                {", ".join(f"{col} = excluded.{col}" for col in GROUP_BILL_COLUMNS[2:])}
+        """, [(group_id, month, result["設備數"], *(result[key] for key in RESULT_KEYS), created_at)
+              for group_id, result in results.items()])
+
+
+def run_month(month=None, conn=None):
+    """全部群組的月結：計算並寫入 group_bills，回傳群組數"""
+    month = month or datetime.now().strftime("%Y%m")
+    conn = conn or db.get_db()
+    init_db(conn)
+    results = calculate_groups(conn, month)
+    write_group_bills(conn, month, results)
+    return len(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="合併計算的契約群組")
+    parser.add_argument("--db", default=db.DB_FILE, help="資料庫檔案")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("set", help="建立 / 更新群組與成員")
+    p.add_argument("group_id")
+    p.add_argument("device_ids", nargs="+")
+    p.add_argument("--name")
+    p.add_argument("--rent", type=float, default=0)
+    p.add_argument("--color-price", type=float, default=0)
+    p.add_argument("--bw-price", type=float, default=0)
+    p.add_argument("--color-giveaway", type=int, default=0)
+    p.add_argument("--bw-giveaway", type=int, default=0)
+    p.add_argument("--color-error-rate", type=float, default=0)
+    p.add_argument("--bw-error-rate", type=float, default=0)
+    p.add_argument("--color-basic", type=int, default=0)
+    p.add_argument("--bw-basic", type=int, default=0)
+    p.add_argument("--tax-type", choices=("含稅", "未稅"), default="含稅")
+    p = sub.add_parser("bill", help="全部群組月結，寫入 group_bills")
+    p.add_argument("--month", help="YYYYMM（預設本月）")
+    p = sub.add_parser("show", help="試算單一群組（不寫入）")
+    p.add_argument("group_id")
+    p.add_argument("--month", help="YYYYMM（預設本月）")
+    args = parser.parse_args(argv)
+
+    db.DB_FILE = args.db
+    conn = db.get_db()
+    init_db(conn)
+    if args.command == "set":
+        contract = {
+            "monthly_rent": args.rent, "color_unit_price": args.color_price, "bw_unit_price": args.bw_price,
+            "color_giveaway": args.color_giveaway, "bw_giveaway": args.bw_giveaway,
+            "color_error_rate": args.color_error_rate, "bw_error_rate": args.bw_error_rate,
+            "color_basic": args.color_basic, "bw_basic": args.bw_basic, "tax_type": args.tax_type,
+        }
+        set_group(conn, args.group_id, contract, args.device_ids, args.name)
+        print(f"✅ 群組 {args.group_id}：{len(args.device_ids)} 台設備")
+    elif args.command == "bill":
+        month = args.month or datetime.now().strftime("%Y%m")
+        print(f"✅ {month} 已計算 {run_month(month, conn)} 個群組")
+    else:
+        month = args.month or datetime.now().strftime("%Y%m")
+        result = calculate_groups(conn, month, args.group_id).get(args.group_id)
+        if result is None:
+            print(f"找不到群組 {args.group_id}")
+            return 1
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
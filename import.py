@@ -1,59 +1,41 @@
 # import_from_xlsx.py
 import sqlite3
+import time
+import numpy as np
 import pandas as pd
 import os
 
+import cache
+import migrations
+import xlsx_stream
+
 DB_FILE = "billing.db"
 EXCEL_FILE = "import_data.xlsx"
 
 
 def init_db():
-    """建立資料表（若不存在）— contracts 已包含 tax_type 欄位"""
+    """建立 / 升級資料表（與 app.py 共用 migrations，contracts 欄位順序一致）"""
     conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS contracts (
-        device_id TEXT PRIMARY KEY,
-        monthly_rent REAL,
-        contra TEXT,
-        color_unit_price REAL,
-        bw_unit_price REAL,
-        color_giveaway INTEGER,
-        bw_giveaway INTEGER,
-        color_error_rate REAL,
-        bw_error_rate REAL,
-        color_basic INTEGER,
-        bw_basic INTEGER,
-        tax_type TEXT DEFAULT '含稅'
-    )
-    """)
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS customers (
-        device_id TEXT PRIMARY KEY,
-        customer_name TEXT,
-        device_number TEXT,
-        machine_model TEXT,
-        tax_id TEXT,
-        install_address TEXT,
-        service_person TEXT,
-        contract_number TEXT,
-        contract_start TEXT,
-        contract_end TEXT
-    )
-    """)
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS usage (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        device_id TEXT,
-        month TEXT,
-        color_count INTEGER,
-        bw_count INTEGER,
-        timestamp TEXT
-    )
-    """)
-    conn.commit()
-    conn.close()
-    print("✅ DB tables ensured (contracts, customers, usage).")
+    try:
+        applied = migrations.migrate(conn)
+    finally:
+        conn.close()
+    print(f"✅ DB schema version {migrations.SCHEMA_VERSION}（本次升級 {applied} 步）.")
+
+
+_PLAIN_TYPES = (str, int, float)
+
+# 必要欄位
+REQUIRED_CUSTOMERS = [
+    "device_id", "customer_name", "device_number", "machine_model",
+    "tax_id", "install_address", "service_person",
+    "contract_number", "contract_start", "contract_end"
+]
+REQUIRED_CONTRACTS = [
+    "device_id", "monthly_rent", "color_unit_price", "bw_unit_price",
+    "color_giveaway", "bw_giveaway", "color_error_rate", "bw_error_rate",
+    "color_basic", "bw_basic", "tax_type", "contra"
+]
 
 
 def _norm_val(v):
@@ -70,133 +52,179 @@ def _norm_val(v):
         return None
 
 
-def import_excel_to_db(excel_file=EXCEL_FILE, replace_existing=True):
-    """從 Excel 匯入 customers + contracts 到 SQLite"""
+def _norm_column(series):
+    """整欄版 _norm_val：str/int/float 直接保留，其餘才逐格轉換"""
+    return [v if type(v) in _PLAIN_TYPES else _norm_val(v) for v in series.tolist()]
+
+
+def _to_float(v, default=0):
+    v = _norm_val(v)
+    if v in [None, ""]:
+        return default
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return default
+
+
+def _num_column(series, default=0):
+    """整欄轉 float；空白或無法轉換的值以 default 代替"""
+    values = series.tolist()
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.asarray([_to_float(v, default) for v in values], dtype=np.float64)
+
+
+def _customer_rows(df):
+    """customers 批次 → executemany 參數"""
+    return list(zip(*(_norm_column(df[col]) for col in REQUIRED_CUSTOMERS)))
+
+
+def _contract_rows(df):
+    """contracts 批次 → executemany 參數（數值欄空白或格式錯誤時為 0）"""
+    return list(zip(
+        _norm_column(df["device_id"]),
+        _num_column(df["monthly_rent"]).tolist(),
+        _num_column(df["color_unit_price"]).tolist(),
+        _num_column(df["bw_unit_price"]).tolist(),
+        _num_column(df["color_giveaway"]).astype(int).tolist(),
+        _num_column(df["bw_giveaway"]).astype(int).tolist(),
+        _num_column(df["color_error_rate"]).tolist(),
+        _num_column(df["bw_error_rate"]).tolist(),
+        _num_column(df["color_basic"]).astype(int).tolist(),
+        _num_column(df["bw_basic"]).astype(int).tolist(),
+        [str(v or "含稅") for v in _norm_column(df["tax_type"])],
+        [str(v or "") for v in _norm_column(df["contra"])],
+    ))
+
+
+def _check_columns(sheet, columns):
+    """欄位檢查；contracts 缺 tax_type 時回傳 True（由呼叫端補 '含稅'）"""
+    required = REQUIRED_CUSTOMERS if sheet == "customers" else REQUIRED_CONTRACTS
+    missing_tax_type = False
+    for col in required:
+        if col not in columns:
+            if sheet == "contracts" and col == "tax_type":
+                print("⚠️ contracts sheet 缺少 tax_type 欄位，將以 '含稅' 作為預設值。")
+                missing_tax_type = True
+            else:
+                raise ValueError(f"{sheet} sheet 缺少必要欄位: {col}")
+    return missing_tax_type
+
+
+def _read_batches(excel_file, sheet, stream, batch_size):
+    """產生已補齊欄位、NaN 轉空字串的 DataFrame 批次"""
+    if stream:
+        columns = xlsx_stream.read_header(excel_file, sheet)
+        batches = (pd.DataFrame(rows, columns=columns, dtype=object)
+                   for _, rows in xlsx_stream.iter_record_batches(excel_file, sheet, batch_size))
+    else:
+        df = pd.read_excel(excel_file, sheet_name=sheet, dtype=object)
+        columns = df.columns
+        batches = [df]
+
+    missing_tax_type = _check_columns(sheet, columns)
+    for df in batches:
+        if missing_tax_type:
+            df["tax_type"] = "含稅"
+        yield df.fillna("")
+
+
+def import_excel_to_db(excel_file=EXCEL_FILE, replace_existing=True, stream=False, batch_size=2000,
+                       commit_every=None, progress=None):
+    """從 Excel 匯入 customers + contracts 到 SQLite
+
+    stream=True 時以 openpyxl read_only 逐批讀取、逐批寫入，記憶體用量不隨檔案大小成長。
+    commit_every 為 None 時整份一個交易；設定列數時每寫滿這麼多列就 commit 一次，
+    背景工作用它避免長時間佔住寫入鎖。progress(已處理列數, 總列數) 在每次 commit 之後呼叫。
+    """
     if not os.path.isfile(excel_file):
         raise FileNotFoundError(f"找不到 {excel_file}，請放在同一資料夾或指定正確路徑。")
 
     print(f"📥 開始讀取 Excel：{excel_file}")
-    xls = pd.ExcelFile(excel_file)
-    sheet_names = xls.sheet_names
+    sheet_names = xlsx_stream.sheet_names(excel_file)
     if "customers" not in sheet_names or "contracts" not in sheet_names:
         raise ValueError("Excel 必須包含 sheet: 'customers' 與 'contracts'（大小寫相同）。")
 
-    df_customers = pd.read_excel(xls, sheet_name="customers", dtype=object)
-    df_contracts = pd.read_excel(xls, sheet_name="contracts", dtype=object)
-
-    # 必要欄位
-    required_customers = [
-        "device_id", "customer_name", "device_number", "machine_model",
-        "tax_id", "install_address", "service_person",
-        "contract_number", "contract_start", "contract_end"
-    ]
-    required_contracts = [
-        "device_id", "monthly_rent", "color_unit_price", "bw_unit_price",
-        "color_giveaway", "bw_giveaway", "color_error_rate", "bw_error_rate",
-        "color_basic", "bw_basic", "tax_type","contra"
-    ]
-
-    # 欄位檢查
-    for col in required_customers:
-        if col not in df_customers.columns:
-            raise ValueError(f"customers sheet 缺少必要欄位: {col}")
+    # replace_existing=True → UPSERT 覆蓋；False → 已存在的 device_id 略過
+    if replace_existing:
+        customer_conflict = "ON CONFLICT(device_id) DO UPDATE SET " + ", ".join(
+            f"{col}=excluded.{col}" for col in REQUIRED_CUSTOMERS[1:])
+        contract_conflict = "ON CONFLICT(device_id) DO UPDATE SET " + ", ".join(
+            f"{col}=excluded.{col}" for col in REQUIRED_CONTRACTS[1:])
+        verb = "INSERT"
+    else:
+        customer_conflict = contract_conflict = ""
+        verb = "INSERT OR IGNORE"
 
-    for col in required_contracts:
-        if col not in df_contracts.columns:
-            if col == "tax_type":
-                print("⚠️ contracts sheet 缺少 tax_type 欄位，將以 '含稅' 作為預設值。")
-                df_contracts["tax_type"] = "含稅"
-            else:
-                raise ValueError(f"contracts sheet 缺少必要欄位: {col}")
+    customer_sql = f"""
+        {verb} INTO customers (
+            device_id, customer_name, device_number, machine_model,
+            tax_id, install_address, service_person,
+            contract_number, contract_start, contract_end
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        {customer_conflict}
+    """
+    contract_sql = f"""
+        {verb} INTO contracts (
+            device_id, monthly_rent, color_unit_price, bw_unit_price,
+            color_giveaway, bw_giveaway, color_error_rate, bw_error_rate,
+            color_basic, bw_basic, tax_type, contra
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        {contract_conflict}
+    """
 
-    # 清理資料
-    df_customers = df_customers.fillna("")
-    df_contracts = df_contracts.fillna("")
+    t0 = time.perf_counter()
+    counts = {"customers": [0, 0], "contracts": [0, 0]}  # [新增/覆蓋, 跳過]
+    total = None
+    if progress:
+        sizes = [xlsx_stream.sheet_row_count(excel_file, sheet) for sheet in ("customers", "contracts")]
+        total = None if None in sizes else sum(sizes)
+    done = pending = 0
 
     conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-
-    # 匯入 customers
-    inserted_cust = 0
-    skipped_cust = 0
-    for _, row in df_customers.iterrows():
-        vals = tuple(_norm_val(row.get(col)) for col in required_customers)
-        try:
-            if replace_existing:
-                c.execute("""
-                    INSERT OR REPLACE INTO customers (
-                        device_id, customer_name, device_number, machine_model,
-                        tax_id, install_address, service_person,
-                        contract_number, contract_start, contract_end
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, vals)
-            else:
-                c.execute("""
-                    INSERT INTO customers (
-                        device_id, customer_name, device_number, machine_model,
-                        tax_id, install_address, service_person,
-                        contract_number, contract_start, contract_end
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, vals)
-            inserted_cust += 1
-        except sqlite3.IntegrityError:
-            skipped_cust += 1
-
-    # 匯入 contracts
-    inserted_cont = 0
-    skipped_cont = 0
-    for _, row in df_contracts.iterrows():
-        def num(col, default=0):
-            v = _norm_val(row.get(col))
-            if v in [None, ""]:
-                return default
-            try:
-                return float(v)
-            except:
-                return default
-
-        vals = (
-            _norm_val(row.get("device_id")),
-            num("monthly_rent", 0),
-            num("color_unit_price", 0),
-            num("bw_unit_price", 0),
-            int(num("color_giveaway", 0)),
-            int(num("bw_giveaway", 0)),
-            float(num("color_error_rate", 0)),
-            float(num("bw_error_rate", 0)),
-            int(num("color_basic", 0)),
-            int(num("bw_basic", 0)),
-            str(_norm_val(row.get("tax_type")) or "含稅"),
-            str(_norm_val(row.get("contra")) or "")
-        )
-
-        try:
-            if replace_existing:
-                c.execute("""
-                    INSERT OR REPLACE INTO contracts (
-                        device_id, monthly_rent, color_unit_price, bw_unit_price,
-                        color_giveaway, bw_giveaway, color_error_rate, bw_error_rate,
-                        color_basic, bw_basic, tax_type, contra
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,?)
-                """, vals)
-            else:
-                c.execute("""
-                    INSERT INTO contracts (
-                        device_id, monthly_rent, color_unit_price, bw_unit_price,
-                        color_giveaway, bw_giveaway, color_error_rate, bw_error_rate,
-                        color_basic, bw_basic, tax_type, contra
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,?)
-                """, vals)
-            inserted_cont += 1
-        except sqlite3.IntegrityError:
-            skipped_cont += 1
-
-    conn.commit()
-    conn.close()
+    try:
+        with conn:  # 單一交易（設定 commit_every 時分段 commit）
+            c = conn.cursor()
+            for sheet, sql, to_rows in (("customers", customer_sql, _customer_rows),
+                                        ("contracts", contract_sql, _contract_rows)):
+                for df in _read_batches(excel_file, sheet, stream, batch_size):
+                    rows = to_rows(df)
+                    c.executemany(sql, rows)
+                    # rowcount 不含 trigger（customers_fts / cache_version）寫入的列，total_changes 會算進去
+                    inserted = len(rows) if replace_existing else max(c.rowcount, 0)
+                    counts[sheet][0] += inserted
+                    counts[sheet][1] += len(rows) - inserted
+                    done += len(rows)
+                    pending += len(rows)
+                    if commit_every and pending >= commit_every:
+                        conn.commit()
+                        pending = 0
+                        if progress:
+                            progress(done, total)
+    finally:
+        conn.close()
+    if progress:
+        progress(done, done)
+    # 同一行程內的快取直接清掉；其他 worker 由 cache_version（trigger 遞增）得知資料已變
+    cache.invalidate()
+
+    (inserted_cust, skipped_cust), (inserted_cont, skipped_cont) = counts["customers"], counts["contracts"]
+    total_rows = inserted_cust + skipped_cust + inserted_cont + skipped_cont
+    elapsed = time.perf_counter() - t0
+    rows_per_sec = total_rows / elapsed if elapsed > 0 else 0.0
 
     print(f"✅ 匯入完成：customers 新增/覆蓋 {inserted_cust} 筆，contracts 新增/覆蓋 {inserted_cont} 筆。")
     if not replace_existing:
         print(f"（跳過已存在而未覆蓋：customers {skipped_cust} 筆，contracts {skipped_cont} 筆）")
+    print(f"⏱️ 讀取+寫入 {total_rows} 列，耗時 {elapsed:.3f} 秒（{rows_per_sec:,.0f} rows/s）")
+
+    return {
+        "inserted_customers": inserted_cust, "skipped_customers": skipped_cust,
+        "inserted_contracts": inserted_cont, "skipped_contracts": skipped_cont,
+        "rows_per_sec": rows_per_sec,
+    }
 
 
 def create_example_excel(filename="import_data.xlsx"):
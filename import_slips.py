@@ -0,0 +1,370 @@
+# import_slips.py — 解析 設備資料.txt 的營業収入憑單，回填 customers / contracts / usage
+import re
+import sqlite3
+import sys
+import time
+
+import cache
+
+DB_FILE = "billing.db"
+SLIP_FILE = "設備資料.txt"
+
+DATE_RE = re.compile(r"^(\d{4})/(\d{1,2})/(\d{1,2})$")
+METER_RE = re.compile(r"^(彩大|彩小|黑白):\s*(\d*)\s*$")
+INVOICE_RE = re.compile(r"^(?:(\d{9})\s+)?([\d,]+)\s+([\d,]+)\s+([\d,]+)\s+(\S+)")
+INVOICE_NO_RE = re.compile(r"^\d{9}$")
+DIGITS_RE = re.compile(r"^\d+$")
+
+# 收費條件（去除空白後）的解析規則
+RENT_RE = re.compile(r"租金?[^\d，,。;；]{0,5}?(\d[\d,]*)")
+BW_PAGES_RE = re.compile(r"黑白([\d,]+)張")
+COLOR_PAGES_RE = re.compile(r"彩色([\d,]+)張")
+FREE_PAGES_RE = re.compile(r"含[^，,。;；]*?([\d,]+)張")
+BW_PRICE_RE = re.compile(r"黑白(?:單張)?[：:]?(\d+(?:\.\d+)?)元")
+COLOR_PRICE_RE = re.compile(r"彩色(?:單張)?[：:]?(\d+(?:\.\d+)?)元")
+OVER_PRICE_RE = re.compile(r"(黑白|彩色)?[\d,]+張[,，]超張(\d+(?:\.\d+)?)元")
+SINGLE_PRICE_RE = re.compile(r"單張(\d+(?:\.\d+)?)元")
+ERROR_RATE_RE = re.compile(r"(\d+(?:\.\d+)?)%誤印率|誤印率(\d+(?:\.\d+)?)%")
+
+
+def read_lines(path):
+    """逐行讀取（憑單中夾雜 \\r，一併當作換行）"""
+    with open(path, encoding="utf-8") as f:
+        for raw in f:
+            for line in raw.split("\r"):
+                line = line.strip()
+                if line:
+                    yield line
+
+
+def _num(text, cast=float):
+    return cast(text.replace(",", "")) if text else cast(0)
+
+
+def parse_terms(text):
+    """從收費條件文字推算契約欄位（找不到的欄位為 0）"""
+    t = text.replace(" ", "")
+    terms = {
+        "monthly_rent": 0.0, "color_unit_price": 0.0, "bw_unit_price": 0.0,
+        "color_giveaway": 0, "bw_giveaway": 0,
+        "color_error_rate": 0.0, "bw_error_rate": 0.0,
+        "color_basic": 0, "bw_basic": 0,
+        "tax_type": "未稅" if ("未稅" in t or "(未)" in t) else "含稅",
+    }
+    if m := RENT_RE.search(t):
+        terms["monthly_rent"] = _num(m.group(1))
+
+    # 月租內含張數 → 基本張數
+    if m := BW_PAGES_RE.search(t):
+        terms["bw_basic"] = _num(m.group(1), int)
+    elif m := FREE_PAGES_RE.search(t):
+        terms["bw_basic"] = _num(m.group(1), int)
+    if m := COLOR_PAGES_RE.search(t):
+        terms["color_basic"] = _num(m.group(1), int)
+
+    # 超張單價
+    over = {}
+    for kind, price in OVER_PRICE_RE.findall(t):
+        over.setdefault(kind or "黑白", price)  # 「含5,000張,超張0.3元」未註明者視為黑白
+    if m := BW_PRICE_RE.search(t):
+        terms["bw_unit_price"] = _num(m.group(1))
+    elif "黑白" in over:
+        terms["bw_unit_price"] = _num(over["黑白"])
+    elif m := SINGLE_PRICE_RE.search(t):
+        terms["bw_unit_price"] = _num(m.group(1))
+    if m := COLOR_PRICE_RE.search(t):
+        terms["color_unit_price"] = _num(m.group(1))
+    elif "彩色" in over:
+        terms["color_unit_price"] = _num(over["彩色"])
+
+    if m := ERROR_RATE_RE.search(t):
+        terms["bw_error_rate"] = _num(m.group(1) or m.group(2)) / 100
+    return terms
+
+
+def _new_slip():
+    return {
+        "device_id": None, "customer_name": "", "device_number": "", "machine_model": "",
+        "tax_id": "", "install_address": "", "service_person": "", "contract_number": "",
+        "contract_start": "", "contract_end": "", "contra": "",
+        "readings": [], "merge_formulas": [],
+    }
+
+
+def parse_slips(lines):
+    """單次掃描，每讀完一張憑單就 yield 一個 dict（含 readings 抄表清單）"""
+    slip = None
+    state = None          # header / terms / model / term_dates
+    terms, model = [], []
+    term_dates = []
+    reading = None        # 收集中的抄表：{"date":..., "values": [...]}
+    invoice_no = None
+
+    def finish_reading():
+        nonlocal reading
+        if reading and len(reading["values"]) == 9:
+            v = reading["values"]
+            if any(x != "" for x in v[:3]):
+                y, mth, d = reading["date"]
+                slip["readings"].append({
+                    "month": f"{y}{mth:02d}",
+                    "timestamp": f"{y}/{mth:02d}/{d:02d}-00:00",
+                    "color_count": _num(v[0], int) + _num(v[1], int),
+                    "bw_count": _num(v[2], int),
+                    "used_color": _num(v[3], int) + _num(v[4], int),
+                    "used_bw": _num(v[5], int),
+                    "bill_color": _num(v[6], int) + _num(v[7], int),
+                    "bill_bw": _num(v[8], int),
+                    "invoice": None,
+                })
+        reading = None
+
+    def finish_slip():
+        if slip and slip["device_id"]:
+            finish_reading()
+            slip["contra"] = "".join(terms).replace(" ", "")
+            slip["machine_model"] = "".join(model)
+            if len(term_dates) >= 2:
+                slip["contract_start"], slip["contract_end"] = term_dates[:2]
+            slip.update(parse_terms(slip["contra"]))
+            return slip
+        return None
+
+    for line in lines:
+        if "營業収入憑單" in line:
+            done = finish_slip()
+            if done:
+                yield done
+            slip, state, reading = _new_slip(), None, None
+            terms, model, term_dates = [], [], []
+            continue
+        if slip is None:
+            continue
+
+        # --- 表頭 ---
+        if line.startswith("部門編號"):
+            state = "header"
+            continue
+        if state == "header":
+            tokens = line.split()
+            if len(tokens) >= 5:
+                slip["service_person"] = tokens[3]
+                slip["contract_number"] = tokens[4]
+            state = None
+            continue
+        if line.startswith("名稱 "):
+            m = re.match(r"名稱\s+(.*?)\s+統一編號\s+(\S+)", line)
+            if m:
+                slip["customer_name"], slip["tax_id"] = m.group(1), m.group(2)
+            continue
+        if line.startswith("裝機地址"):
+            m = re.match(r"裝機地址\s+(.*?)\s+機號\s+(\S+)", line)
+            if m:
+                slip["install_address"] = m.group(1).replace(" ", "")
+                slip["device_number"] = m.group(2)
+            continue
+
+        # --- 收費條件（可能跨多行，以「機型」結束）---
+        if line.startswith("収費條件"):
+            state = "terms"
+            line = line[len("収費條件"):].strip()
+            if not line:
+                continue
+        if state == "terms":
+            if line.startswith("聯絡人"):
+                state = None
+            elif "機型" in line:
+                before, _, after = line.partition("機型")
+                terms.append(before)
+                state = "model"
+                if after.strip():
+                    model.append(after.strip())
+            elif line.endswith("機�"):
+                terms.append(line[:-2])
+                state = "model"
+            else:
+                terms.append(line)
+            continue
+        if state == "model":
+            if line.startswith("聯絡人"):
+                state = None
+            else:
+                model.append(line)
+            continue
+
+        # --- 合約期限 / 設備號碼 ---
+        if line == "合約期限":
+            state = "term_dates"
+            continue
+        if state == "term_dates":
+            m = DATE_RE.match(line)
+            if m and len(term_dates) < 2:
+                y, mth, d = (int(x) for x in m.groups())
+                term_dates.append(f"{y}/{mth:02d}/{d:02d}")
+                continue
+            state = None
+        if line.startswith("設備號碼"):
+            parts = line.split()
+            if len(parts) >= 2:
+                slip["device_id"] = parts[1]
+            continue
+
+        # --- 每月抄表區塊：日期後接 彩大/彩小/黑白 × 3 組 ---
+        m = DATE_RE.match(line)
+        if m:
+            if reading is None or not reading["values"]:
+                reading = {"date": tuple(int(x) for x in m.groups()), "values": []}
+            else:
+                finish_reading()
+                reading = {"date": tuple(int(x) for x in m.groups()), "values": []}
+            continue
+        if reading is not None and reading["values"] and reading["values"][-1] == "" and DIGITS_RE.match(line):
+            # 「黑白:」與數字被拆成兩行
+            reading["values"][-1] = line
+            if len(reading["values"]) == 9:
+                finish_reading()
+            continue
+        if reading is not None and len(reading["values"]) == 9:
+            finish_reading()
+        m = METER_RE.match(line)
+        if m:
+            if reading is not None:
+                reading["values"].append(m.group(2))
+                if len(reading["values"]) == 9 and m.group(2):
+                    finish_reading()
+            continue
+        if line.startswith(":"):
+            formula = line[1:].replace(" ", "")
+            if "+" in formula and "-" in formula:
+                slip["merge_formulas"].append(formula)
+            continue
+        if INVOICE_NO_RE.match(line):
+            invoice_no = line  # 發票號碼與金額分成兩行
+            continue
+        m = INVOICE_RE.match(line)
+        if m and slip["readings"] and slip["readings"][-1]["invoice"] is None:
+            slip["readings"][-1]["invoice"] = {
+                "number": m.group(1) or invoice_no,
+                "untaxed": _num(m.group(2), int),
+                "tax": _num(m.group(3), int),
+                "total": _num(m.group(4), int),
+                "technician": m.group(5),
+            }
+            invoice_no = None
+
+    done = finish_slip()
+    if done:
+        yield done
+
+
+CUSTOMER_COLUMNS = (
+    "device_id", "customer_name", "device_number", "machine_model",
+    "tax_id", "install_address", "service_person",
+    "contract_number", "contract_start", "contract_end"
+)
+CONTRACT_COLUMNS = (
+    "device_id", "monthly_rent", "color_unit_price", "bw_unit_price",
+    "color_giveaway", "bw_giveaway", "color_error_rate", "bw_error_rate",
+    "color_basic", "bw_basic", "tax_type", "contra"
+)
+
+
+BATCH_SIZE = 2000  # 每累積這麼多列就 executemany 一次
+SLIP_COLUMNS = CUSTOMER_COLUMNS + CONTRACT_COLUMNS[1:]
+
+# 憑單與抄表逐批放進暫存表，全部讀完後各以一句 SQL 寫入正式表，Python 端不必保留整份憑單
+STAGE_SQL = f"""
+    CREATE TEMP TABLE IF NOT EXISTS slip_devices (seq INTEGER PRIMARY KEY, {", ".join(SLIP_COLUMNS)});
+    CREATE TEMP TABLE IF NOT EXISTS slip_readings (
+        seq INTEGER PRIMARY KEY, device_id TEXT, month TEXT, color_count INTEGER, bw_count INTEGER, timestamp TEXT
+    );
+"""
+
+# 同一設備有新舊兩張憑單時，以合約起始日較新的為準（同一天以後出現的為準）
+LATEST_SLIP_SQL = """
+    SELECT * FROM (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY device_id ORDER BY contract_start DESC, seq DESC) AS rn
+        FROM slip_devices
+    ) WHERE rn = 1
+"""
+
+# 依日期排序寫入。usage 以 id 決定「最後一筆」，所以只寫入比該設備目前最後一筆更晚的抄表；
+# 同一設備同一時間的重複抄表只取檔案中的第一筆（SQLite 的 MIN() 會帶出同一列的其他欄位）
+MERGE_USAGE_SQL = """
+    INSERT INTO usage (device_id, month, color_count, bw_count, timestamp)
+    SELECT device_id, month, color_count, bw_count, timestamp FROM (
+        SELECT device_id, month, color_count, bw_count, timestamp, MIN(seq) AS seq
+        FROM slip_readings
+        GROUP BY device_id, timestamp
+    ) r
+    WHERE r.timestamp > COALESCE(
+        (SELECT timestamp FROM usage WHERE device_id = r.device_id ORDER BY id DESC LIMIT 1), '')
+    ORDER BY r.timestamp, r.device_id
+"""
+
+
+def import_slips(path=SLIP_FILE, db_file=None, replace_existing=False):
+    """逐張解析憑單並分批暫存，最後批次寫入；replace_existing=False 時不覆蓋已存在的客戶/契約
+
+    抄表不晚於該設備目前最後一筆的（含已匯入過的、線上已抄過之後的舊憑單）一律略過，
+    回填不會蓋掉最新讀數（可重複執行）。parse_s 為解析 + 暫存的時間。
+    """
+    t0 = time.perf_counter()
+    n_slips = n_readings = 0
+    devices, readings = [], []
+
+    def flush():
+        conn.executemany(f"INSERT INTO slip_devices ({', '.join(SLIP_COLUMNS)}) "
+                         f"VALUES ({', '.join('?' * len(SLIP_COLUMNS))})", devices)
+        conn.executemany("INSERT INTO slip_readings (device_id, month, color_count, bw_count, timestamp) "
+                         "VALUES (?, ?, ?, ?, ?)", readings)
+        devices.clear()
+        readings.clear()
+
+    conn = sqlite3.connect(db_file or DB_FILE)
+    try:
+        with conn:  # 單一交易
+            for statement in STAGE_SQL.split(";")[:2]:
+                conn.execute(statement)
+            conn.execute("DELETE FROM slip_devices")
+            conn.execute("DELETE FROM slip_readings")
+            for slip in parse_slips(read_lines(path)):
+                n_slips += 1
+                n_readings += len(slip["readings"])
+                devices.append(tuple(slip[c] for c in SLIP_COLUMNS))
+                readings.extend((slip["device_id"], r["month"], r["color_count"], r["bw_count"], r["timestamp"])
+                                for r in slip["readings"])
+                if len(devices) + len(readings) >= BATCH_SIZE:
+                    flush()
+            flush()
+            t_parse = time.perf_counter() - t0
+
+            # 覆蓋時用 UPSERT 而非 REPLACE：REPLACE 的刪除不觸發 trigger，客戶檢索索引會失去同步
+            for table, columns in (("customers", CUSTOMER_COLUMNS), ("contracts", CONTRACT_COLUMNS)):
+                conflict = ("DO UPDATE SET " + ", ".join(f"{col}=excluded.{col}" for col in columns[1:])
+                            if replace_existing else "DO NOTHING")
+                conn.execute(f"INSERT INTO {table} ({', '.join(columns)}) "
+                             f"SELECT {', '.join(columns)} FROM ({LATEST_SLIP_SQL}) WHERE true "
+                             f"ON CONFLICT(device_id) {conflict}")
+            cur = conn.execute(MERGE_USAGE_SQL)
+            inserted_usage = max(cur.rowcount, 0)  # 不含 report_usage_i trigger 寫入 report_monthly 的列
+            conn.execute("DELETE FROM slip_devices")
+            conn.execute("DELETE FROM slip_readings")
+    finally:
+        conn.close()
+    cache.invalidate()
+    elapsed = time.perf_counter() - t0
+
+    return {
+        "slips": n_slips, "readings": n_readings, "inserted_usage": inserted_usage,
+        "skipped_usage": n_readings - inserted_usage,
+        "parse_s": t_parse, "total_s": elapsed,
+    }
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else SLIP_FILE
+    stats = import_slips(path)
+    print(f"✅ 憑單匯入完成：{stats['slips']} 張憑單，{stats['readings']} 筆抄表"
+          f"（新增 {stats['inserted_usage']} 筆），"
+          f"解析 {stats['parse_s']:.3f} 秒，總計 {stats['total_s']:.3f} 秒")
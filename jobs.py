@@ -0,0 +1,381 @@
+# jobs.py — 背景工作佇列（存在 billing.db 的 jobs 表）與 worker 行程池
+#
+#   python jobs.py worker -n 2                       # 啟動 2 個 worker 行程
+#   python jobs.py submit billing_run '{"month": "202510"}'
+#   python jobs.py list
+#
+# 工作記錄在資料庫裡，重新啟動後 queued 的照常執行，執行到一半的會重新排入。
+# 匯入與批次計費都分段 commit，不會長時間佔住 billing.db 的寫入鎖。
+# 每種工作只接受登記過的參數；檔案路徑限制在 BILLING_JOB_INPUT_DIR / BILLING_JOB_OUTPUT_DIR 之內。
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import traceback
+from datetime import datetime
+
+import db
+import reports
+
+POLL_INTERVAL = 1.0      # 佇列空時，worker 多久查一次（秒）
+PROGRESS_INTERVAL = 0.5  # 進度最多每 0.5 秒寫回一次
+CHUNK_ROWS = 2000        # 匯入 / 批次計費每段 commit 的列數
+
+# 工作可讀寫的資料夾：路徑參數一律相對於這兩個資料夾，解析後不可跑到外面（web 也能提交工作）
+INPUT_DIR = os.path.abspath(os.environ.get("BILLING_JOB_INPUT_DIR", os.path.dirname(os.path.abspath(__file__))))
+OUTPUT_DIR = os.path.abspath(os.environ.get("BILLING_JOB_OUTPUT_DIR", "statements"))
+INPUT_PATH = "input_path"    # 參數型別：INPUT_DIR 內的檔案
+OUTPUT_PATH = "output_path"  # 參數型別：OUTPUT_DIR 內的資料夾
+MONTH = "month"              # 參數型別：YYYYMM（省略時為本月）
+
+JOBS_SQL = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        params TEXT NOT NULL DEFAULT '{}',
+        status TEXT NOT NULL DEFAULT 'queued',  -- queued / running / done / failed / cancelled
+        progress REAL NOT NULL DEFAULT 0,
+        message TEXT NOT NULL DEFAULT '',
+        result TEXT,
+        error TEXT,
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        worker_pid INTEGER,
+        created_at TEXT,
+        started_at TEXT,
+        finished_at TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+"""
+
+JOB_COLUMNS = ("id", "kind", "params", "status", "progress", "message", "result", "error",
+               "cancel_requested", "created_at", "started_at", "finished_at")
+
+HANDLERS = {}
+PARAMS = {}  # 工作類型 -> {參數名稱: 型別}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobParamError(ValueError):
+    pass
+
+
+def _now():
+    return datetime.now().strftime("%Y/%m/%d-%H:%M:%S")
+
+
+def handler(kind, **params):
+    """註冊一種工作：fn(job, **params) 回傳可轉成 JSON 的結果；params 為允許的參數 {名稱: 型別}"""
+    def register(fn):
+        HANDLERS[kind] = fn
+        PARAMS[kind] = params
+        return fn
+    return register
+
+
+def resolve_path(root, value):
+    """root 之下的路徑（value 為相對路徑）；解析後（含 .. 與 symlink）跑出 root 就拒絕"""
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, value))
+    if os.path.commonpath([root, path]) != root:
+        raise JobParamError(f"路徑必須在 {root} 之內：{value}")
+    return path
+
+
+def check_params(kind, params):
+    """依工作類型檢查參數：未知的參數、型別不符、路徑跑出允許的資料夾都丟 JobParamError"""
+    if kind not in HANDLERS:
+        raise JobParamError(f"未知的工作類型：{kind}")
+    if not isinstance(params, dict):
+        raise JobParamError("params 必須是物件")
+    allowed = PARAMS[kind]
+    unknown = sorted(set(params) - allowed.keys())
+    if unknown:
+        raise JobParamError(f"{kind} 不接受的參數：{', '.join(unknown)}（可用：{', '.join(allowed) or '無'}）")
+    for name, value in params.items():
+        expected = allowed[name]
+        if expected == MONTH:
+            if value not in (None, "") and not reports.is_month(value):
+                raise JobParamError(f"{name} 格式為 YYYYMM")
+        elif expected in (INPUT_PATH, OUTPUT_PATH):
+            if not isinstance(value, str):
+                raise JobParamError(f"{name} 必須是字串")
+            resolve_path(INPUT_DIR if expected == INPUT_PATH else OUTPUT_DIR, value)
+        elif value is not None and (not isinstance(value, expected) or isinstance(value, bool) != (expected is bool)):
+            raise JobParamError(f"{name} 必須是 {expected.__name__}")
+    return params
+
+
+def init_db(conn=None):
+    """建表由 migrations 負責（已是最新版本時只檢查 user_version）"""
+    import migrations
+
+    migrations.migrate(conn or db.get_db())
+
+
+def _job_dict(row):
+    job = dict(zip(JOB_COLUMNS, row))
+    job["params"] = json.loads(job["params"] or "{}")
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    job["cancel_requested"] = bool(job["cancel_requested"])
+    return job
+
+
+# --- 提交 / 查詢 / 取消（web 與 CLI 共用）---
+def submit(kind, params=None, conn=None):
+    """排入一筆工作，回傳 job id；參數不合規定時丟 JobParamError"""
+    params = check_params(kind, params or {})
+    conn = conn or db.get_db()
+    cur = conn.execute("INSERT INTO jobs (kind, params, created_at) VALUES (?, ?, ?)",
+                       (kind, json.dumps(params or {}, ensure_ascii=False), _now()))
+    conn.commit()
+    return cur.lastrowid
+
+
+def get(job_id, conn=None):
+    row = (conn or db.get_db()).execute(
+        f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _job_dict(row) if row else None
+
+
+def recent(limit=20, conn=None):
+    rows = (conn or db.get_db()).execute(
+        f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    return [_job_dict(row) for row in rows]
+
+
+def cancel(job_id, conn=None):
+    """queued 的直接取消；running 的設旗標，由工作在下一次回報進度時停止"""
+    conn = conn or db.get_db()
+    conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                 (_now(), job_id))
+    conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+    conn.commit()
+    return get(job_id, conn)
+
+
+# --- worker ---
+class Job:
+    """傳給 handler 的執行中工作：回報進度、檢查是否被取消"""
+
+    def __init__(self, conn, job_id, kind, params):
+        self.conn = conn
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self._last_report = 0.0
+
+    def progress(self, done, total=None, message=""):
+        now = time.monotonic()
+        if now - self._last_report < PROGRESS_INTERVAL and (total is None or done < total):
+            return
+        self._last_report = now
+        fraction = min(done / total, 1.0) if total else 0.0
+        message = message or (f"{done:,} / {total:,}" if total else f"{done:,}")
+        row = self.conn.execute(
+            "UPDATE jobs SET progress = ?, message = ? WHERE id = ? RETURNING cancel_requested",
+            (fraction, message, self.id)).fetchone()
+        self.conn.commit()
+        if row and row[0]:
+            raise JobCancelled
+
+
+def claim(conn, pid):
+    """取出最早的一筆 queued 工作並標為 running（BEGIN IMMEDIATE，多個 worker 不會搶到同一筆）"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("""
+            UPDATE jobs SET status = 'running', worker_pid = ?, started_at = ?
+            WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1)
+            RETURNING id, kind, params
+        """, (pid, _now())).fetchone()
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return row
+
+
+def _finish(conn, job_id, status, result=None, error=None, message=None):
+    conn.execute("""
+        UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?,
+                        progress = CASE WHEN ? = 'done' THEN 1 ELSE progress END,
+                        message = COALESCE(?, message)
+        WHERE id = ?
+    """, (status, json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+          error, _now(), status, message, job_id))
+    conn.commit()
+
+
+def run_one(conn, pid=None):
+    """執行一筆工作；佇列是空的就回傳 None"""
+    row = claim(conn, pid or os.getpid())
+    if row is None:
+        return None
+    job_id, kind, params = row
+    job = Job(conn, job_id, kind, json.loads(params or "{}"))
+    try:
+        result = HANDLERS[kind](job, **check_params(kind, job.params))  # 資料庫裡的舊工作也要再檢查一次
+    except JobCancelled:
+        if conn.in_transaction:
+            conn.rollback()
+        _finish(conn, job_id, "cancelled", message="已取消（已 commit 的部分保留）")
+    except Exception as e:
+        if conn.in_transaction:
+            conn.rollback()
+        _finish(conn, job_id, "failed", error="".join(traceback.format_exception_only(e)).strip())
+    else:
+        _finish(conn, job_id, "done", result=result, message="完成")
+    return job_id
+
+
+def recover(conn):
+    """啟動時處理上次中斷的工作：worker 已不存在的 running 工作重新排入（或標為已取消）"""
+    recovered = 0
+    for job_id, pid, cancel_requested in conn.execute(
+            "SELECT id, worker_pid, cancel_requested FROM jobs WHERE status = 'running'").fetchall():
+        if pid and _pid_alive(pid):
+            continue
+        if cancel_requested:
+            conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ?", (_now(), job_id))
+        else:
+            conn.execute("UPDATE jobs SET status = 'queued', worker_pid = NULL, progress = 0,"
+                         " message = '重新排入' WHERE id = ?", (job_id,))
+        recovered += 1
+    conn.commit()
+    return recovered
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def worker_loop(db_file, once=False):
+    """單一 worker 行程：反覆取工作執行；once=True 時佇列清空就結束"""
+    db.DB_FILE = db_file
+    conn = db.get_db()
+    while True:
+        if run_one(conn) is None:
+            if once:
+                return
+            time.sleep(POLL_INTERVAL)
+
+
+def run_workers(n=2, db_file=None, once=False):
+    """啟動 n 個 worker 行程（spawn，不共用父行程的 SQLite 連線）"""
+    db.DB_FILE = db_file or db.DB_FILE
+    init_db()
+    recovered = recover(db.get_db())
+    if recovered:
+        print(f"♻️ 重新處理 {recovered} 筆中斷的工作")
+
+    # 不用 daemon：daemon 行程不能再開子行程，對帳單工作要用 ProcessPoolExecutor 產生 PDF；
+    # 改由這裡負責收尾（Ctrl+C / SIGTERM 時結束全部 worker）
+    previous = signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=worker_loop, args=(db.DB_FILE, once)) for _ in range(n)]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+            p.join()
+        signal.signal(signal.SIGTERM, previous)
+
+
+# --- 工作類型 ---
+@handler("billing_run", month=MONTH)
+def _billing_run(job, month=None):
+    import billing
+    import groups
+
+    month = month or datetime.now().strftime("%Y%m")
+    n = billing.run_month(month, conn=job.conn, chunk_size=CHUNK_ROWS, progress=job.progress)
+    return {"month": month, "devices": n, "groups": groups.run_month(month, job.conn)}
+
+
+@handler("import_excel", excel_file=INPUT_PATH, replace_existing=bool)
+def _import_excel(job, excel_file="import_data.xlsx", replace_existing=True):
+    import contextlib
+    import io
+
+    importer = importlib.import_module("import")
+    importer.DB_FILE = db.DB_FILE
+    with contextlib.redirect_stdout(io.StringIO()):
+        return importer.import_excel_to_db(resolve_path(INPUT_DIR, excel_file), replace_existing, stream=True,
+                                           commit_every=CHUNK_ROWS, progress=job.progress)
+
+
+@handler("import_slips", path=INPUT_PATH, replace_existing=bool)
+def _import_slips(job, path="設備資料.txt", replace_existing=False):
+    import import_slips
+
+    return import_slips.import_slips(resolve_path(INPUT_DIR, path), db_file=db.DB_FILE, replace_existing=replace_existing)
+
+
+@handler("statements", month=MONTH, out_dir=OUTPUT_PATH, pdf=bool, excel=bool)
+def _statements(job, month=None, out_dir="", pdf=True, excel=True):
+    import statements
+
+    month = month or datetime.now().strftime("%Y%m")
+    total = statements.count_customers(job.conn, month)
+    return statements.generate(month, resolve_path(OUTPUT_DIR, out_dir), pdf=pdf, excel=excel, conn=job.conn,
+                               progress=lambda done: job.progress(done, total, f"{done:,} 個客戶"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="背景工作佇列")
+    parser.add_argument("--db", default=db.DB_FILE, help="資料庫檔案")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("worker", help="啟動 worker 行程")
+    p.add_argument("-n", type=int, default=2, help="worker 行程數")
+    p.add_argument("--once", action="store_true", help="佇列清空就結束")
+    p = sub.add_parser("submit", help="排入一筆工作")
+    p.add_argument("kind", choices=sorted(HANDLERS))
+    p.add_argument("params", nargs="?", default="{}", help="JSON 參數")
+    sub.add_parser("list", help="列出最近的工作")
+    p = sub.add_parser("cancel", help="取消工作")
+    p.add_argument("job_id", type=int)
+    args = parser.parse_args(argv)
+
+    db.DB_FILE = args.db
+    if args.command == "worker":
+        run_workers(args.n, args.db, args.once)
+        return 0
+    init_db()
+    if args.command == "submit":
+        try:
+            job_id = submit(args.kind, json.loads(args.params))
+        except JobParamError as e:
+            print(f"❌ {e}")
+            return 1
+        print(f"✅ 已排入工作 #{job_id}")
+    elif args.command == "cancel":
+        job = cancel(args.job_id)
+        print(f"{args.job_id}: {job['status'] if job else '不存在'}")
+    else:
+        for job in recent():
+            print(f"#{job['id']:<5} {job['kind']:<14} {job['status']:<10} {job['progress']:6.1%}  {job['message']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+# loadtest.py — 網頁負載測試：以模擬機隊的 billing.db 啟動 app，逐步提高並行數，重播 index() 的各種操作
+#
+#   python loadtest.py                                   # 1000 台模擬機隊，werkzeug threaded
+#   python loadtest.py --server gunicorn -w 4 --levels 1,4,16,64 --devices 20000
+#   python loadtest.py --url http://127.0.0.1:10000      # 對已經在跑的服務（不另外啟動、不建資料）
+#
+# --db / --url 指向既有資料時預設只送讀取操作；寫入（calculate / update_contract 會改契約、寫假讀數）
+# 要另外加 --allow-writes，而且一律不接受正式的 billing.db。
+#
+# 每個並行數跑 --seconds 秒，回報吞吐量、p50/p95/p99 延遲與 SQLite 鎖定錯誤
+# （app 在 busy_timeout 用完時回 503 + X-DB-Error: locked），用來找出寫入開始互相阻塞的並行數。
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+import db
+import fleet
+
+# index() 的操作比例（約略依門市實際使用）
+MIX = (
+    ("get", 40),              # GET /?device_id=
+    ("query", 20),            # 依設備編號查詢
+    ("search", 15),           # 客戶名稱模糊搜尋
+    ("calculate", 20),        # 計算並寫入抄表 + 帳單
+    ("update_contract", 5),   # 更新契約條件
+)
+WRITE_OPS = ("calculate", "update_contract")
+
+
+class Client:
+    """單一虛擬使用者：沿用 keep-alive 連線，伺服器關閉時重連"""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.conn = None
+
+    def request(self, method, path, form=None):
+        body = urlencode(form).encode() if form else None
+        headers = {"Content-Type": "application/x-www-form-urlencoded"} if form else {}
+        for attempt in (1, 2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                response.read()
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                if attempt == 2:
+                    raise
+                continue
+            if response.will_close:
+                self.conn.close()
+                self.conn = None
+            return response.status, response.getheader("X-DB-Error")
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+def make_operation(op, rnd, device_ids, counters):
+    """產生一次操作的 (method, path, form)"""
+    device_id = rnd.choice(device_ids)
+    if op == "get":
+        return "GET", "/?" + urlencode({"device_id": device_id}), None
+    if op == "query":
+        return "POST", "/", {"mode": "query", "device_id": device_id}
+    if op == "search":
+        return "POST", "/", {"mode": "query", "device_id": f"測試客戶{rnd.randrange(max(len(device_ids) // 3, 1))}"}
+    if op == "calculate":
+        counters[device_id] = counters.get(device_id, 10 ** 8) + rnd.randint(1, 5000)
+        return "POST", "/", {"mode": "calculate", "device_id": device_id,
+                             "curr_color": counters[device_id] // 10, "curr_bw": counters[device_id]}
+    return "POST", "/", {"mode": "update_contract", "device_id": device_id, "monthly_rent": rnd.choice((2000, 6800)),
+                         "color_unit_price": 3, "bw_unit_price": 0.3, "color_giveaway": 0,
+                         "bw_giveaway": rnd.choice((1500, 3000)), "tax_type": "含稅"}
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(len(sorted_values) * p), len(sorted_values) - 1)]
+
+
+def run_level(host, port, device_ids, concurrency, seconds, seed=0, mix=MIX):
+    """以 concurrency 個虛擬使用者跑 seconds 秒，回傳統計"""
+    ops, weights = zip(*mix)
+    samples = []   # (op, 毫秒, 結果)
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+
+    def user(n):
+        rnd = random.Random(seed * 1000 + n)
+        client = Client(host, port)
+        counters, local = {}, []
+        try:
+            while time.perf_counter() < stop:
+                op = rnd.choices(ops, weights)[0]
+                method, path, form = make_operation(op, rnd, device_ids, counters)
+                t0 = time.perf_counter()
+                try:
+                    status, db_error = client.request(method, path, form)
+                    outcome = "locked" if db_error == "locked" else "ok" if status < 400 else "error"
+                except (http.client.HTTPException, OSError):
+                    outcome = "error"
+                local.append((op, (time.perf_counter() - t0) * 1000, outcome))
+        finally:
+            client.close()
+            with lock:
+                samples.extend(local)
+
+    threads = [threading.Thread(target=user, args=(n,)) for n in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    def summarize(rows):
+        latencies = sorted(ms for _, ms, outcome in rows if outcome == "ok")
+        return {
+            "requests": len(rows),
+            "ok": len(latencies),
+            "locked": sum(1 for row in rows if row[2] == "locked"),
+            "errors": sum(1 for row in rows if row[2] == "error"),
+            "p50_ms": _percentile(latencies, 0.50),
+            "p95_ms": _percentile(latencies, 0.95),
+            "p99_ms": _percentile(latencies, 0.99),
+        }
+
+    result = summarize(samples)
+    result.update(concurrency=concurrency, elapsed_s=elapsed, requests_per_s=result["ok"] / elapsed)
+    result["writes"] = summarize([row for row in samples if row[0] in WRITE_OPS])
+    result["by_op"] = {op: summarize([row for row in samples if row[0] == op]) for op in ops}
+    return result
+
+
+def start_server(kind, port, db_file, workers):
+    """在子行程啟動 app：threaded（werkzeug 多執行緒）、gunicorn（-w 個 sync worker）或 async（asgi.py）"""
+    root = os.path.dirname(os.path.abspath(__file__))
+    if kind == "gunicorn":
+        cmd = [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}", "app:app"]
+    elif kind == "async":
+        cmd = [sys.executable, "asgi.py", "--host", "127.0.0.1", "--port", str(port)]
+    else:
+        cmd = [sys.executable, "-c", "import app; from werkzeug.serving import make_server\n"
+               f"make_server('127.0.0.1', {port}, app.app, threaded=True).serve_forever()"]
+    proc = subprocess.Popen(cmd, cwd=root, env=dict(os.environ, BILLING_DB=db_file),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    client = Client("127.0.0.1", port)
+    for _ in range(300):
+        if proc.poll() is not None:
+            break
+        try:
+            client.request("GET", "/cache/stats")
+            client.close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"{kind} 服務無法啟動（{' '.join(cmd)}）")
+
+
+def knee(levels):
+    """第一個吞吐量不再明顯成長（< 10%）或開始出現鎖定錯誤的並行數"""
+    for prev, curr in zip(levels, levels[1:]):
+        if curr["locked"] or curr["requests_per_s"] < prev["requests_per_s"] * 1.1:
+            return curr["concurrency"]
+    return None
+
+
+def _is_production(path):
+    """path 是否為正式資料庫：db.DB_FILE 或專案目錄的 billing.db（不論從哪個目錄執行）"""
+    root = os.path.dirname(os.path.abspath(__file__))
+    return os.path.exists(path) and any(
+        os.path.exists(p) and os.path.samefile(path, p) for p in (db.DB_FILE, os.path.join(root, "billing.db")))
+
+
+def _fmt(ms):
+    return f"{ms:8.1f}" if ms is not None else "       -"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="計費網頁負載測試")
+    parser.add_argument("--server", choices=("threaded", "gunicorn", "async"), default="threaded")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="gunicorn worker 數")
+    parser.add_argument("--url", help="改測已在執行的服務（不啟動、不建資料；設備編號從 --db 讀）")
+    parser.add_argument("--db", help="使用現有的資料庫（預設以 fleet.py 建立暫存資料庫）")
+    parser.add_argument("--allow-writes", action="store_true",
+                        help="--db / --url 指向既有資料時也送出寫入操作（會改契約、寫入假讀數）")
+    parser.add_argument("--devices", type=int, default=1000, help="模擬機隊設備數")
+    parser.add_argument("--months", type=int, default=12, help="每台的抄表月數")
+    parser.add_argument("--levels", default="1,2,4,8,16,32", help="並行數，逗號分隔")
+    parser.add_argument("--seconds", type=float, default=10, help="每個並行數的測試秒數")
+    parser.add_argument("--port", type=int, default=18090)
+    parser.add_argument("--json", help="結果另存成 JSON")
+    args = parser.parse_args(argv)
+
+    import sqlite3
+
+    if args.db and _is_production(args.db):
+        print("❌ 不可對正式的 billing.db 做負載測試，請先以 fleet.py 建立模擬機隊或複製一份")
+        return 1
+    mix = MIX
+    if (args.db or args.url) and not args.allow_writes:
+        mix = tuple((op, weight) for op, weight in MIX if op not in WRITE_OPS)
+        print("ℹ️ 使用既有資料：只送讀取操作（需要寫入請加 --allow-writes）")
+
+    if args.db:
+        db_file = os.path.abspath(args.db)  # 服務在專案目錄啟動，相對路徑要先轉成絕對路徑
+    else:
+        db_file = os.path.join(tempfile.mkdtemp(prefix="billing_load_"), "billing.db")
+        print(f"建立模擬機隊：{args.devices:,} 台 × {args.months} 個月 → {db_file}")
+        fleet.build_db(db_file, args.devices, args.months)
+    conn = sqlite3.connect(db_file)
+    device_ids = [row[0] for row in conn.execute("SELECT device_id FROM contracts")]
+    conn.close()
+    if not device_ids:
+        print("❌ 資料庫裡沒有設備")
+        return 1
+
+    proc = None
+    if args.url:
+        target = urlsplit(args.url)
+        host, port = target.hostname, target.port or 80
+    else:
+        host, port = "127.0.0.1", args.port
+        proc = start_server(args.server, port, db_file, args.workers)
+
+    levels = []
+    try:
+        print(f"{'並行':>4} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'寫入p99':>8} {'鎖定':>6} {'錯誤':>6}")
+        for concurrency in (int(n) for n in args.levels.split(",")):
+            r = run_level(host, port, device_ids, concurrency, args.seconds, mix=mix)
+            levels.append(r)
+            print(f"{concurrency:>5} {r['requests_per_s']:>10.1f} {_fmt(r['p50_ms'])} {_fmt(r['p95_ms'])} "
+                  f"{_fmt(r['p99_ms'])} {_fmt(r['writes']['p99_ms'])} {r['locked']:>7} {r['errors']:>7}")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    point = knee(levels)
+    if point:
+        print(f"⚠️ 並行 {point} 起吞吐量不再成長或出現鎖定錯誤，寫入開始互相阻塞")
+    else:
+        print("✅ 測試範圍內吞吐量隨並行數成長，沒有鎖定錯誤")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"server": args.server, "workers": args.workers, "devices": len(device_ids),
+                       "knee": point, "levels": levels}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+# metrics.py — 每個 request 的耗時分解（SQL / 計費 / 樣板繪製）、SQL 統計與 Prometheus /metrics
+#
+#   BILLING_METRICS=1 python app.py              # 啟用；未設定時不掛任何 hook，也沒有 /metrics
+#   BILLING_SLOW_QUERY_MS=50                     # 超過門檻的 SQL 以 EXPLAIN QUERY PLAN 記 log（預設 100 ms）
+#
+# SQL 由 db.py 建立的 TimedConnection 計時（execute / executemany / fetch*），回應加上 Server-Timing 標頭。
+# 統計存在行程內，gunicorn 多個 worker 時每個 worker 各自一份。
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+from flask import Response, g, has_request_context, request
+from flask.signals import before_render_template, template_rendered
+
+ENABLED = os.environ.get("BILLING_METRICS", "") not in ("", "0")
+SLOW_QUERY_MS = float(os.environ.get("BILLING_SLOW_QUERY_MS", "100"))
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+PHASES = ("sql", "calculate", "render")
+
+log = logging.getLogger("billing.metrics")
+
+
+class Histogram:
+    """Prometheus histogram（累積 bucket），依 label 值分組；thread-safe"""
+
+    def __init__(self, name, help_text, labels, buckets=BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, values, seconds):
+        with self._lock:
+            series = self._series.get(values)
+            if series is None:
+                series = self._series[values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += seconds
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(values, list(counts), total, n) for values, (counts, total, n) in sorted(self._series.items())]
+        for values, counts, total, n in items:
+            labels = _labels(self.labels, values)
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="+Inf"}} {n}')
+            lines.append(f"{self.name}_sum{_braces(labels)} {total}")
+            lines.append(f"{self.name}_count{_braces(labels)} {n}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, values, amount=1):
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(f"{self.name}{_braces(_labels(self.labels, values))} {value}" for values, value in items)
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _braces(labels):
+    return f"{{{labels}}}" if labels else ""
+
+
+request_seconds = Histogram("billing_request_duration_seconds", "HTTP request latency",
+                            ("method", "route", "status"))
+phase_seconds = Histogram("billing_request_phase_seconds", "Time per request spent in SQL / calculate / render",
+                          ("route", "phase"))
+sql_seconds = Histogram("billing_sql_duration_seconds", "SQL execute time by statement", ("statement",))
+sql_fetch_seconds = Counter("billing_sql_fetch_seconds_total", "Time spent fetching rows", ("statement",))
+slow_queries = Counter("billing_sql_slow_total", "Statements slower than BILLING_SLOW_QUERY_MS", ("statement",))
+calculate_seconds = Histogram("billing_calculate_duration_seconds", "billing.calculate() time", ())
+
+
+# --- SQL 計時（db.py 在啟用時以 factory=TimedConnection 開連線）---
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN)\s+([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def statement_label(sql):
+    """SQL 歸類成「動作 資料表」（例如 SELECT usage），避免每種 SQL 文字都成為一個 label"""
+    words = sql.split(None, 1)
+    op = words[0].upper() if words else ""
+    if op == "WITH":
+        op = "SELECT"
+    table = _TABLE.search(sql)
+    return f"{op} {table.group(1)}" if table else op
+
+
+def _add_phase(phase, seconds):
+    if has_request_context():
+        phases = g.get("metrics_phases")
+        if phases is not None:
+            phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+def explain(conn, sql, params=()):
+    """EXPLAIN QUERY PLAN 的結果（每步一行）；無法 explain 的語句回傳空字串"""
+    try:
+        rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except sqlite3.Error:
+        return ""
+    return "\n".join(f"  {row[-1]}" for row in rows)
+
+
+def _record(conn, sql, params, seconds):
+    label = statement_label(sql)
+    sql_seconds.observe((label,), seconds)
+    _add_phase("sql", seconds)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        slow_queries.inc((label,))
+        plan = explain(conn, sql, params) if params is not None else ""
+        log.warning("slow SQL %.1f ms: %s%s", seconds * 1000, " ".join(sql.split()), "\n" + plan if plan else "")
+
+
+class TimedCursor(sqlite3.Cursor):
+    _label = ""
+
+    def execute(self, sql, params=()):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self._label = sql
+            _record(self.connection, sql, params, time.perf_counter() - t0)
+
+    def executemany(self, sql, seq):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq)
+        finally:
+            self._label = sql
+            _record(self.connection, sql, None, time.perf_counter() - t0)
+
+    def _fetched(self, t0):
+        seconds = time.perf_counter() - t0
+        sql_fetch_seconds.inc((statement_label(self._label),), seconds)
+        _add_phase("sql", seconds)
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._fetched(t0)
+
+    def fetchmany(self, size=None):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._fetched(t0)
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._fetched(t0)
+
+
+class TimedConnection(sqlite3.Connection):
+    """conn.execute 在 C 層直接建立 Cursor，所以這裡也要改走 TimedCursor"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+
+def timed_calculate(fn):
+    """包住 calculate()：計入 calculate 直方圖與本次 request 的 calculate 階段"""
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - t0
+            calculate_seconds.observe((), seconds)
+            _add_phase("calculate", seconds)
+    wrapper.__wrapped__ = fn
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
+
+
+# --- request hooks ---
+def _route():
+    return request.url_rule.rule if request.url_rule else "<unmatched>"
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_phases = {}
+
+
+def _after_request(response):
+    start = g.pop("metrics_start", None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    route = _route()
+    request_seconds.observe((request.method, route, str(response.status_code)), elapsed)
+    phases = g.pop("metrics_phases", {})
+    for phase, seconds in phases.items():
+        phase_seconds.observe((route, phase), seconds)
+    timings = [f"{phase};dur={phases[phase] * 1000:.2f}" for phase in PHASES if phase in phases]
+    response.headers["Server-Timing"] = ", ".join(timings + [f"total;dur={elapsed * 1000:.2f}"])
+    return response
+
+
+def _render_started(sender, template, context, **extra):
+    g.metrics_render_start = time.perf_counter()
+
+
+def _render_finished(sender, template, context, **extra):
+    start = g.pop("metrics_render_start", None)
+    if start is not None:
+        _add_phase("render", time.perf_counter() - start)
+
+
+def render():
+    """Prometheus text format（含連線池與快取統計）"""
+    import cache
+    import db
+
+    lines = []
+    for metric in (request_seconds, phase_seconds, sql_seconds, sql_fetch_seconds, slow_queries, calculate_seconds):
+        lines.extend(metric.render())
+    lines += ["# HELP billing_db_connections_total SQLite connection pool events",
+              "# TYPE billing_db_connections_total counter"]
+    lines += [f'billing_db_connections_total{{event="{event}"}} {n}' for event, n in sorted(db.stats.items())]
+    lines += ["# HELP billing_cache_events_total Contract / customer cache events",
+              "# TYPE billing_cache_events_total counter"]
+    for name, stats in sorted(cache.stats().items()):
+        lines += [f'billing_cache_events_total{{cache="{name}",event="{event}"}} {stats[event]}'
+                  for event in ("hits", "misses", "evictions", "expirations", "invalidations")]
+    return "\n".join(lines) + "\n"
+
+
+def init_app(app):
+    """啟用時才掛上 hook 與 /metrics；未啟用時什麼都不做"""
+    if not ENABLED:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+    app.add_url_rule("/metrics", "metrics", lambda: Response(render(), mimetype="text/plain; version=0.0.4"))
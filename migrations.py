@@ -0,0 +1,246 @@
+# migrations.py — billing.db 的結構版本（PRAGMA user_version）與依序升級的 migration
+#
+#   python migrations.py                  # 把 billing.db 升到最新版本
+#   python migrations.py --status --db x  # 只顯示目前版本與待執行的步驟
+#
+# 每個步驟只執行一次，做完把 user_version 設成該步驟的編號；整批升級在同一個交易裡，失敗就全部還原。
+# 舊版資料庫（database_setup.py / import.py / 舊 app.py 建立的、user_version = 0）也從第 1 步開始，
+# 所以每一步都要能套用在「已經有部分結構」的資料庫上。啟動時只讀一次 user_version，已是最新就直接返回。
+import argparse
+import sqlite3
+import sys
+
+import billing
+import cache
+import db
+import groups
+import jobs
+import reports
+from records import CONTRACT_COLUMNS
+
+# 契約表的標準欄位順序（同 records.CONTRACT_COLUMNS；import.REQUIRED_CONTRACTS、export.TABLES 也依此順序）
+CONTRACTS_SQL = """
+    CREATE TABLE IF NOT EXISTS contracts (
+        device_id TEXT PRIMARY KEY,
+        monthly_rent REAL,
+        color_unit_price REAL,
+        bw_unit_price REAL,
+        color_giveaway INTEGER,
+        bw_giveaway INTEGER,
+        color_error_rate REAL,
+        bw_error_rate REAL,
+        color_basic INTEGER,
+        bw_basic INTEGER,
+        tax_type TEXT DEFAULT '含稅',
+        contra TEXT DEFAULT ''
+    )
+"""
+
+BASE_SQL = CONTRACTS_SQL + """;
+    CREATE TABLE IF NOT EXISTS customers (
+        device_id TEXT PRIMARY KEY,
+        customer_name TEXT,
+        device_number TEXT,
+        machine_model TEXT,
+        tax_id TEXT,
+        install_address TEXT,
+        service_person TEXT,
+        contract_number TEXT,
+        contract_start TEXT,
+        contract_end TEXT
+    );
+    CREATE TABLE IF NOT EXISTS usage (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        device_id TEXT,
+        month TEXT,
+        color_count INTEGER,
+        bw_count INTEGER,
+        timestamp TEXT
+    );
+    -- 最後抄表查詢用索引（device_id 相同時依 id 倒序取第一筆）
+    CREATE INDEX IF NOT EXISTS idx_usage_device_id ON usage (device_id, id);
+"""
+
+# 客戶檢索索引：外部內容表指向 customers，新增/修改/刪除由 trigger 同步
+CUSTOMERS_FTS_SQL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS customers_fts USING fts5(
+        customer_name, tax_id, install_address, device_number,
+        content='customers', content_rowid='rowid', tokenize='trigram'
+    );
+    CREATE TRIGGER IF NOT EXISTS customers_fts_ai AFTER INSERT ON customers BEGIN
+        INSERT INTO customers_fts (rowid, customer_name, tax_id, install_address, device_number)
+        VALUES (new.rowid, new.customer_name, new.tax_id, new.install_address, new.device_number);
+    END;
+    CREATE TRIGGER IF NOT EXISTS customers_fts_ad AFTER DELETE ON customers BEGIN
+        INSERT INTO customers_fts (customers_fts, rowid, customer_name, tax_id, install_address, device_number)
+        VALUES ('delete', old.rowid, old.customer_name, old.tax_id, old.install_address, old.device_number);
+    END;
+    CREATE TRIGGER IF NOT EXISTS customers_fts_au AFTER UPDATE ON customers BEGIN
+        INSERT INTO customers_fts (customers_fts, rowid, customer_name, tax_id, install_address, device_number)
+        VALUES ('delete', old.rowid, old.customer_name, old.tax_id, old.install_address, old.device_number);
+        INSERT INTO customers_fts (rowid, customer_name, tax_id, install_address, device_number)
+        VALUES (new.rowid, new.customer_name, new.tax_id, new.install_address, new.device_number);
+    END;
+"""
+
+# 舊版 meter_records（month 為 2025-10，沒有抄表時間）整批搬進 usage；時間以該月 1 日代替
+METER_RECORDS_SQL = """
+    INSERT INTO usage (device_id, month, color_count, bw_count, timestamp)
+    SELECT device_id, REPLACE(month, '-', ''), curr_color, curr_bw,
+           substr(REPLACE(month, '-', ''), 1, 4) || '/' || substr(REPLACE(month, '-', ''), 5, 2) || '/01-00:00'
+    FROM meter_records
+    ORDER BY id
+"""
+
+
+def _script(conn, sql):
+    """逐句執行多句 SQL（executescript 會先 COMMIT，不能用在 migration 的交易裡）"""
+    statement = ""
+    for part in sql.split(";"):
+        statement += part + ";"
+        if sqlite3.complete_statement(statement):  # trigger 內的分號要等到 END; 才算一句
+            if statement.strip(" \t\n;"):
+                conn.execute(statement)
+            statement = ""
+
+
+def _exists(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+
+def _columns(conn, table):
+    return tuple(row[1] for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+# --- 各版本的步驟 ---
+def _base_tables(conn):
+    _script(conn, BASE_SQL)
+
+
+def _normalize_contracts(conn):
+    """補上缺少的 tax_type / contra，欄位順序不同時依標準順序重建（import.py 舊版把 contra 放在第 3 欄）
+
+    舊契約沒有稅別時單價視為未稅（app2.py 原本外加 5% 稅），先補成 '未稅' 再套用新表的 DEFAULT '含稅'。
+    """
+    columns = _columns(conn, "contracts")
+    if "tax_type" in columns:
+        conn.execute("UPDATE contracts SET tax_type = '未稅' WHERE tax_type IS NULL OR tax_type = ''")
+    if columns == CONTRACT_COLUMNS:
+        return
+    common = [col for col in CONTRACT_COLUMNS if col in columns]
+    targets, values = list(common), list(common)
+    if "tax_type" not in columns:
+        targets.append("tax_type")
+        values.append("'未稅'")
+    conn.execute(CONTRACTS_SQL.replace("contracts", "contracts_new", 1))
+    conn.execute(f"INSERT INTO contracts_new ({', '.join(targets)}) SELECT {', '.join(values)} FROM contracts")
+    conn.execute("DROP TABLE contracts")
+    conn.execute("ALTER TABLE contracts_new RENAME TO contracts")
+
+
+def _merge_meter_records(conn):
+    if _exists(conn, "meter_records"):
+        conn.execute(METER_RECORDS_SQL)
+        conn.execute("DROP TABLE meter_records")
+
+
+def _bills(conn):
+    _script(conn, billing.BILLS_SQL)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_customers_tax_id ON customers (tax_id)")  # 依客戶查帳單
+
+
+def _jobs(conn):
+    _script(conn, jobs.JOBS_SQL)
+
+
+def _cache_version(conn):
+    _script(conn, cache.VERSION_SQL)
+
+
+def _groups(conn):
+    _script(conn, groups.GROUPS_SQL)
+
+
+def _reports(conn):
+    existed = _exists(conn, "report_monthly")
+    _script(conn, reports.REPORTS_SQL)
+    if not existed:
+        reports.fill(conn)
+
+
+def _customers_fts(conn):
+    existed = _exists(conn, "customers_fts")
+    _script(conn, CUSTOMERS_FTS_SQL)
+    if not existed:
+        conn.execute("INSERT INTO customers_fts(customers_fts) VALUES ('rebuild')")
+
+
+def _group_reports(conn):
+    _script(conn, reports.GROUP_TRIGGERS_SQL)
+    reports.fill(conn)  # 既有的 group_bills 補進月報
+
+
+# 版本 n 的資料庫已經做完前 n 個步驟；只能往後加，不可修改或調換已發佈的步驟
+MIGRATIONS = (
+    ("contracts / customers / usage 基本資料表", _base_tables),
+    ("contracts 補 tax_type / contra 並統一欄位順序", _normalize_contracts),
+    ("meter_records 併入 usage", _merge_meter_records),
+    ("bills 月結帳單表與索引", _bills),
+    ("jobs 背景工作佇列", _jobs),
+    ("cache_version 快取資料版本", _cache_version),
+    ("契約群組", _groups),
+    ("report_monthly 月報彙總表", _reports),
+    ("customers_fts 客戶全文檢索", _customers_fts),
+    ("group_bills 併入月報彙總表", _group_reports),
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn=None):
+    """升到最新版本，回傳執行的步驟數；已是最新時只讀一次 user_version"""
+    conn = conn or db.get_db()
+    if version(conn) == SCHEMA_VERSION:
+        return 0
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")  # 多個行程同時啟動時只有一個在升級
+    try:
+        current = version(conn)  # 等到鎖之後再讀一次，別的行程可能已經升級完
+        if current > SCHEMA_VERSION:
+            raise RuntimeError(f"資料庫版本 {current} 比程式（{SCHEMA_VERSION}）新，請更新程式")
+        for _, step in MIGRATIONS[current:]:
+            step(conn)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return SCHEMA_VERSION - current
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="資料庫結構升級")
+    parser.add_argument("--db", default=db.DB_FILE, help="資料庫檔案")
+    parser.add_argument("--status", action="store_true", help="只顯示版本，不升級")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    try:
+        current = version(conn)
+        print(f"資料庫版本 {current} / 最新 {SCHEMA_VERSION}")
+        for n, (description, _) in enumerate(MIGRATIONS[current:], current + 1):
+            print(f"  {'待執行' if args.status else '執行'} {n}. {description}")
+        if not args.status:
+            migrate(conn)
+            print(f"✅ 已升級到版本 {SCHEMA_VERSION}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
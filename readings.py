@@ -0,0 +1,196 @@
+# readings.py — 整批抄表上傳（CSV / JSON）：比對最後抄表、逐筆計費、單一交易寫入
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from datetime import datetime
+
+import billing
+import metrics
+from billing import calculate
+from records import CONTRACT_COLUMNS, Contract, select_list
+
+if metrics.ENABLED:  # 與 app.py 相同：計入 calculate 直方圖與 request 的 calculate 階段
+    calculate = metrics.timed_calculate(calculate)
+
+BATCH_LIMIT = 5000
+TIMESTAMP_FORMAT = "%Y/%m/%d-%H:%M"  # 與 usage.timestamp 相同
+INPUT_FORMATS = (TIMESTAMP_FORMAT, "%Y/%m/%d %H:%M", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M:%S",
+                 "%Y-%m-%dT%H:%M:%S", "%Y/%m/%d", "%Y-%m-%d")
+
+# 欄名別名：表單 / API 用 curr_*，usage 表用 *_count
+COLOR_KEYS = ("curr_color", "color", "color_count")
+BW_KEYS = ("curr_bw", "bw", "bw_count")
+
+LATEST_SQL = f"""
+    SELECT {select_list(Contract, "ct")},
+           u.color_count, u.bw_count, u.timestamp
+    FROM contracts ct
+    LEFT JOIN usage u ON u.id = (
+        SELECT id FROM usage WHERE device_id = ct.device_id ORDER BY id DESC LIMIT 1
+    )
+    WHERE ct.device_id IN (SELECT value FROM json_each(?))
+"""
+
+
+class ReadingError(ValueError):
+    pass
+
+
+def parse_csv(text):
+    """CSV 第一列為欄名：device_id, curr_color(color), curr_bw(bw), timestamp"""
+    return [{k.strip(): (v or "").strip() for k, v in row.items() if k}
+            for row in csv.DictReader(io.StringIO(text.lstrip("\ufeff")))]
+
+
+def parse_json(text):
+    """接受陣列，或 {"readings": [...]}"""
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("readings")
+    if not isinstance(data, list):
+        raise ReadingError("JSON 必須是陣列或 {\"readings\": [...]}")
+    return data
+
+
+def _pick(raw, keys, name):
+    for key in keys:
+        if raw.get(key) not in (None, ""):
+            value = raw[key]
+            break
+    else:
+        raise ReadingError(f"缺少 {name}")
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ReadingError(f"{name} 必須是整數：{value!r}") from None
+    if number < 0:
+        raise ReadingError(f"{name} 不可為負數")
+    return number
+
+
+def _timestamp(value, now):
+    if value in (None, ""):
+        return now
+    for fmt in INPUT_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), fmt).strftime(TIMESTAMP_FORMAT)
+        except ValueError:
+            pass
+    raise ReadingError(f"無法辨識的抄表時間：{value!r}")
+
+
+def normalize(raw, now):
+    """單筆輸入轉成 (device_id, color, bw, timestamp)"""
+    if not isinstance(raw, dict):
+        raise ReadingError("每筆資料必須是物件")
+    device_id = str(raw.get("device_id") or "").strip()
+    if not device_id:
+        raise ReadingError("缺少 device_id")
+    return (device_id, _pick(raw, COLOR_KEYS, "彩色張數"), _pick(raw, BW_KEYS, "黑白張數"),
+            _timestamp(raw.get("timestamp"), now))
+
+
+def load_latest(conn, device_ids):
+    """一次查出多台設備的契約與最後抄表：{device_id: (contract, last_color, last_bw, last_time)}"""
+    n = len(CONTRACT_COLUMNS)
+    latest = {}
+    for row in conn.execute(LATEST_SQL, (json.dumps(sorted(device_ids)),)):
+        contract = Contract(*row[:n])
+        color, bw, timestamp = row[n:]
+        latest[contract.device_id] = (contract, color or 0, bw or 0, timestamp or "")
+    return latest
+
+
+def submit_readings(conn, rows, dry_run=False):
+    """驗證 + 計費 + 寫入 usage 與 bills（合格的筆數在同一個交易內）
+
+    同一設備的多筆依抄表時間先後處理，回傳結果仍依輸入順序，row 為輸入的第幾筆（從 1 起算）。
+    """
+    t0 = time.perf_counter()
+    now = datetime.now().strftime(TIMESTAMP_FORMAT)
+
+    parsed, results = [], [None] * len(rows)
+    for i, raw in enumerate(rows):
+        try:
+            parsed.append((i, normalize(raw, now)))
+        except ReadingError as e:
+            device_id = str(raw.get("device_id") or "") if isinstance(raw, dict) else ""
+            results[i] = {"row": i + 1, "device_id": device_id, "error": str(e)}
+
+    latest = load_latest(conn, {p[0] for _, p in parsed})
+    inserts, bills = [], []
+    for i, (device_id, color, bw, timestamp) in sorted(parsed, key=lambda p: (p[1][3], p[0])):
+        entry = {"row": i + 1, "device_id": device_id, "timestamp": timestamp}
+        results[i] = entry
+        state = latest.get(device_id)
+        if state is None:
+            entry["error"] = f"找不到設備 {device_id}"
+            continue
+        contract, last_color, last_bw, last_time = state
+        if last_time and timestamp <= last_time:
+            entry["error"] = f"抄表時間不晚於上次抄表（{last_time}）"
+        elif color < last_color or bw < last_bw:
+            entry["error"] = f"讀數小於上次抄表（彩色 {last_color} / 黑白 {last_bw}）"
+        else:
+            entry["result"] = calculate(contract, color, bw, last_color, last_bw)
+            latest[device_id] = (contract, color, bw, timestamp)
+            month = timestamp[:4] + timestamp[5:7]
+            inserts.append((device_id, month, color, bw, timestamp))
+            bills.append(billing.bill_row(device_id, month, entry["result"]))
+
+    if inserts and not dry_run:
+        with conn:  # 單一交易
+            conn.executemany(
+                "INSERT INTO usage (device_id, month, color_count, bw_count, timestamp) VALUES (?, ?, ?, ?, ?)",
+                inserts)
+            conn.executemany(billing.UPSERT_BILL_SQL, bills)
+
+    elapsed = time.perf_counter() - t0
+    return {
+        "accepted": len(inserts),
+        "rejected": len(rows) - len(inserts),
+        "elapsed_s": elapsed,
+        "rows_per_sec": len(rows) / elapsed if elapsed > 0 else 0.0,
+        "results": results,
+    }
+
+
+def read_file(path):
+    """依副檔名讀入 CSV 或 JSON；path 為 "-" 時讀 stdin（視為 CSV）"""
+    text = sys.stdin.read() if path == "-" else open(path, encoding="utf-8-sig").read()
+    return parse_json(text) if path.lower().endswith(".json") else parse_csv(text)
+
+
+def main(argv=None):
+    import app
+    import db
+
+    parser = argparse.ArgumentParser(description="整批上傳抄表（CSV / JSON）")
+    parser.add_argument("file", help="CSV 或 .json 檔；- 代表 stdin（CSV）")
+    parser.add_argument("--db", help="資料庫檔案（預設 billing.db）")
+    parser.add_argument("--dry-run", action="store_true", help="只驗證與計費，不寫入")
+    args = parser.parse_args(argv)
+    if args.db:
+        db.DB_FILE = args.db
+
+    rows = read_file(args.file)
+    with app.app.app_context():
+        app.init_db()
+        summary = submit_readings(db.get_db(), rows, dry_run=args.dry_run)
+
+    for entry in summary["results"]:
+        if "error" in entry:
+            print(f"❌ 第 {entry['row']} 筆 {entry['device_id']}：{entry['error']}")
+    verb = "可寫入" if args.dry_run else "已寫入"
+    print(f"✅ {verb} {summary['accepted']} 筆，退回 {summary['rejected']} 筆，"
+          f"耗時 {summary['elapsed_s']:.3f} 秒（{summary['rows_per_sec']:,.0f} rows/s）")
+    return 1 if summary["rejected"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
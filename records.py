@@ -0,0 +1,69 @@
+# records.py — 契約 / 客戶 / 抄表的型別化資料列（slots dataclass）與依位置建構的 row factory
+#
+# SELECT 一律依 *_COLUMNS 的順序列出欄位（不用 SELECT *），資料庫實體欄位順序不同（例如舊版 import.py
+# 把 contra 放在第 3 欄）也能正確對應；查詢結果直接以位置建構 record，不必每次 zip 成 dict。
+# 快取裡的同一份 record 會直接交給呼叫端（不複製），所以不可修改；要改用 dataclasses.replace() 產生新的。
+# （不用 frozen：frozen dataclass 的 __init__ 逐欄 object.__setattr__，建構比 dict 還慢）
+from dataclasses import dataclass, fields
+
+
+@dataclass(slots=True)
+class Contract:
+    device_id: str
+    monthly_rent: float = 0
+    color_unit_price: float = 0
+    bw_unit_price: float = 0
+    color_giveaway: int = 0
+    bw_giveaway: int = 0
+    color_error_rate: float = 0
+    bw_error_rate: float = 0
+    color_basic: int = 0
+    bw_basic: int = 0
+    tax_type: str = "含稅"
+    contra: str = ""
+
+
+@dataclass(slots=True)
+class Customer:
+    device_id: str
+    customer_name: str = None
+    device_number: str = None
+    machine_model: str = None
+    tax_id: str = None
+    install_address: str = None
+    service_person: str = None
+    contract_number: str = None
+    contract_start: str = None
+    contract_end: str = None
+
+
+@dataclass(slots=True)
+class Reading:
+    device_id: str
+    month: str
+    color_count: int
+    bw_count: int
+    timestamp: str
+
+
+def columns(cls):
+    return tuple(f.name for f in fields(cls))
+
+
+CONTRACT_COLUMNS = columns(Contract)
+CUSTOMER_COLUMNS = columns(Customer)
+READING_COLUMNS = columns(Reading)
+
+
+def select_list(cls, alias=None):
+    """SELECT 的欄位清單（依 record 欄位順序），alias 為資料表別名"""
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(prefix + name for name in columns(cls))
+
+
+def row_factory(cls):
+    """cursor.row_factory：依 SELECT 的位置直接建構 record"""
+    def factory(_cursor, row):
+        return cls(*row)
+    return factory
+
@@ -0,0 +1,210 @@
+# reports.py — 月報彙總表：每月 × (全部 / 服務人員 / 機型) 的張數與營收，以 trigger 即時累加
+#
+#   python reports.py rebuild     # 由 usage + bills + group_bills 全部重算
+#   python reports.py check       # 與全量重算比對，不一致時 exit 1
+#
+# 抄表寫入 usage 時累加 readings；帳單寫入 / 重算 bills、group_bills 時加上新值、扣掉舊值。
+# 群組帳單以第一台成員設備歸屬服務人員 / 機型，devices 算群組的成員數。
+# 服務人員 / 機型以寫入當下的 customers 為準；事後改了客戶資料，跑一次 rebuild 即可重新歸屬。
+import argparse
+import sys
+from datetime import datetime
+
+import db
+
+DIMENSIONS = ("all", "service_person", "machine_model")
+MEASURES = ("readings", "devices", "used_color", "used_bw", "bill_color", "bill_bw", "untaxed", "tax", "total")
+BILL_MEASURES = MEASURES[2:]  # 與 bills 同名的欄位
+
+TABLE_SQL = f"""
+    CREATE TABLE IF NOT EXISTS report_monthly (
+        month TEXT NOT NULL,
+        dimension TEXT NOT NULL,  -- all / service_person / machine_model
+        key TEXT NOT NULL,        -- all 時為空字串
+        {", ".join(f"{m} INTEGER NOT NULL DEFAULT 0" for m in MEASURES)},
+        PRIMARY KEY (month, dimension, key)
+    ) WITHOUT ROWID;
+"""
+
+
+# 群組帳單歸屬的設備：成員中設備編號最小的一台
+GROUP_DEVICE_SQL = "(SELECT MIN(device_id) FROM contract_group_members WHERE group_id = {}.group_id)"
+
+
+def _keys(device):
+    """某設備在三個維度下的 key（device 為設備編號的 SQL 運算式，例如 NEW.device_id）"""
+    return " UNION ALL ".join(
+        ["SELECT 'all' AS dimension, '' AS key"]
+        + [f"SELECT '{dim}', COALESCE((SELECT {dim} FROM customers WHERE device_id = {device}), '')"
+           for dim in DIMENSIONS[1:]])
+
+
+def _add(row, values, device=None):
+    """把 values（measure -> SQL 運算式）累加到 row 所屬的三列"""
+    cols = ", ".join(values)
+    return f"""
+        INSERT INTO report_monthly (month, dimension, key, {cols})
+        SELECT COALESCE({row}.month, ''), d.dimension, d.key, {", ".join(values.values())}
+        FROM ({_keys(device or f"{row}.device_id")}) d WHERE true
+        ON CONFLICT(month, dimension, key) DO UPDATE SET
+            {", ".join(f"{m} = {m} + excluded.{m}" for m in values)};"""
+
+
+def _bill(row, sign, devices=None):
+    return dict({"devices": devices or str(sign)}, **{m: f"{sign} * COALESCE({row}.{m}, 0)" for m in BILL_MEASURES})
+
+
+def _group_bill(row, sign):
+    return _add(row, _bill(row, sign, f"{sign} * COALESCE({row}.devices, 0)"), GROUP_DEVICE_SQL.format(row))
+
+
+TRIGGERS_SQL = f"""
+    CREATE TRIGGER IF NOT EXISTS report_usage_i AFTER INSERT ON usage BEGIN
+        {_add("NEW", {"readings": "1"})}
+    END;
+    CREATE TRIGGER IF NOT EXISTS report_usage_d AFTER DELETE ON usage BEGIN
+        {_add("OLD", {"readings": "-1"})}
+    END;
+    CREATE TRIGGER IF NOT EXISTS report_bills_i AFTER INSERT ON bills BEGIN
+        {_add("NEW", _bill("NEW", 1))}
+    END;
+    CREATE TRIGGER IF NOT EXISTS report_bills_u AFTER UPDATE ON bills BEGIN
+        {_add("OLD", _bill("OLD", -1))}
+        {_add("NEW", _bill("NEW", 1))}
+    END;
+    CREATE TRIGGER IF NOT EXISTS report_bills_d AFTER DELETE ON bills BEGIN
+        {_add("OLD", _bill("OLD", -1))}
+    END;
+"""
+
+REPORTS_SQL = TABLE_SQL + TRIGGERS_SQL
+
+GROUP_TRIGGERS_SQL = f"""
+    CREATE TRIGGER IF NOT EXISTS report_group_bills_i AFTER INSERT ON group_bills BEGIN
+        {_group_bill("NEW", 1)}
+    END;
+    CREATE TRIGGER IF NOT EXISTS report_group_bills_u AFTER UPDATE ON group_bills BEGIN
+        {_group_bill("OLD", -1)}
+        {_group_bill("NEW", 1)}
+    END;
+    CREATE TRIGGER IF NOT EXISTS report_group_bills_d AFTER DELETE ON group_bills BEGIN
+        {_group_bill("OLD", -1)}
+    END;
+"""
+
+KEY_EXPR = {"all": "''", "service_person": "COALESCE(service_person, '')",
+            "machine_model": "COALESCE(machine_model, '')"}
+
+# 全量重算：與 trigger 累加的結果應完全相同
+FULL_SQL = f"""
+    WITH src AS (
+        SELECT COALESCE(u.month, '') AS month, c.service_person, c.machine_model, 1 AS readings, 0 AS devices,
+               {", ".join(f"0 AS {m}" for m in BILL_MEASURES)}
+        FROM usage u LEFT JOIN customers c ON c.device_id = u.device_id
+        UNION ALL
+        SELECT COALESCE(b.month, ''), c.service_person, c.machine_model, 0, 1,
+               {", ".join(f"COALESCE(b.{m}, 0)" for m in BILL_MEASURES)}
+        FROM bills b LEFT JOIN customers c ON c.device_id = b.device_id
+        UNION ALL
+        SELECT COALESCE(g.month, ''), c.service_person, c.machine_model, 0, COALESCE(g.devices, 0),
+               {", ".join(f"COALESCE(g.{m}, 0)" for m in BILL_MEASURES)}
+        FROM group_bills g LEFT JOIN customers c ON c.device_id = {GROUP_DEVICE_SQL.format("g")}
+    )
+    {" UNION ALL ".join(
+        f"SELECT month, '{dim}' AS dimension, {KEY_EXPR[dim]} AS key, "
+        + ", ".join(f"SUM({m}) AS {m}" for m in MEASURES) + " FROM src GROUP BY 1, 3"
+        for dim in DIMENSIONS)}
+"""
+
+_NONZERO = " OR ".join(f"{m} != 0" for m in MEASURES)
+
+
+def init_db(conn=None):
+    """建表與 trigger 由 migrations 負責（第一次建立時由現有資料重算）"""
+    import migrations
+
+    migrations.migrate(conn or db.get_db())
+
+
+def fill(conn):
+    """清空後由 usage + bills + group_bills 全量重算（不 commit，供 migration 在同一交易內使用）"""
+    conn.execute("DELETE FROM report_monthly")
+    conn.execute(f"INSERT INTO report_monthly (month, dimension, key, {', '.join(MEASURES)}) "
+                 f"SELECT month, dimension, key, {', '.join(MEASURES)} FROM ({FULL_SQL})")
+
+
+def rebuild(conn=None):
+    """清空後由 usage + bills + group_bills 全量重算，回傳列數"""
+    conn = conn or db.get_db()
+    with conn:
+        fill(conn)
+    return conn.execute("SELECT COUNT(*) FROM report_monthly").fetchone()[0]
+
+
+def check(conn=None):
+    """與全量重算比對，回傳不一致的列：[(month, dimension, key, 彙總表的值, 重算的值)]"""
+    conn = conn or db.get_db()
+    cols = ", ".join(MEASURES)
+    stored = {row[:3]: row[3:] for row in conn.execute(
+        f"SELECT month, dimension, key, {cols} FROM report_monthly WHERE {_NONZERO}")}
+    full = {row[:3]: row[3:] for row in conn.execute(
+        f"SELECT month, dimension, key, {cols} FROM ({FULL_SQL}) WHERE {_NONZERO}")}
+    zero = (0,) * len(MEASURES)
+    return [(*k, stored.get(k, zero), full.get(k, zero))
+            for k in sorted(stored.keys() | full.keys()) if stored.get(k) != full.get(k)]
+
+
+def is_month(value):
+    """YYYYMM 格式的月份（dashboard 查詢與背景工作參數共用的檢查）"""
+    return isinstance(value, str) and len(value) == 6 and value.isdigit() and 1 <= int(value[4:]) <= 12
+
+
+def previous_month(month):
+    year, mon = int(month[:4]), int(month[4:6])
+    return f"{year - 1}12" if mon == 1 else f"{year}{mon - 1:02d}"
+
+
+def dashboard(month=None, conn=None):
+    """本月 vs 上月：每個維度各一份 {key: {measure: {this, last, diff}}}，只讀彙總表（依主鍵查）"""
+    conn = conn or db.get_db()
+    month = month or datetime.now().strftime("%Y%m")
+    last = previous_month(month)
+    rows = {}
+    for m, dim, key, *values in conn.execute(
+            f"SELECT month, dimension, key, {', '.join(MEASURES)} FROM report_monthly WHERE month IN (?, ?)",
+            (month, last)):
+        rows.setdefault(dim, {}).setdefault(key, {})[m] = dict(zip(MEASURES, values))
+
+    def compare(by_month):
+        this, prev = by_month.get(month, {}), by_month.get(last, {})
+        return {m: {"this": this.get(m, 0), "last": prev.get(m, 0), "diff": this.get(m, 0) - prev.get(m, 0)}
+                for m in MEASURES}
+
+    report = {"month": month, "last_month": last}
+    report["totals"] = compare(rows.get("all", {}).get("", {}))
+    for dim in DIMENSIONS[1:]:
+        report[dim] = {key: compare(by_month) for key, by_month in sorted(rows.get(dim, {}).items())}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="月報彙總表")
+    parser.add_argument("command", choices=("rebuild", "check"))
+    parser.add_argument("--db", default=db.DB_FILE, help="資料庫檔案")
+    args = parser.parse_args(argv)
+
+    db.DB_FILE = args.db
+    conn = db.get_db()
+    init_db(conn)
+    if args.command == "rebuild":
+        print(f"✅ 已重算 {rebuild(conn)} 列")
+        return 0
+    diffs = check(conn)
+    for month, dim, key, stored, full in diffs:
+        print(f"❌ {month} {dim} {key or '-'}：彙總 {stored} ≠ 重算 {full}")
+    print("✅ 彙總表與全量重算一致" if not diffs else f"共 {len(diffs)} 列不一致")
+    return 1 if diffs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+# statements.py — 月結對帳單：每個客戶一份 PDF + 一本彙總 Excel（資料來自 bills / group_bills + customers）
+#
+#   python statements.py --month 202510 --out statements/ -j 4
+#   python statements.py --month 202510 --no-pdf          # 只產生 Excel
+#
+# 帳單依客戶（統編，沒有統編用客戶名稱）排序後逐批讀出：Excel 以 write_only 邊讀邊寫，
+# PDF 每 CUSTOMERS_PER_TASK 個客戶交給行程池產生，同時在途的批次有上限，記憶體用量與客戶數無關。
+import argparse
+import importlib.util
+import os
+import re
+import sys
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from itertools import groupby
+
+import db
+import xlsx_stream
+
+CUSTOMERS_PER_TASK = 50
+FONT = "MSung-Light"  # reportlab 內建的繁中 CID 字型
+UNSAFE_CHARS = re.compile(r'[\\/:*?"<>|\s]+')  # 檔名不可用的字元
+
+STATEMENT_COLUMNS = (
+    "customer_key", "customer_name", "tax_id", "install_address", "service_person",
+    "device_id", "machine_model", "used_color", "used_bw", "bill_color", "bill_bw",
+    "color_amount", "bw_amount", "monthly_rent", "untaxed", "tax", "total"
+)
+
+# 群組帳單（group_bills）歸在第一台成員設備的客戶下，設備編號欄放群組代號
+STATEMENT_SQL = """
+    SELECT COALESCE(NULLIF(c.tax_id, ''), NULLIF(c.customer_name, ''), b.device_id) AS customer_key,
+           c.customer_name, c.tax_id, c.install_address, c.service_person,
+           b.device_id AS device_id, c.machine_model, b.used_color, b.used_bw, b.bill_color, b.bill_bw,
+           b.color_amount, b.bw_amount, b.monthly_rent, b.untaxed, b.tax, b.total
+    FROM bills b
+    LEFT JOIN customers c ON c.device_id = b.device_id
+    WHERE b.month = :month
+    UNION ALL
+    SELECT COALESCE(NULLIF(c.tax_id, ''), NULLIF(c.customer_name, ''), g.group_id),
+           c.customer_name, c.tax_id, c.install_address, c.service_person,
+           g.group_id, '合併計費（' || g.devices || ' 台）', g.used_color, g.used_bw, g.bill_color, g.bill_bw,
+           g.color_amount, g.bw_amount, g.monthly_rent, g.untaxed, g.tax, g.total
+    FROM group_bills g
+    LEFT JOIN customers c ON c.device_id = (
+        SELECT MIN(device_id) FROM contract_group_members WHERE group_id = g.group_id)
+    WHERE g.month = :month
+    ORDER BY customer_key, device_id
+"""
+
+EXCEL_HEADER = ("客戶", "客戶名稱", "統編", "裝機地址", "服務人員", "設備編號", "機型",
+                "彩色使用", "黑白使用", "彩色計費", "黑白計費", "彩色金額", "黑白金額",
+                "月租金", "未稅", "稅額", "含稅總額")
+
+PDF_COLUMNS = (("設備編號", "device_id"), ("機型", "machine_model"), ("彩色計費", "bill_color"),
+               ("黑白計費", "bill_bw"), ("月租金", "monthly_rent"), ("未稅", "untaxed"),
+               ("稅額", "tax"), ("含稅總額", "total"))
+
+_font_ready = False
+
+
+def _filename(month, key):
+    return f"{month}_{UNSAFE_CHARS.sub('_', str(key))}.pdf"
+
+
+def render_pdf(path, month, customer):
+    """單一客戶的對帳單（customer 為 STATEMENT_COLUMNS 的 dict 列表，同一客戶）"""
+    global _font_ready
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+    from reportlab.pdfgen import canvas
+
+    if not _font_ready:
+        pdfmetrics.registerFont(UnicodeCIDFont(FONT))
+        _font_ready = True
+
+    first = customer[0]
+    width, height = A4
+    pdf = canvas.Canvas(path, pagesize=A4)
+
+    def header():
+        pdf.setFont(FONT, 16)
+        pdf.drawString(40, height - 50, f"{month[:4]} 年 {month[4:]} 月 影印機租賃對帳單")
+        pdf.setFont(FONT, 10)
+        pdf.drawString(40, height - 72, f"客戶：{first['customer_name'] or first['customer_key']}"
+                                        f"　統編：{first['tax_id'] or '-'}")
+        pdf.drawString(40, height - 86, f"地址：{first['install_address'] or '-'}")
+        for i, (title, _) in enumerate(PDF_COLUMNS):
+            pdf.drawString(40 + i * 65, height - 112, title)
+        return height - 128
+
+    y = header()
+    for row in customer:
+        if y < 80:
+            pdf.showPage()
+            y = header()
+        for i, (_, key) in enumerate(PDF_COLUMNS):
+            value = row[key]
+            pdf.drawString(40 + i * 65, y, "" if value is None else f"{value:,}" if i >= 2 else str(value))
+        y -= 14
+
+    totals = {key: sum(row[key] or 0 for row in customer) for key in ("untaxed", "tax", "total")}
+    pdf.setFont(FONT, 12)
+    pdf.drawString(40, max(y - 20, 40), f"合計：未稅 {totals['untaxed']:,}　稅額 {totals['tax']:,}"
+                                        f"　含稅總額 {totals['total']:,}")
+    pdf.save()
+
+
+def count_customers(conn, month):
+    """month 的對帳單份數（客戶數），與 generate() 回報進度的單位相同"""
+    return conn.execute(f"SELECT COUNT(DISTINCT customer_key) FROM ({STATEMENT_SQL})", {"month": month}).fetchone()[0]
+
+
+def render_batch(out_dir, month, customers):
+    """行程池工作：產生一批客戶的 PDF，回傳份數"""
+    for customer in customers:
+        render_pdf(os.path.join(out_dir, _filename(month, customer[0]["customer_key"])), month, customer)
+    return len(customers)
+
+
+def generate(month, out_dir, workers=None, pdf=True, excel=True, conn=None, progress=None):
+    """產生 month 的全部對帳單，回傳統計（含每秒份數）
+
+    progress(已讀出的客戶數) 每 CUSTOMERS_PER_TASK 個客戶回報一次，全部完成後再回報一次（總數見 count_customers）。
+    """
+    if pdf and importlib.util.find_spec("reportlab") is None:
+        raise RuntimeError("產生 PDF 需要 reportlab（pip install reportlab），或改用 --no-pdf")
+    conn = conn or db.get_db()
+    os.makedirs(out_dir, exist_ok=True)
+    t0 = time.perf_counter()
+    stats = {"customers": 0, "devices": 0, "pdf": 0}
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        limit = 2 * workers  # 同時在途的批次上限
+        pending = set()
+
+        def collect(block):
+            nonlocal pending
+            done, pending = wait(pending, return_when=FIRST_COMPLETED if block else ALL_COMPLETED)
+            for future in done:
+                stats["pdf"] += future.result()
+
+        def submit(batch):
+            if len(pending) >= limit:
+                collect(True)
+            pending.add(pool.submit(render_batch, out_dir, month, batch))
+
+        def excel_rows():
+            yield EXCEL_HEADER
+            batch = []
+            cursor = conn.execute(STATEMENT_SQL, {"month": month})
+            rows = (dict(zip(STATEMENT_COLUMNS, row)) for row in cursor)
+            for _, items in groupby(rows, key=lambda row: row["customer_key"]):
+                customer = list(items)
+                stats["customers"] += 1
+                stats["devices"] += len(customer)
+                if progress and stats["customers"] % CUSTOMERS_PER_TASK == 0:
+                    progress(stats["customers"])
+                if pdf:
+                    batch.append(customer)
+                    if len(batch) >= CUSTOMERS_PER_TASK:
+                        submit(batch)
+                        batch = []
+                for row in customer:
+                    yield tuple(row[col] for col in STATEMENT_COLUMNS)
+            if batch:
+                submit(batch)
+
+        if excel:
+            xlsx_stream.write_rows(os.path.join(out_dir, f"{month}_對帳單彙總.xlsx"), excel_rows(), "對帳單")
+        else:
+            for _ in excel_rows():
+                pass
+        collect(False)
+    if progress:
+        progress(stats["customers"])
+
+    elapsed = time.perf_counter() - t0
+    stats["excel"] = 1 if excel else 0
+    stats["elapsed_s"] = elapsed
+    stats["docs_per_sec"] = (stats["pdf"] + stats["excel"]) / elapsed if elapsed > 0 else 0.0
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="產生月結對帳單（每客戶一份 PDF + 彙總 Excel）")
+    parser.add_argument("--month", help="帳單月份 YYYYMM（預設本月）")
+    parser.add_argument("--out", default="statements", help="輸出資料夾")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="PDF 行程數")
+    parser.add_argument("--db", default=db.DB_FILE, help="資料庫檔案")
+    parser.add_argument("--no-pdf", action="store_true", help="只產生 Excel")
+    parser.add_argument("--no-excel", action="store_true", help="只產生 PDF")
+    args = parser.parse_args(argv)
+
+    db.DB_FILE = args.db
+    month = args.month or datetime.now().strftime("%Y%m")
+    try:
+        stats = generate(month, args.out, args.workers, pdf=not args.no_pdf, excel=not args.no_excel)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ {month}：{stats['customers']} 個客戶 / {stats['devices']} 台設備，"
+          f"PDF {stats['pdf']} 份，耗時 {stats['elapsed_s']:.2f} 秒（{stats['docs_per_sec']:,.1f} 份/秒）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+# test_app.py — app.py 每個 request 最多只向連線池取一次連線（db.request_connection_count）
+#
+#   python -m pytest -q test_app.py
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import db
+import fleet
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_FILE", str(tmp_path / "billing.db"))
+    ids = fleet.build_db(db.DB_FILE, n_devices=3, n_months=2)
+    import app
+
+    app.app.config["TESTING"] = True
+    with app.app.test_client() as client:
+        client.device_id = ids[0]
+        yield client
+
+
+def _connections(response):
+    assert response.status_code < 300, response.get_data(as_text=True)
+    return int(response.headers["X-DB-Connections"])  # after_request 寫入的 request_connection_count()
+
+
+def test_calculate_uses_one_connection(client):
+    response = client.post("/", data={"mode": "calculate", "device_id": client.device_id,
+                                      "curr_color": "999999", "curr_bw": "999999"})
+    assert _connections(response) <= 1
+
+
+def test_query_uses_one_connection(client):
+    response = client.post("/", data={"mode": "query", "device_id": client.device_id})
+    assert _connections(response) <= 1
+
+
+def test_api_reading_uses_one_connection(client):
+    response = client.post(f"/api/v1/devices/{client.device_id}/readings",
+                           json={"curr_color": 999999, "curr_bw": 999999})
+    assert _connections(response) <= 1
+
+
+def test_legacy_db_is_migrated_on_first_request(tmp_path, monkeypatch):
+    """未經 init_db() 的舊版 billing.db（user_version 0），第一個 request 就會升級"""
+    monkeypatch.setattr(db, "DB_FILE", str(tmp_path / "billing.db"))
+    shutil.copy(os.path.join(os.path.dirname(__file__), "billing.db"), db.DB_FILE)
+    import app
+    import migrations
+
+    with app.app.test_client() as client:
+        assert client.get("/").status_code == 200
+        with app.app.app_context():
+            assert migrations.version(db.get_db()) == migrations.SCHEMA_VERSION
+
+
+@pytest.mark.parametrize("body", [
+    {"tax_type": ["x"]}, {"tax_type": "bogus"}, {"contra": 1}, {"bw_giveaway": 1.7},
+    {"monthly_rent": 10 ** 30}, {"bw_unit_price": -1}, {"color_error_rate": 2}, {"color_basic": "abc"},
+])
+def test_contract_patch_rejects_bad_values(client, body):
+    response = client.patch(f"/api/v1/contracts/{client.device_id}", json=body)
+    assert response.status_code == 400, response.get_data(as_text=True)
+
+
+def test_contract_patch_accepts_valid_values(client):
+    response = client.patch(f"/api/v1/contracts/{client.device_id}",
+                            json={"tax_type": "未稅", "bw_giveaway": 1500.0, "contra": "月租 2000"})
+    assert response.status_code == 200
+    assert response.json["contract"]["tax_type"] == "未稅"
+    assert response.json["contract"]["bw_giveaway"] == 1500
+
+
+@pytest.mark.parametrize("body", [{"curr_color": 1.7, "curr_bw": 1}, {"curr_color": 10 ** 30, "curr_bw": 1}])
+def test_reading_rejects_bad_counts(client, body):
+    assert client.post(f"/api/v1/devices/{client.device_id}/readings", json=body).status_code == 400
+
+
+@pytest.mark.parametrize("device_ids", [[["x"]], [{"a": 1}], [1], [""], ["x"] * 501])
+def test_devices_batch_rejects_bad_ids(client, device_ids):
+    assert client.post("/api/v1/devices/batch", json={"device_ids": device_ids}).status_code in (400, 413)
+
+
+def test_job_with_bad_month_is_rejected(client):
+    response = client.post("/api/v1/jobs", json={"kind": "billing_run", "params": {"month": "garbage"}})
+    assert response.status_code == 400
+    assert client.get("/api/v1/jobs").json["jobs"] == []
+
+
+def test_search_ranks_all_matches_before_limit(client):
+    """常見字（有限公司）命中很多筆時，最相關的一筆即使排在很後面也要回傳在最前面"""
+    conn = db.get_db()
+    with conn:
+        conn.executemany("INSERT INTO customers (device_id, customer_name, install_address) VALUES (?, ?, ?)",
+                         [(f"X{i:04d}", f"第{i}號測試用的很長很長很長的名稱有限公司", "某地") for i in range(600)])
+        conn.execute("INSERT INTO customers (device_id, customer_name) VALUES ('BEST', '有限公司')")
+    response = client.get("/api/v1/customers", query_string={"q": "有限公司", "limit": 5})
+    assert [c["device_id"] for c in response.json["customers"]][0] == "BEST"
+
+
+def test_batch_readings_count_in_calculate_metric(tmp_path):
+    """BILLING_METRICS=1 時整批上傳的逐筆計費也計入 billing_calculate_duration_seconds"""
+    db_file = str(tmp_path / "billing.db")
+    device_id = fleet.build_db(db_file, n_devices=1, n_months=1)[0]
+    code = ("import sqlite3, sys, metrics, readings; "
+            "rows = [{'device_id': sys.argv[2], 'curr_color': 999999, 'curr_bw': 999999}]; "
+            "assert readings.submit_readings(sqlite3.connect(sys.argv[1]), rows, dry_run=True)['accepted'] == 1; "
+            "assert metrics.calculate_seconds._series[()][2] == 1")
+    subprocess.run([sys.executable, "-c", code, db_file, device_id], cwd=os.path.dirname(os.path.abspath(__file__)),
+                   env={**os.environ, "BILLING_METRICS": "1"}, check=True)
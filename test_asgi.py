@@ -0,0 +1,52 @@
+# test_asgi.py — asgi.py 的兩種入口（ASGI application / aiohttp）都要正確處理中文查詢字串
+#
+#   python -m pytest -q test_asgi.py
+import asyncio
+import json
+from urllib.parse import quote
+
+import pytest
+
+import db
+import fleet
+
+QUERY = "q=" + quote("測試客戶")
+
+
+@pytest.fixture
+def asgi(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_FILE", str(tmp_path / "billing.db"))
+    fleet.build_db(db.DB_FILE, n_devices=3, n_months=1)
+    import asgi
+
+    return asgi
+
+
+def test_asgi_cjk_query(asgi):
+    scope = {"type": "http", "method": "GET", "path": "/api/v1/customers", "query_string": QUERY.encode(),
+             "headers": [], "server": ("testserver", 80), "client": ("127.0.0.1", 1234)}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi.application(scope, receive, send))
+    assert sent[0]["status"] == 200
+    body = json.loads(b"".join(m.get("body", b"") for m in sent[1:]))
+    assert body["customers"] and all("測試客戶" in c["customer_name"] for c in body["customers"])
+
+
+def test_aiohttp_cjk_query(asgi):
+    test_utils = pytest.importorskip("aiohttp.test_utils")
+
+    async def fetch():
+        async with test_utils.TestClient(test_utils.TestServer(asgi.aiohttp_app())) as client:
+            response = await client.get(f"/api/v1/customers?{QUERY}")
+            return response.status, await response.json()
+
+    status, body = asyncio.run(fetch())
+    assert status == 200
+    assert body["customers"] and all("測試客戶" in c["customer_name"] for c in body["customers"])
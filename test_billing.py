@@ -0,0 +1,60 @@
+# test_billing.py — calculate()（Decimal 精確版）與 calculate_batch()（向量化版）到分都要相同
+#
+#   python -m pytest -q test_billing.py
+import numpy as np
+import pandas as pd
+import pytest
+
+import billing
+import fleet
+from records import Contract
+
+
+def _batch(cases):
+    contracts = pd.DataFrame([c[0] for c in cases])
+    return billing.calculate_batch(contracts, *(np.array([c[k] for c in cases]) for k in range(1, 5)))
+
+
+def _assert_same(cases):
+    for (contract, *counts), (_, row) in zip(cases, _batch(cases).iterrows()):
+        expected = billing.calculate(contract, *counts)
+        assert {key: row[key] for key in billing.RESULT_KEYS} == expected, (contract, counts)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batch_matches_exact(seed):
+    _assert_same(fleet.random_cases(4000, seed))
+
+
+# .5 剛好落在四捨五入邊界：(contract 欄位, 本次彩色, 本次黑白, 預期的部分結果)，前次讀數皆為 0
+TIES = [
+    ({"color_unit_price": 0.005}, 1, 0, {"彩色金額": 0.01}),                     # 0.005 元 → 0.01
+    ({"bw_unit_price": 0.125}, 0, 3, {"黑白金額": 0.38}),                        # 0.375 元 → 0.38
+    ({"color_error_rate": 0.005}, 100, 0, {"彩色計費張數": 100}),                # 99.5 張 → 100
+    ({"bw_error_rate": 0.5}, 0, 3, {"黑白計費張數": 2}),                         # 1.5 張 → 2
+    ({"monthly_rent": 999.995}, 0, 0, {"月租金": 1000.0, "含稅總額": 1000}),     # 月租先到分
+    ({"monthly_rent": 10.5}, 0, 0, {"含稅總額": 11, "未稅小計": 10, "稅額": 1}),  # 含稅：10.5 → 11
+    ({"monthly_rent": 10, "tax_type": "未稅"}, 0, 0, {"稅額": 1, "含稅總額": 11}),  # 稅額 0.5 → 1
+]
+
+
+@pytest.mark.parametrize("fields, curr_color, curr_bw, expected", TIES)
+def test_half_up_ties(fields, curr_color, curr_bw, expected):
+    case = (Contract("T", **fields), curr_color, curr_bw, 0, 0)
+    result = billing.calculate(*case)
+    assert {key: result[key] for key in expected} == expected
+    _assert_same([case])
+
+
+def test_counters_running_backwards():
+    """本次讀數小於前次（換機、歸零）時使用張數為 0，有基本張數仍照基本張數計費"""
+    cases = [
+        (Contract("A", color_unit_price=3, bw_unit_price=0.3), 90, 900, 100, 1000),
+        (Contract("B", color_unit_price=3, bw_unit_price=0.3, color_basic=100, bw_basic=500), 0, 0, 5000, 5000),
+        (Contract("C", monthly_rent=2000, bw_unit_price=0.3, bw_giveaway=1500), 10, 0, 0, 10 ** 7),
+    ]
+    results = [billing.calculate(*case) for case in cases]
+    assert [(r["彩色使用張數"], r["黑白使用張數"]) for r in results] == [(0, 0), (0, 0), (10, 0)]
+    assert (results[1]["彩色計費張數"], results[1]["黑白計費張數"]) == (100, 500)
+    assert results[2]["含稅總額"] == 2000
+    _assert_same(cases)
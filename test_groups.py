@@ -0,0 +1,19 @@
+# test_groups.py — 群組月結重跑時 group_bills 覆蓋舊值，report_monthly 不重複累加
+#
+#   python -m pytest -q test_groups.py
+import db
+import fleet
+import groups
+import reports
+
+
+def test_run_month_twice_keeps_reports_consistent(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_FILE", str(tmp_path / "billing.db"))
+    ids = fleet.build_db(db.DB_FILE, n_devices=6, n_months=2)
+    conn = db.get_db()
+    groups.set_group(conn, "G1", {"color_unit_price": 3, "bw_unit_price": 0.3, "bw_giveaway": 600}, ids[:3])
+
+    for _ in range(2):
+        assert groups.run_month("202302", conn) == 1
+        assert reports.check(conn) == []
+    assert conn.execute("SELECT COUNT(*) FROM group_bills").fetchone()[0] == 1
@@ -0,0 +1,44 @@
+# test_import_slips.py — 憑單分批寫入的結果與一次寫入相同，重複匯入不會多寫抄表
+#
+#   python -m pytest -q test_import_slips.py
+import os
+import sqlite3
+
+import pytest
+
+import fleet
+import import_slips
+import reports
+
+SLIP_FILE = os.path.join(os.path.dirname(__file__), "設備資料.txt")
+
+
+def _dump(db_file):
+    conn = sqlite3.connect(db_file)
+    try:
+        return {table: conn.execute(f"SELECT * FROM {table} ORDER BY 1, 2").fetchall()
+                for table in ("customers", "contracts", "usage")}
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("batch_size", [7, import_slips.BATCH_SIZE])
+def test_batches_match_and_rerun_is_noop(tmp_path, monkeypatch, batch_size):
+    expected_file, db_file = str(tmp_path / "expected.db"), str(tmp_path / "billing.db")
+    for path in (expected_file, db_file):
+        fleet.build_db(path, n_devices=3, n_months=2)
+    import_slips.import_slips(SLIP_FILE, db_file=expected_file)
+
+    monkeypatch.setattr(import_slips, "BATCH_SIZE", batch_size)
+    first = import_slips.import_slips(SLIP_FILE, db_file=db_file)
+    assert first["inserted_usage"] == first["readings"]
+    assert _dump(db_file) == _dump(expected_file)
+
+    again = import_slips.import_slips(SLIP_FILE, db_file=db_file)
+    assert again["inserted_usage"] == 0
+    assert _dump(db_file) == _dump(expected_file)
+    conn = sqlite3.connect(db_file)
+    try:
+        assert reports.check(conn) == []
+    finally:
+        conn.close()
@@ -0,0 +1,66 @@
+# test_jobs.py — worker 行程執行工作（對帳單工作會在 worker 裡再開行程池產生 PDF）
+#
+#   python -m pytest -q test_jobs.py
+import pytest
+
+import db
+import fleet
+import jobs
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_FILE", str(tmp_path / "billing.db"))
+    monkeypatch.setenv("BILLING_JOB_OUTPUT_DIR", str(tmp_path / "statements"))  # spawn 的 worker 讀環境變數
+    monkeypatch.setattr(jobs, "OUTPUT_DIR", str(tmp_path / "statements"))
+    fleet.build_db(db.DB_FILE, n_devices=6, n_months=2)
+    return db.get_db()
+
+
+def _run(conn, kind, params):
+    job_id = jobs.submit(kind, params)
+    jobs.run_workers(1, db.DB_FILE, once=True)
+    return jobs.get(job_id, conn)
+
+
+def test_billing_run_in_worker(queue):
+    job = _run(queue, "billing_run", {"month": "202302"})
+    assert job["status"] == "done", job["message"]
+    assert job["result"]["devices"] == 6
+
+
+def test_pdf_statements_in_worker(queue):
+    pytest.importorskip("reportlab")
+    _run(queue, "billing_run", {"month": "202302"})
+    job = _run(queue, "statements", {"month": "202302", "pdf": True})
+    assert job["status"] == "done", job["message"]
+    assert job["result"]["pdf"] == job["result"]["customers"]
+
+
+def test_statements_progress_reaches_total(queue):
+    """進度的分子分母都是客戶數（有群組帳單時也一樣），最後一次回報 = 總數"""
+    import billing
+    import groups
+
+    ids = fleet.device_ids(6)
+    groups.set_group(queue, "G1", {"bw_unit_price": 0.3}, ids[:2])
+    billing.run_month("202302", queue)
+    groups.run_month("202302", queue)
+
+    class Job:
+        conn = queue
+        calls = []
+
+        def progress(self, done, total=None, message=""):
+            self.calls.append((done, total))
+
+    job = Job()
+    result = jobs.HANDLERS["statements"](job, month="202302", pdf=False, excel=False)
+    assert job.calls[-1] == (result["customers"], result["customers"])
+
+
+@pytest.mark.parametrize("month", ["garbage", "202513", "2025-10", 202510])
+def test_submit_rejects_bad_month(queue, month):
+    with pytest.raises(jobs.JobParamError):
+        jobs.submit("billing_run", {"month": month})
+    assert jobs.recent(conn=queue) == []
@@ -0,0 +1,45 @@
+# test_migrations.py — 舊版資料庫（user_version 0）升級後契約內容不變
+#
+#   python -m pytest -q test_migrations.py
+import sqlite3
+
+import pytest
+
+import migrations
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / "billing.db")
+    yield conn
+    conn.close()
+
+
+def _tax_types(conn):
+    return dict(conn.execute("SELECT device_id, tax_type FROM contracts ORDER BY device_id"))
+
+
+def test_legacy_contracts_without_tax_type_stay_untaxed(conn):
+    """app2.py 時代的契約表沒有 tax_type：單價視為未稅，升級後不可變成預設的含稅"""
+    conn.execute("CREATE TABLE contracts (device_id TEXT PRIMARY KEY, monthly_rent REAL, color_unit_price REAL,"
+                 " bw_unit_price REAL, color_giveaway INTEGER, bw_giveaway INTEGER)")
+    conn.execute("INSERT INTO contracts VALUES ('OLD1', 2000, 3, 0.3, 0, 1500)")
+    conn.commit()
+
+    migrations.migrate(conn)
+    assert _tax_types(conn) == {"OLD1": "未稅"}
+    conn.execute("INSERT INTO contracts (device_id) VALUES ('NEW1')")
+    assert _tax_types(conn)["NEW1"] == "含稅"
+
+
+def test_empty_tax_type_is_backfilled_as_untaxed(conn):
+    """有 tax_type 欄但沒填值的舊資料也補成未稅；已填的不動（contra 在第 3 欄的舊順序一併重建）"""
+    conn.execute("CREATE TABLE contracts (device_id TEXT PRIMARY KEY, monthly_rent REAL, contra TEXT,"
+                 " tax_type TEXT)")
+    conn.executemany("INSERT INTO contracts VALUES (?, 1000, '', ?)",
+                     [("A", None), ("B", ""), ("C", "含稅"), ("D", "未稅")])
+    conn.commit()
+
+    migrations.migrate(conn)
+    assert _tax_types(conn) == {"A": "未稅", "B": "未稅", "C": "含稅", "D": "未稅"}
+    assert migrations._columns(conn, "contracts") == migrations.CONTRACT_COLUMNS
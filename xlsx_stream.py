@@ -0,0 +1,113 @@
+# xlsx_stream.py — 以 openpyxl read_only 逐批讀取 Excel，不把整本活頁簿載入記憶體
+from openpyxl import load_workbook
+
+# 與 pandas.read_excel 預設視為空值的字串相同
+NA_STRINGS = frozenset({
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a",
+    "nan", "null",
+})
+
+
+def _cell(v, as_str):
+    """單格轉換，結果與 pd.read_excel(...).fillna("") 相同"""
+    if v is None:
+        return ""
+    if type(v) is float and v.is_integer():
+        v = int(v)
+    elif type(v) is str and v in NA_STRINGS:
+        return ""
+    if as_str and type(v) is not str:
+        return str(v)
+    return v
+
+
+def sheet_names(path):
+    wb = load_workbook(path, read_only=True)
+    try:
+        return wb.sheetnames
+    finally:
+        wb.close()
+
+
+def sheet_row_count(path, sheet_name):
+    """工作表的資料列數（不含欄名），取自活頁簿記錄的範圍，不逐列讀取；沒有記錄範圍時回傳 None"""
+    wb = load_workbook(path, read_only=True)
+    try:
+        ws = wb[sheet_name]
+        return max(ws.max_row - 1, 0) if ws.max_row else None
+    finally:
+        wb.close()
+
+
+def iter_row_batches(path, sheet_name=None, batch_size=2000, as_str=False, skip_blank=True):
+    """逐批產生 list[list]
+
+    skip_blank=True 時整列空白的列會略過（同 pandas skip_blank_lines，匯入用）；
+    skip_blank=False 時同 pd.read_excel(header=None)：開頭與中間的空白列保留為 []，只去掉結尾的空白列。
+    as_str=True 時等同 dtype=str，否則等同 dtype=object。
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name] if sheet_name else wb.worksheets[0]
+        batch = []
+        blank = 0  # 還沒輸出的空白列數，後面有資料列才補上
+        for values in ws.iter_rows(values_only=True):
+            row = [_cell(v, as_str) for v in values]
+            while row and row[-1] == "":
+                row.pop()
+            if not row:
+                blank += 0 if skip_blank else 1
+                continue
+            batch.extend([] for _ in range(blank))
+            blank = 0
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        wb.close()
+
+
+def read_header(path, sheet_name):
+    """回傳第一個非空白列（欄名）"""
+    for batch in iter_row_batches(path, sheet_name, batch_size=1):
+        return [str(c) for c in batch[0]]
+    return []
+
+
+def iter_record_batches(path, sheet_name, batch_size=2000):
+    """第一列為欄名，之後每批回傳 (columns, rows)，rows 已補齊/截斷到欄名長度"""
+    columns = None
+    for batch in iter_row_batches(path, sheet_name, batch_size):
+        if columns is None:
+            columns = [str(c) for c in batch[0]]
+            batch = batch[1:]
+            if not batch:
+                continue
+        width = len(columns)
+        yield columns, [row[:width] + [""] * (width - len(row)) for row in batch]
+
+
+def write_rows(path, rows, sheet_title="Sheet1"):
+    """以 write_only 模式逐列寫出 xlsx（記憶體用量與列數無關）"""
+    return write_sheets(path, [(sheet_title, rows)])[sheet_title]
+
+
+def write_sheets(path, sheets):
+    """多個工作表依序逐列寫出：sheets 為 [(工作表名稱, rows)]，回傳 {名稱: 列數}"""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    counts = {}
+    for title, rows in sheets:
+        ws = wb.create_sheet(title)
+        count = 0
+        for row in rows:
+            ws.append([v if v != "" else None for v in row])
+            count += 1
+        counts[title] = count
+    wb.save(path)
+    return counts